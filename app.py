@@ -2,7 +2,11 @@ import streamlit as st
 import rpyc
 import json
 import time
-from streamlit_autorefresh import st_autorefresh
+from shared_state import SharedGameConnection
+
+DEFAULT_ROOM_ID = "principal" # mesma sala padrão do servidor (rooms.DEFAULT_ROOM_ID)
+SERVER_HOST = "localhost"
+SERVER_PORT = 18861
 
 # Configuração da página do Streamlit
 st.set_page_config(layout="wide", page_title="Aventura Cooperativa")
@@ -11,37 +15,74 @@ st.set_page_config(layout="wide", page_title="Aventura Cooperativa")
 class ClientHandshakeService(rpyc.Service):
     """
     Serviço RPyC mínimo que o cliente Streamlit expõe ao servidor.
-    Sua única função real é responder ao 'exposed_get_username'
-    para que o servidor possa registrar o jogador.
+    Sua única função real é responder ao 'exposed_get_username' e ao
+    'exposed_get_room_id' para que o servidor possa registrar o jogador,
+    já na sala escolhida no login.
+
+    Não expõe os callbacks de push: as atualizações chegam uma única vez
+    pela conexão compartilhada (get_shared_connection), não por aba.
     """
-    def __init__(self, username):
+    def __init__(self, username, room_id=None):
         self._username = username
+        self._room_id = room_id
 
     def exposed_get_username(self):
         """O servidor chama isso imediatamente após a conexão."""
         return self._username
 
-    def exposed_on_page_update(self, page_id, page_json):
-        """Ignorado, pois estamos usando polling (st_autorefresh)"""
-        pass
+    def exposed_get_room_id(self):
+        """Sala inicial do jogador, também pedida na conexão (None = sala padrão)."""
+        return self._room_id
+
+# --- Estado compartilhado entre todas as sessões ---
+
+@st.cache_resource(validate=lambda shared: not shared.closed)
+def get_shared_connection():
+    """
+    Conexão única do processo que observa as salas e mantém o cache do estado
+    delas (alimentado pelos push). As sessões leem desse cache em vez de
+    fazer polling no servidor; se a conexão cair, uma nova é criada.
+    """
+    return SharedGameConnection(SERVER_HOST, SERVER_PORT)
 
-    def exposed_on_chat_update(self, messages_json):
-        """Ignorado, pois estamos usando polling"""
-        pass
+@st.cache_data(max_entries=64, show_spinner=False)
+def get_scene_image(page_id):
+    """
+    Imagem da cena já reduzida pelo servidor, compartilhada por todas as
+    sessões. Levanta LookupError (que o cache_data não guarda) se o servidor
+    não tem a imagem, para tentar de novo na próxima vez.
+    """
+    data = get_shared_connection().page_image(page_id)
+    if data is None:
+        raise LookupError(page_id)
+    return data
 
-    def exposed_on_vote_update(self, votes_json):
-        """Ignorado, pois estamos usando polling"""
-        pass
+def get_room_cache():
+    return get_shared_connection().room(st.session_state.room_id)
+
+def run_commands(*commands):
+    """
+    Executa os comandos do jogador numa única ida e volta (execute_batch): o
+    estado resultante já volta na resposta e vai para o cache compartilhado,
+    então a tela mostra o resultado sem esperar o push. Retorna o
+    (sucesso, mensagem) do último comando executado.
+    """
+    results = get_shared_connection().execute_batch(
+        st.session_state.game_service, st.session_state.username, commands, st.session_state.room_id)
+    return results[-1]
+
+@st.fragment(run_every=0.5)
+def watch_for_updates(cache, seen_revision):
+    """Roda sozinho a cada meio segundo, sem RPC: só recarrega a página se o cache mudou."""
+    if cache.view.revision != seen_revision:
+        st.rerun()
 
 # --- Funções de Callback dos Botões (Handlers) ---
 
 def handle_vote(choice_index):
     """Chamado quando um botão de voto (escolha) é clicado."""
     try:
-        username = st.session_state.username
-        game_service = st.session_state.game_service
-        
-        success, msg = game_service.exposed_vote(username, choice_index)
+        success, msg = run_commands(("vote", choice_index))
         
         if success:
             st.toast("Voto registrado!", icon="🗳️")
@@ -57,11 +98,12 @@ def handle_chat_send():
     message = st.session_state.chat_input_text
     if message: 
         try:
-            username = st.session_state.username
-            game_service = st.session_state.game_service
-            game_service.exposed_send_chat_message(username, message)
-            # Limpa a caixa de texto após o envio
-            st.session_state.chat_input_text = "" 
+            success, msg = run_commands(("chat", message))
+            if success:
+                # Limpa a caixa de texto após o envio
+                st.session_state.chat_input_text = ""
+            else:
+                st.toast(msg, icon="⚠️") # ex.: muitas mensagens seguidas
         except Exception as e:
             st.error(f"Erro ao enviar mensagem: {e}")
             handle_disconnect()
@@ -70,12 +112,8 @@ def handle_chat_send():
 def handle_advance_page():
     """Chamado quando o botão 'Tentar Avançar' é clicado."""
     try:
-        game_service = st.session_state.game_service
-        username = st.session_state.username # Pega o nome do usuário
-        
-        # Envia o 'username' para o servidor
         # O 'msg' de retorno será "Aguardando Winicius...", etc.
-        success, msg = game_service.exposed_check_and_advance_page(username)
+        success, msg = run_commands(("advance",))
         
         if success:
             st.toast("Avançando para a próxima página!", icon="🚀")
@@ -86,6 +124,41 @@ def handle_advance_page():
         st.error(f"Erro ao avançar a página: {e}")
         handle_disconnect()
 
+# --- HISTÓRICO DO CHAT ---
+def handle_load_older_chat():
+    """
+    Chamado pelo botão de histórico: busca a página de mensagens anterior à
+    mais antiga exibida. O histórico carregado fica só nesta sessão.
+    """
+    try:
+        game_service = st.session_state.game_service
+        before_seq = st.session_state.chat_older_first_seq or get_room_cache().view.chat_first_seq
+        page = json.loads(game_service.exposed_get_chat_page(before_seq, room_id=st.session_state.room_id))
+        if page["messages"]:
+            st.session_state.chat_older = page["messages"] + st.session_state.chat_older
+            st.session_state.chat_older_first_seq = page["first_seq"]
+        st.session_state.chat_has_more = page["has_more"]
+    except Exception as e:
+        st.error(f"Erro ao carregar o histórico: {e}")
+        handle_disconnect()
+
+def chat_with_history(view):
+    """Mensagens do cache da sala precedidas do histórico que esta sessão carregou."""
+    older = st.session_state.chat_older
+    if older:
+        older_end = st.session_state.chat_older_first_seq + len(older)
+        if view.chat_first_seq is None or older_end < view.chat_first_seq:
+            # O cache andou e deixou um buraco entre o histórico e o chat ao vivo: descarta o histórico
+            st.session_state.chat_older = older = []
+            st.session_state.chat_older_first_seq = None
+            st.session_state.chat_has_more = bool(view.chat_first_seq and view.chat_first_seq > 1)
+        else:
+            # Descarta a parte do histórico que o cache também tem
+            older = older[:max(len(older) - (older_end - view.chat_first_seq), 0)]
+    else:
+        st.session_state.chat_has_more = bool(view.chat_first_seq and view.chat_first_seq > 1)
+    return older + list(view.chat_messages)
+
 # --- FUNÇÃO DE DESCONECTAR ---
 def handle_disconnect():
     """
@@ -119,12 +192,21 @@ def run_app():
     # Garante que as chaves existam no início
     if 'username' not in st.session_state:
         st.session_state.username = None
+    if 'room_id' not in st.session_state:
+        st.session_state.room_id = DEFAULT_ROOM_ID
     if 'rpyc_conn' not in st.session_state:
         st.session_state.rpyc_conn = None
     if 'game_service' not in st.session_state:
         st.session_state.game_service = None
     if 'client_service' not in st.session_state:
         st.session_state.client_service = None
+    # O estado do jogo vem do cache compartilhado; a sessão só guarda a última
+    # revisão exibida e o histórico de chat que ela mesma carregou
+    if 'seen_revision' not in st.session_state:
+        st.session_state.seen_revision = 0
+        st.session_state.chat_older = []
+        st.session_state.chat_older_first_seq = None
+        st.session_state.chat_has_more = False
 
     # --- 2. Tela de Login ---
     # Se o usuário não estiver logado, mostra a tela de login.
@@ -139,10 +221,12 @@ def run_app():
         )
         
         username_input = st.text_input("Digite seu nome de usuário:", key="login_username")
+        room_input = st.text_input("Sala (será criada se não existir):", value=DEFAULT_ROOM_ID, key="login_room")
         
         if st.button("Entrar no Jogo ⚔️", key="login_button"):
             if username_input:
                 st.session_state.username = username_input 
+                st.session_state.room_id = room_input.strip() or DEFAULT_ROOM_ID
                 st.rerun() # Recarrega a página para ir para a tela de conexão
             else:
                 st.error("Por favor, digite um nome de usuário.")
@@ -153,19 +237,30 @@ def run_app():
     if st.session_state.rpyc_conn is None:
         username = st.session_state.username
         # Cria o serviço de handshake que o servidor chamará
-        st.session_state.client_service = ClientHandshakeService(username)
+        st.session_state.client_service = ClientHandshakeService(username, st.session_state.room_id)
         
         try:
             with st.spinner(f"Conectando ao servidor como {username}..."):
                 conn = rpyc.connect(
-                    "localhost", 
-                    18861, 
+                    SERVER_HOST, 
+                    SERVER_PORT, 
                     service=st.session_state.client_service
                 )
+                # Atende os pings de heartbeat do servidor enquanto a sessão está parada
+                rpyc.BgServingThread(conn)
                 
+                # A sala escolhida no login já foi no handshake; o join_room só garante que
+                # o servidor a aplicou antes dos RPCs seguintes (depois dele, não faz nada)
+                if st.session_state.room_id != DEFAULT_ROOM_ID:
+                    success, msg = conn.root.exposed_join_room(st.session_state.room_id)
+                    if not success:
+                        raise RuntimeError(msg)
+
                 # Armazena a conexão e o serviço principal no estado da sessão
                 st.session_state.rpyc_conn = conn
                 st.session_state.game_service = conn.root 
+                # A contagem de jogadores não vem por push: atualiza o cache compartilhado agora
+                get_shared_connection().request_sync()
                 st.success("Conectado com sucesso!")
                 time.sleep(1) 
                 st.rerun() # Recarrega para entrar no loop do jogo
@@ -179,26 +274,31 @@ def run_app():
 
     # --- 4. Loop Principal do Jogo (LAYOUT LADO A LADO) ---
     
-    # Atualiza a página a cada 3 segundos para buscar novos dados
-    st_autorefresh(interval=1500, limit=None, key="game_refresher")
-
     try:
-        # Pega os serviços do estado da sessão
-        game_service = st.session_state.game_service
         username = st.session_state.username
 
-        # --- Busca de Dados (Polling) ATÔMICO ---
-        current_page_id, page_json, chat_json, votes_json, current_players, total_players_ever = game_service.exposed_get_atomic_game_state()
+        # --- Leitura do cache compartilhado (sem RPC) ---
+        cache = get_room_cache()
+        view = cache.view
+        st.session_state.seen_revision = view.revision
+        # Recarrega a página quando o cache mudar (push do servidor)
+        watch_for_updates(cache, view.revision)
 
-        # --- Deserialização dos Dados ---
-        page_data = json.loads(page_json)
-        chat_messages = json.loads(chat_json) 
-        votes = json.loads(votes_json) 
+        current_page_id = view.page_id
+        page_data = view.page_data
+        chat_messages = chat_with_history(view)
+        votes = view.votes
+        vote_tally = view.vote_tally
+        current_players, total_players_ever = view.current_players, view.total_players_ever
 
         # --- Renderização da UI (SEM SIDEBAR) ---
         
-        st.caption(f"Logado como: **{username}** 👋")
-        st.caption(f"Jogadores conectados: **{current_players}** | Total na sessão (para avançar): **{total_players_ever}**")
+        st.caption(f"Logado como: **{username}** 👋 | Sala: **{st.session_state.room_id}**")
+        st.caption(f"Jogadores conectados (exigidos para avançar): **{current_players}** | Total na sessão: **{total_players_ever}**")
+        if view.round_deadline is not None:
+            phase, ends_at = view.round_deadline
+            action = "votar" if phase == "vote" else "clicar em Avançar"
+            st.caption(f"⏱️ Tempo para {action}: **{max(ends_at - time.monotonic(), 0):.0f}s** (depois a rodada é decidida com os votos que houver)")
         
         # Cria uma coluna central para o conteúdo principal
         _left, main_col, _right = st.columns([1, 2, 1]) 
@@ -210,7 +310,11 @@ def run_app():
             
             # Mostra a imagem da história
             if page_data.get('image_url'):
-                st.image(page_data['image_url'], caption="A cena atual", use_container_width=True)
+                try:
+                    scene_image = get_scene_image(current_page_id)
+                except LookupError:
+                    scene_image = page_data['image_url'] # sem cache no servidor: o navegador baixa direto
+                st.image(scene_image, caption="A cena atual", use_container_width=True)
             
             # Mostra o texto da história
             st.info(page_data["text"], icon=page_emoji)
@@ -224,15 +328,14 @@ def run_app():
                 # --- Seção de Votos ---
                 st.header("🗳️ Votos Atuais") 
                 if page_data["choices"]:
-                    # Calcula a contagem de votos
-                    vote_counts = {} 
+                    # A contagem vem pronta do servidor; os eleitores são agrupados numa única passada
+                    voters_by_choice = {}
                     for user, choice_idx in votes.items():
-                        choice_idx_int = int(choice_idx) 
-                        vote_counts[choice_idx_int] = vote_counts.get(choice_idx_int, 0) + 1
+                        voters_by_choice.setdefault(int(choice_idx), []).append(user)
                     
                     for i, choice in enumerate(page_data["choices"]):
-                        count = vote_counts.get(i, 0)
-                        voters = [user for user, idx in votes.items() if int(idx) == i]
+                        count = vote_tally[i] if i < len(vote_tally) else 0
+                        voters = voters_by_choice.get(i, [])
                         
                         # Chave dinâmica baseada na presença de eleitores
                         container_key = f"vote_display_{i}_voters_{bool(voters)}"
@@ -258,6 +361,12 @@ def run_app():
                 # Contêiner de chat com altura fixa
                 chat_container = st.container(height=300)
                 with chat_container:
+                    if st.session_state.chat_has_more:
+                        st.button(
+                            "⬆️ Mensagens anteriores",
+                            on_click=handle_load_older_chat,
+                            key="chat_history_btn"
+                        )
                     for msg in chat_messages:
                         chat_container.text(msg)
                 
@@ -0,0 +1,89 @@
+"""
+Votação da plateia: milhares de espectadores votando nas escolhas da página
+ao lado dos jogadores, sem passar pelo lock da sala.
+
+Os votos ficam espalhados em shards (pelo hash do espectador), cada um com
+o seu lock, então votos simultâneos só disputam o lock quando caem no mesmo
+shard, e cada espectador tem um único voto por rodada (trocar de escolha
+move o voto). Nada é enviado a cada voto: a sala soma os shards num tick
+fixo (AUDIENCE_TICK) e manda só a contagem agregada, e o resultado entra
+no avanço da página como `audience_weight` votos de jogador divididos
+proporcionalmente (ver GameRoom._resolve_round).
+"""
+import threading
+
+AUDIENCE_SHARDS = 16
+AUDIENCE_TICK = 0.1 # segundos entre os push da contagem da plateia (10 Hz)
+
+
+class AudienceShard:
+    __slots__ = ("lock", "choices", "counts", "accepted")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.choices = {} # espectador -> índice da escolha
+        self.counts = {}  # índice da escolha -> votos
+        self.accepted = 0 # votos aceitos desde a última coleta (para as métricas)
+
+
+class AudienceTally:
+    """
+    Votos da plateia na rodada atual. `current` é trocado inteiro a cada
+    rodada (uma atribuição), então quem vota nunca precisa de outro lock
+    além do lock do shard.
+    """
+    def __init__(self, shards=AUDIENCE_SHARDS):
+        self.size = shards
+        self.current = (0, tuple(AudienceShard() for _ in range(shards))) # (rodada, shards)
+        self.dirty = False # houve voto desde o último tick
+
+    @property
+    def round(self):
+        return self.current[0]
+
+    def vote(self, viewer, choice_index, round_id=None):
+        """Registra (ou troca) o voto; False se ele era para uma rodada que já acabou."""
+        current_round, shards = self.current
+        if round_id is not None and round_id != current_round:
+            return False
+        shard = shards[hash(viewer) % self.size]
+        with shard.lock:
+            previous = shard.choices.get(viewer)
+            if previous != choice_index:
+                shard.choices[viewer] = choice_index
+                if previous is not None:
+                    shard.counts[previous] -= 1
+                shard.counts[choice_index] = shard.counts.get(choice_index, 0) + 1
+            shard.accepted += 1
+        self.dirty = True
+        return True
+
+    def reset(self, round_id):
+        """Nova rodada: os votos da anterior (inclusive os que ainda chegarem) são descartados."""
+        self.current = (round_id, tuple(AudienceShard() for _ in range(self.size)))
+        self.dirty = True
+
+    def collect(self, drain=False):
+        """
+        (rodada, {escolha: votos}, espectadores que votaram, votos aceitos desde
+        a última coleta com drain=True, que zera esse contador).
+        """
+        current_round, shards = self.current
+        counts = {}
+        viewers = accepted = 0
+        for shard in shards:
+            with shard.lock:
+                for choice, count in shard.counts.items():
+                    counts[choice] = counts.get(choice, 0) + count
+                viewers += len(shard.choices)
+                accepted += shard.accepted
+                if drain:
+                    shard.accepted = 0
+        return current_round, counts, viewers, accepted
+
+    def scores(self, weight):
+        """A plateia como `weight` votos de jogador, divididos na proporção dos votos dela."""
+        _round, counts, viewers, _accepted = self.collect()
+        if not viewers or not weight:
+            return {}
+        return {choice: weight * count / viewers for choice, count in counts.items() if count > 0}
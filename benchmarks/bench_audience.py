@@ -0,0 +1,182 @@
+"""
+Benchmark da votação da plateia (audience.py): votos por segundo numa sala
+com a plateia ligada, e quantos push de contagem saem enquanto isso.
+
+Modos:
+    jogador      GameRoom.vote, o voto de jogador (lock da sala + push por voto), como referência
+    plateia      GameRoom.audience_vote, um voto por chamada, em --threads threads
+    lote         StoryGameService.exposed_audience_votes com --batch votos por chamada
+    rpc          o mesmo lote por RPyC, contra um server.py local (--port) subido pelo benchmark
+
+Cada voto é de um espectador diferente (há --viewers espectadores, que
+voltam a votar trocando de escolha). Meta: 50 mil votos/s numa máquina.
+
+Uso: python benchmarks/bench_audience.py [--threads 1 4] [--duration 3] [--modes plateia lote rpc]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import rpyc
+
+from push import PUSH_CALLBACKS
+from rooms import RoomRegistry
+from server import StoryGameService, SERVICE_USERNAME
+
+MODES = ("jogador", "plateia", "lote", "rpc")
+
+
+class StubConn:
+    def __init__(self, username):
+        self.username = username
+
+
+def make_room(players):
+    """Registro com a plateia ligada e `players` jogadores recebendo push; conta os push por tipo."""
+    received = {}
+    lock = threading.Lock()
+
+    def callback(kind):
+        def on_push(*args):
+            with lock:
+                received[kind] = received.get(kind, 0) + 1
+        return on_push
+
+    registry = RoomRegistry(audience_weight=1.0)
+    for i in range(players):
+        conn = StubConn(f"jogador{i}")
+        registry.push.register(conn, callbacks={kind: callback(kind) for kind in PUSH_CALLBACKS})
+        registry.default_room.connect(conn, conn.username)
+    return registry, registry.default_room, received
+
+
+def run_threads(threads, duration, work):
+    """Roda work(thread, deadline) em `threads` threads; retorna o total de votos que elas contaram."""
+    totals = [0] * threads
+    deadline = time.perf_counter() + duration
+
+    def target(index):
+        totals[index] = work(index, deadline)
+    workers = [threading.Thread(target=target, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(totals)
+
+
+def bench_player(registry, room, threads, duration, viewers, batch):
+    def work(index, deadline):
+        count = 0
+        while time.perf_counter() < deadline:
+            for _ in range(100):
+                room.vote(f"jogador{index}", count & 1)
+                count += 1
+        return count
+    return run_threads(threads, duration, work)
+
+
+def bench_audience(registry, room, threads, duration, viewers, batch):
+    names = [f"espectador{i}" for i in range(viewers)]
+
+    def work(index, deadline):
+        count = 0
+        vote = room.audience_vote
+        while time.perf_counter() < deadline:
+            for i in range(index, viewers, threads * 50):
+                vote(names[i], (i + count) & 1)
+                count += 1
+        return count
+    return run_threads(threads, duration, work)
+
+
+def bench_batch(registry, room, threads, duration, viewers, batch):
+    service = StoryGameService(registry)
+    batches = [tuple((f"espectador{i}", (i // viewers) & 1) for i in range(start, start + batch))
+               for start in range(0, viewers * 2, batch)]
+
+    def work(index, deadline):
+        count = 0
+        i = index
+        while time.perf_counter() < deadline:
+            count += service.exposed_audience_votes(batches[i % len(batches)])
+            i += threads
+        return count
+    return run_threads(threads, duration, work)
+
+
+def bench_rpc(port, threads, duration, viewers, batch):
+    class Viewer(rpyc.Service):
+        def exposed_get_username(self):
+            return SERVICE_USERNAME
+    batches = [tuple((f"espectador{i}", (i // viewers) & 1) for i in range(start, start + batch))
+               for start in range(0, viewers * 2, batch)]
+
+    def work(index, deadline):
+        conn = rpyc.connect("127.0.0.1", port, service=Viewer)
+        count = 0
+        i = index
+        while time.perf_counter() < deadline:
+            count += conn.root.audience_votes(batches[i % len(batches)])
+            i += threads
+        conn.close()
+        return count
+    return run_threads(threads, duration, work)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--duration", type=float, default=3.0, help="segundos por medição")
+    parser.add_argument("--viewers", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=1000, help="votos por chamada nos modos lote e rpc")
+    parser.add_argument("--players", type=int, default=20, help="jogadores recebendo push na sala")
+    parser.add_argument("--port", type=int, default=19750, help="porta do server.py local do modo rpc")
+    args = parser.parse_args()
+
+    server = None
+    if "rpc" in args.modes:
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, "server.py"), "--port", str(args.port),
+                                   "--image-cache=", "--audience-weight", "1"],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=ROOT)
+        time.sleep(1.5)
+
+    print(f"{'modo':<10}{'threads':>8}{'votos/s':>12}{'push de voto/s':>16}{'push da plateia/s':>19}")
+    try:
+        for mode in args.modes:
+            for threads in args.threads:
+                if mode == "rpc":
+                    votes = bench_rpc(args.port, threads, args.duration, args.viewers, args.batch)
+                    print(f"{mode:<10}{threads:>8}{votes / args.duration:>12.0f}{'':>16}{'':>19}")
+                    continue
+                registry, room, received = make_room(args.players)
+                fn = {"jogador": bench_player, "plateia": bench_audience, "lote": bench_batch}[mode]
+                # O servidor imprime a cada voto de jogador; aqui só atrapalharia
+                with open(os.devnull, "w") as devnull:
+                    stdout, sys.stdout = sys.stdout, devnull
+                    try:
+                        received.clear()
+                        votes = fn(registry, room, threads, args.duration, args.viewers, args.batch)
+                        time.sleep(0.3) # deixa o último tick e os push saírem
+                    finally:
+                        sys.stdout = stdout
+                per_player = args.duration * max(args.players, 1)
+                print(f"{mode:<10}{threads:>8}{votes / args.duration:>12.0f}"
+                      f"{received.get('on_vote_update', 0) / per_player:>16.1f}"
+                      f"{received.get('on_audience_update', 0) / per_player:>19.1f}")
+                registry.push.close()
+                registry.timers.close()
+    finally:
+        if server is not None:
+            server.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark do arquivo do chat em disco (chat_archive.py).
+
+Monta o arquivo de uma sala com --messages mensagens (ou reaproveita o de
+--dir, se já tiver mensagens suficientes) e mede:
+    append    custo de ChatArchive.append na thread do RPC (só enfileira) e
+              a vazão da thread de escrita
+    janelas   latência de ler uma janela de --window mensagens (read e page)
+              no fim (as mais novas), no meio e no começo do arquivo, e em
+              posições aleatórias
+
+A meta é que uma janela qualquer custe o mesmo que a mais nova, seja qual
+for o tamanho do arquivo.
+
+Uso: python benchmarks/bench_chat_archive.py [--messages 10000000] [--dir /tmp/chat-archive-bench]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_archive import ChatArchive, SEGMENT_BYTES
+
+ROOM_ID = "bench"
+BUILD_BATCH = 10000
+
+
+def message(seq):
+    return f"[jogador{seq % 97}] mensagem de teste número {seq}, com um pouco de texto"
+
+
+def build(archive, total):
+    """Grava direto (sem a fila) até o arquivo ter `total` mensagens; retorna quantas foram gravadas."""
+    room = archive.room(ROOM_ID)
+    start = room.last_seq + 1
+    for first in range(start, total + 1, BUILD_BATCH):
+        last = min(first + BUILD_BATCH - 1, total)
+        room.write([(seq, message(seq)) for seq in range(first, last + 1)], archive.segment_bytes)
+        room.last_seq = last
+        if first // BUILD_BATCH % 100 == 0:
+            print(f"  ... {last} mensagens", flush=True)
+    return max(total - start + 1, 0)
+
+
+def bench_append(archive, count):
+    """(µs por append na thread do chamador, mensagens/s até tudo estar em disco)."""
+    room = archive.room(ROOM_ID)
+    first = room.last_seq + 1
+    start = time.perf_counter()
+    for seq in range(first, first + count):
+        archive.append(ROOM_ID, seq, message(seq))
+    enqueue = time.perf_counter() - start
+    while room.segments[-1].size == 0 or archive.read(ROOM_ID, first + count - 1, 1) == []:
+        time.sleep(0.005)
+    total = time.perf_counter() - start
+    return enqueue / count * 1e6, count / total
+
+
+def latency(fn, positions):
+    """Latências (µs) de fn(posição) para cada posição."""
+    out = []
+    for position in positions:
+        start = time.perf_counter()
+        fn(position)
+        out.append((time.perf_counter() - start) * 1e6)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--window", type=int, default=100)
+    parser.add_argument("--reads", type=int, default=2000, help="leituras por posição")
+    parser.add_argument("--appends", type=int, default=100000)
+    parser.add_argument("--segment-mb", type=int, default=SEGMENT_BYTES // (1024 * 1024))
+    parser.add_argument("--dir", default=None, help="diretório do arquivo (mantido entre execuções); sem ele, um temporário")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="chat-archive-bench-")
+    archive = ChatArchive(directory, segment_bytes=args.segment_mb * 1024 * 1024)
+    try:
+        start = time.perf_counter()
+        written = build(archive, args.messages)
+        if written:
+            print(f"Arquivo montado: {written} mensagens em {time.perf_counter() - start:.1f}s")
+        room = archive.room(ROOM_ID)
+        total = room.last_seq
+        print(f"{total} mensagens, {len(room.segments)} segmentos, {room.size() / 1024 / 1024:.0f} MB, "
+              f"{sum(len(s.seqs) for s in room.segments)} entradas no índice\n")
+
+        enqueue_us, rate = bench_append(archive, args.appends)
+        print(f"append: {enqueue_us:.2f} µs por mensagem na thread do RPC, {rate:.0f} mensagens/s gravadas\n")
+        total = room.last_seq
+
+        window = args.window
+        places = {
+            "mais novas": [total - window + 1] * args.reads,
+            "meio": [total // 2] * args.reads,
+            "começo": [1] * args.reads,
+            "aleatórias": [random.randint(1, total - window + 1) for _ in range(args.reads)],
+        }
+        print(f"{'janela de ' + str(window):<20}{'read p50 µs':>13}{'read p99 µs':>13}{'page p50 µs':>13}{'page p99 µs':>13}")
+        for name, positions in places.items():
+            reads = latency(lambda seq: archive.read(ROOM_ID, seq, window), positions)
+            pages = latency(lambda seq: archive.page(ROOM_ID, seq + window, window), positions)
+            print(f"{name:<20}{statistics.median(reads):>13.0f}{percentile(reads, 99):>13.0f}"
+                  f"{statistics.median(pages):>13.0f}{percentile(pages, 99):>13.0f}")
+    finally:
+        archive.close()
+        if args.dir is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark de inundação do chat: a latência dos votos com jogadores mandando
+mensagens sem parar, sem e com os limites do chat (rate_limit.py e o
+intervalo entre pushes de chat da sala).
+
+Uma sala com --players jogadores recebendo push (callbacks locais que
+decodificam o JSON, como um cliente faria); --spammers jogadores mandam
+--spam-rate mensagens por segundo cada, e um jogador vota a cada
+--vote-interval segundos. Cenários:
+    sem spam         só os votos (referência)
+    spam sem limite  o servidor sem limites (antes do rate_limit.py)
+    spam com limite  limites padrão do server.py
+
+Mede a duração de room.vote (espera pelo lock incluída), o tempo do voto
+até o push com ele chegar ao próprio jogador, as mensagens aceitas e
+recusadas e os pushes de chat entregues por segundo.
+
+Uso: python benchmarks/bench_chat_flood.py [--players 200] [--spammers 4] [--spam-rate 200] [--duration 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from push import PUSH_CALLBACKS, PushDispatcher
+from rate_limit import ChatLimits
+from rooms import RoomRegistry, CHAT_BROADCAST_INTERVAL
+
+VOTER = "eleitor"
+
+
+class StubConn:
+    def __init__(self, username):
+        self.username = username
+
+
+class Scenario:
+    """Uma sala com os jogadores inscritos; conta os pushes e mede o push do voto do VOTER."""
+    def __init__(self, players, limits, interval):
+        self.registry = RoomRegistry(push=PushDispatcher(), chat_limits=limits, chat_broadcast_interval=interval)
+        self.room = self.registry.default_room
+        self.lock = threading.Lock()
+        self.chat_pushes = 0
+        self.vote_sent = None # (escolha, instante) do voto esperando o push
+        self.vote_push = []
+        for i in range(players):
+            username = VOTER if i == 0 else f"jogador{i}"
+            conn = StubConn(username)
+            self.registry.push.register(conn, callbacks=self.callbacks(username))
+            self.room.connect(conn, username)
+
+    def callbacks(self, username):
+        def on_chat_update(chat_json, room_id=None):
+            json.loads(chat_json)
+            with self.lock:
+                self.chat_pushes += 1
+
+        def on_vote_update(votes_json, room_id=None):
+            votes = json.loads(votes_json)["votes"]
+            sent = self.vote_sent
+            if username == VOTER and sent is not None and votes.get(VOTER) == sent[0]:
+                self.vote_sent = None
+                self.vote_push.append(time.perf_counter() - sent[1])
+
+        def ignore(*args):
+            pass
+        callbacks = {kind: ignore for kind in PUSH_CALLBACKS}
+        callbacks.update(on_chat_update=on_chat_update, on_vote_update=on_vote_update)
+        return callbacks
+
+    def close(self):
+        self.registry.push.close()
+        if self.registry.timers is not None:
+            self.registry.timers.close()
+
+
+def run(scenario, spammers, spam_rate, vote_interval, duration):
+    deadline = time.perf_counter() + duration
+    sent = [[0, 0] for _ in range(spammers)] # [aceitas, recusadas] por spammer
+
+    def spam(index):
+        username = f"jogador{index + 1}"
+        period = 1.0 / spam_rate
+        next_at = time.perf_counter()
+        while time.perf_counter() < deadline:
+            success, _msg = scenario.room.send_chat_message(username, f"spam {next_at:.6f}")
+            sent[index][0 if success else 1] += 1
+            next_at += period
+            time.sleep(max(next_at - time.perf_counter(), 0))
+
+    threads = [threading.Thread(target=spam, args=(i,)) for i in range(spammers)]
+    for thread in threads:
+        thread.start()
+    vote_calls = []
+    choice = 0
+    while time.perf_counter() < deadline:
+        choice ^= 1
+        start = time.perf_counter()
+        scenario.vote_sent = (choice, start)
+        scenario.room.vote(VOTER, choice)
+        vote_calls.append(time.perf_counter() - start)
+        time.sleep(vote_interval)
+    for thread in threads:
+        thread.join()
+    time.sleep(0.5) # deixa os pushes pendentes chegarem
+    accepted = sum(a for a, _r in sent)
+    refused = sum(r for _a, r in sent)
+    return vote_calls, list(scenario.vote_push), accepted / duration, refused / duration, scenario.chat_pushes / duration
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)] if ordered else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--spammers", type=int, default=4)
+    parser.add_argument("--spam-rate", type=float, default=200, help="mensagens por segundo de cada spammer")
+    parser.add_argument("--vote-interval", type=float, default=0.01)
+    parser.add_argument("--duration", type=float, default=5)
+    args = parser.parse_args()
+
+    scenarios = {
+        "sem spam": (0, None, 0.0),
+        "spam sem limite": (args.spammers, None, 0.0),
+        "spam com limite": (args.spammers, ChatLimits(), CHAT_BROADCAST_INTERVAL),
+    }
+    print(f"{args.players} jogadores, {args.spammers} spammers a {args.spam_rate:.0f} mensagens/s cada\n")
+    print(f"{'cenário':<18}{'voto p50 ms':>12}{'voto p99 ms':>12}{'push voto p50':>15}{'push voto p99':>15}"
+          f"{'aceitas/s':>11}{'recusadas/s':>13}{'pushes chat/s':>15}")
+    for name, (spammers, limits, interval) in scenarios.items():
+        scenario = Scenario(args.players, limits, interval)
+        try:
+            calls, pushes, accepted, refused, chat_pushes = run(scenario, spammers, args.spam_rate,
+                                                                args.vote_interval, args.duration)
+        finally:
+            scenario.close()
+        calls_ms = [c * 1000 for c in calls]
+        pushes_ms = [p * 1000 for p in pushes]
+        print(f"{name:<18}{statistics.median(calls_ms):>12.2f}{percentile(calls_ms, 99):>12.2f}"
+              f"{statistics.median(pushes_ms) if pushes_ms else float('nan'):>15.1f}{percentile(pushes_ms, 99):>15.1f}"
+              f"{accepted:>11.0f}{refused:>13.0f}{chat_pushes:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark do modo cluster: votos por segundo somando todas as salas,
+variando o número de processos worker.
+
+Cada jogador simulado fica numa sala própria e vota sem parar. No modo
+"roteador" as chamadas passam pelo roteador (como os clientes reais); no
+modo "direto" cada jogador fala com o worker dono da sala, o que mostra
+quanto os workers escalam sem o salto extra.
+
+Uso: python benchmarks/bench_cluster.py [--seconds 3] [--workers 1 2 4] [--procs 4] [--players 4]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rpyc
+
+from cluster import WorkerPool, make_router, rendezvous_score
+
+
+class BotService(rpyc.Service):
+    def __init__(self, username):
+        self.username = username
+
+    def exposed_get_username(self):
+        return self.username
+
+
+def bot(endpoints, router_port, direct, username, room_id, start, stop, counts, slot):
+    if direct:
+        # Mesmo cálculo do roteador: o worker dono é o de maior hash(sala, worker)
+        index = max(range(len(endpoints)), key=lambda i: rendezvous_score(room_id, i))
+        host, port = endpoints[index]
+    else:
+        host, port = "127.0.0.1", router_port
+    conn = rpyc.connect(host, port, service=BotService(username))
+    conn.root.join_room(room_id)
+    threading.Thread(target=conn.serve_all, daemon=True).start()
+    start.wait()
+    count = 0
+    while not stop.is_set():
+        conn.root.vote(username, count % 2)
+        count += 1
+    counts[slot] = count
+    conn.close()
+
+
+def load_process(endpoints, router_port, direct, proc, players, seconds, ready, go, results):
+    start, stop = threading.Event(), threading.Event()
+    counts = [0] * players
+    threads = [threading.Thread(target=bot, args=(endpoints, router_port, direct, f"bot{proc}-{i}", f"sala{proc}-{i}",
+                                                  start, stop, counts, i))
+               for i in range(players)]
+    for t in threads:
+        t.start()
+    ready.release()
+    go.wait()
+    start.set()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    results.put(sum(counts))
+
+
+def run(workers, direct, procs, players, seconds, base_port):
+    pool = WorkerPool(workers, base_port=base_port + 1)
+    pool.start()
+    router = make_router(pool, hostname="127.0.0.1", port=base_port)
+    threading.Thread(target=router.start, daemon=True).start()
+    time.sleep(0.5)
+
+    endpoints = [(worker.host, worker.port) for worker in pool.workers]
+    ready, go, results = multiprocessing.Semaphore(0), multiprocessing.Event(), multiprocessing.Queue()
+    loaders = [multiprocessing.Process(target=load_process,
+                                       args=(endpoints, base_port, direct, p, players, seconds, ready, go, results))
+               for p in range(procs)]
+    for p in loaders:
+        p.start()
+    for _ in loaders:
+        ready.acquire()
+    time.sleep(0.5) # deixa os on_connect dos workers terminarem
+    go.set()
+    total = sum(results.get() for _ in loaders)
+    for p in loaders:
+        p.join()
+    router.close()
+    pool.stop()
+    return total / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--procs", type=int, default=4, help="processos gerando carga")
+    parser.add_argument("--players", type=int, default=4, help="jogadores (salas) por processo de carga")
+    parser.add_argument("--base-port", type=int, default=19000)
+    args = parser.parse_args()
+
+    rows = []
+    for mode, direct in (("roteador", False), ("direto", True)):
+        for workers in args.workers:
+            rows.append((mode, workers, run(workers, direct, args.procs, args.players, args.seconds, args.base_port)))
+            args.base_port += 10 # evita esperar as portas da rodada anterior saírem do TIME_WAIT
+
+    # A tabela vai no fim porque os workers imprimem cada conexão
+    print()
+    print(f"{args.procs * args.players} salas com um jogador cada, {args.seconds}s por rodada, {os.cpu_count()} CPUs")
+    print(f"{'modo':<10}{'workers':>9}{'votos/s':>12}")
+    for mode, workers, votes_per_sec in rows:
+        print(f"{mode:<10}{workers:>9}{votes_per_sec:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark de conexões paradas: memória (RSS) e threads do servidor com N
+jogadores conectados sem fazer nada, pelo gateway asyncio e pelo RPyC
+(ThreadedServer, uma thread por conexão).
+
+Sobe o server.py num subprocesso e lê /proc/<pid>/status (só Linux).
+
+Uso: python benchmarks/bench_gateway_idle.py [--gateway 1000 5000 10000] [--rpyc 250 500 1000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import rpyc
+
+from gateway import FRAME_HEADER, encode_frame
+
+
+def proc_status(pid):
+    fields = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            fields[key] = value.strip()
+    return int(fields["VmRSS"].split()[0]) // 1024, int(fields["Threads"])
+
+
+def start_server(port, gateway_port):
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "server.py"), "--port", str(port),
+                                "--gateway-port", str(gateway_port)],
+                               stdout=subprocess.DEVNULL, cwd=ROOT)
+    time.sleep(1.5)
+    return process
+
+
+async def open_gateway_clients(port, count):
+    conns = []
+    for i in range(count):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(encode_frame({"op": "hello", "username": f"idle{i}"}))
+        header = await reader.readexactly(FRAME_HEADER.size)
+        reply = json.loads(await reader.readexactly(FRAME_HEADER.unpack(header)[0]))
+        if not reply.get("ok"):
+            raise RuntimeError(reply)
+        conns.append((reader, writer))
+    return conns
+
+
+class IdleService(rpyc.Service):
+    def __init__(self, username):
+        self.username = username
+
+    def exposed_get_username(self):
+        return self.username
+
+
+def open_rpyc_clients(port, count):
+    conns = []
+    for i in range(count):
+        conn = rpyc.connect("127.0.0.1", port, service=IdleService(f"idle{i}"))
+        threading.Thread(target=conn.serve_all, daemon=True).start()
+        conns.append(conn)
+    return conns
+
+
+def measure(process, settle=2.0):
+    time.sleep(settle)
+    return proc_status(process.pid)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gateway", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--rpyc", type=int, nargs="+", default=[250, 500, 1000])
+    parser.add_argument("--base-port", type=int, default=19100)
+    args = parser.parse_args()
+
+    # Cada conexão usa um descritor de arquivo dos dois lados
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    rows = []
+    port = args.base_port
+    for count in args.gateway:
+        process = start_server(port, port + 1)
+        try:
+            base_rss, base_threads = measure(process, 0)
+            loop = asyncio.new_event_loop()
+            conns = loop.run_until_complete(open_gateway_clients(port + 1, count))
+            rss, threads = measure(process)
+            rows.append(("gateway", count, base_rss, rss, threads))
+            for _reader, writer in conns:
+                writer.close()
+            loop.close()
+        finally:
+            process.kill()
+        port += 2
+
+    for count in args.rpyc:
+        process = start_server(port, port + 1)
+        try:
+            base_rss, base_threads = measure(process, 0)
+            conns = open_rpyc_clients(port, count)
+            rss, threads = measure(process)
+            rows.append(("rpyc", count, base_rss, rss, threads))
+            for conn in conns:
+                conn.close()
+        finally:
+            process.kill()
+        port += 2
+
+    print(f"{'modo':<10}{'conexões':>10}{'RSS (MB)':>10}{'KB/conexão':>12}{'threads':>9}")
+    for mode, count, base_rss, rss, threads in rows:
+        per_conn = (rss - base_rss) * 1024 / count
+        print(f"{mode:<10}{count:>10}{rss:>10}{per_conn:>12.1f}{threads:>9}")
+
+
+if __name__ == "__main__":
+    main()
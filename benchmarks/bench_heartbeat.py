@@ -0,0 +1,122 @@
+"""
+Benchmark do heartbeat: quanto um jogador travado atrasa uma rodada.
+
+Sobe o server.py num subprocesso e conecta --players jogadores mais um
+"zumbi" (outro processo, congelado com SIGSTOP depois de entrar na sala: a
+conexão TCP continua aberta, mas ele não responde a mais nada). Os jogadores
+votam e clicam "Avançar" até a página mudar. Sem heartbeat, o zumbi continua
+exigido para avançar e a rodada só anda quando ele é expulso. Mede:
+    expulsão   do SIGSTOP até o zumbi sair da sala
+    rodada     do primeiro "Avançar" até a página mudar (ou --max-wait)
+
+Uso: python benchmarks/bench_heartbeat.py [--players 3] [--max-wait 30]
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import rpyc
+
+from heartbeat import HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, HEARTBEAT_MISSES
+
+ZOMBIE = """
+import sys, threading, time, rpyc
+class Zombie(rpyc.Service):
+    def exposed_get_username(self):
+        return "zumbi"
+conn = rpyc.connect("127.0.0.1", int(sys.argv[1]), service=Zombie)
+threading.Thread(target=conn.serve_all, daemon=True).start()
+print("conectado", flush=True)
+time.sleep(3600)
+"""
+
+SCENARIOS = {
+    "sem heartbeat": ["--heartbeat-interval", "0"],
+    "heartbeat padrão": [],
+    "heartbeat 1s": ["--heartbeat-interval", "1", "--heartbeat-timeout", "1", "--heartbeat-misses", "2"],
+}
+
+
+def player_service(username):
+    class Player(rpyc.Service):
+        def exposed_get_username(self):
+            return username
+    return Player
+
+
+def connect(port, username):
+    conn = rpyc.connect("127.0.0.1", port, service=player_service(username))
+    threading.Thread(target=conn.serve_all, daemon=True).start()
+    return conn
+
+
+def room_info(conn):
+    return json.loads(conn.root.list_rooms())[0]
+
+
+def run(port, server_args, players, max_wait):
+    """(segundos até a expulsão, segundos da rodada); None quando não aconteceu em max_wait."""
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "server.py"), "--port", str(port),
+                               "--image-cache=", *server_args],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=ROOT)
+    zombie = None
+    try:
+        time.sleep(1.5)
+        conns = [connect(port, f"jogador{i}") for i in range(players)]
+        zombie = subprocess.Popen([sys.executable, "-c", ZOMBIE, str(port)], stdout=subprocess.PIPE)
+        zombie.stdout.readline()
+        while room_info(conns[0])["current_players"] < players + 1:
+            time.sleep(0.05)
+        page_id = room_info(conns[0])["page_id"]
+        for i, conn in enumerate(conns):
+            conn.root.vote(f"jogador{i}", 0)
+
+        os.kill(zombie.pid, signal.SIGSTOP)
+        start = time.perf_counter()
+        evicted = round_time = None
+        while time.perf_counter() - start < max_wait and round_time is None:
+            for i, conn in enumerate(conns):
+                conn.root.check_and_advance_page(f"jogador{i}")
+            info = room_info(conns[0])
+            elapsed = time.perf_counter() - start
+            if evicted is None and info["current_players"] == players:
+                evicted = elapsed
+            if info["page_id"] != page_id:
+                round_time = elapsed
+            time.sleep(0.1)
+        for conn in conns:
+            conn.close()
+        return evicted, round_time
+    finally:
+        if zombie is not None:
+            zombie.kill()
+        server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=3, help="jogadores que respondem (além do zumbi)")
+    parser.add_argument("--max-wait", type=float, default=30.0, help="segundos esperando a rodada andar")
+    parser.add_argument("--port", type=int, default=19760)
+    args = parser.parse_args()
+
+    print(f"heartbeat padrão: ping a cada {HEARTBEAT_INTERVAL}s, resposta em {HEARTBEAT_TIMEOUT}s, "
+          f"expulsão depois de {HEARTBEAT_MISSES} falhas\n")
+    print(f"{'cenário':<20}{'expulsão s':>12}{'rodada s':>12}")
+    for i, (name, server_args) in enumerate(SCENARIOS.items()):
+        evicted, round_time = run(args.port + i, server_args, args.players, args.max_wait)
+        never = f"> {args.max_wait:.0f}"
+        print(f"{name:<20}{f'{evicted:.1f}' if evicted is not None else never:>12}"
+              f"{f'{round_time:.1f}' if round_time is not None else never:>12}")
+
+
+if __name__ == "__main__":
+    main()
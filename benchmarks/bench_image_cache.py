@@ -0,0 +1,157 @@
+"""
+Benchmark do cache de imagens das cenas: quanto tempo, depois de uma troca
+de página, até os bytes da imagem da nova cena estarem disponíveis.
+
+Um servidor HTTP local faz o papel do site remoto (fotos grandes, com
+latência e banda limitada). A história é um caminho de páginas em que cada
+uma tem duas escolhas (a próxima do caminho e um final), todas com imagens
+diferentes. Modos:
+
+    direto      o cliente baixa a foto original (como o st.image com a URL)
+    cache frio  ImageCache vazio, sem prefetch: baixa e reduz na troca
+    prefetch    ImageCache vazio, com o prefetch das próximas páginas feito
+                na troca anterior (os jogadores levam --think-ms votando)
+    cache quente o mesmo caminho de novo, com tudo já em disco
+
+Uso: python benchmarks/bench_image_cache.py [--pages 20] [--latency-ms 150] [--mbps 40] [--think-ms 1500]
+"""
+import argparse
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image
+
+from image_cache import ImageCache, page_image_urls
+from story_bundle import InMemoryStory
+
+PHOTO_SIZE = (2400, 1600) # próximo das fotos w=1374+ usadas em story_data
+
+
+def make_photo(seed):
+    """JPEG grande e diferente para cada seed (ruído sobre um gradiente)."""
+    noise = Image.effect_noise(PHOTO_SIZE, 40 + seed % 20)
+    gradient = Image.linear_gradient("L").resize(PHOTO_SIZE)
+    image = Image.merge("RGB", (noise, gradient, Image.eval(noise, lambda v: (v + seed * 7) % 256)))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+class PhotoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency, bytes_per_second):
+        super().__init__(("127.0.0.1", 0), PhotoHandler)
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+        self.photos = {}
+        self.lock = threading.Lock()
+
+    def photo(self, path):
+        with self.lock:
+            if path not in self.photos:
+                self.photos[path] = make_photo(len(self.photos))
+            return self.photos[path]
+
+
+class PhotoHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        data = self.server.photo(self.path)
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        chunk = 64 * 1024
+        for start in range(0, len(data), chunk):
+            self.wfile.write(data[start:start + chunk])
+            time.sleep(chunk / self.server.bytes_per_second)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_story(num_pages, base_url):
+    pages = {}
+    for i in range(num_pages):
+        pages[f"fim{i}"] = {"text": "Fim.", "emoji": "🏁", "image_url": f"{base_url}/fim{i}.jpg", "choices": []}
+        choices = [{"text": "Desistir", "emoji": "🏁", "next_page": f"fim{i}"}]
+        if i + 1 < num_pages:
+            choices.insert(0, {"text": "Seguir", "emoji": "👉", "next_page": f"p{i + 1}"})
+        pages[f"p{i}"] = {"text": f"Página {i}.", "emoji": "🌲", "image_url": f"{base_url}/p{i}.jpg", "choices": choices}
+    return InMemoryStory(pages, "p0")
+
+
+def walk(story, fetch, think, prefetch=None):
+    """Percorre o caminho principal; retorna (latências em s, bytes recebidos por troca)."""
+    latencies, sizes = [], []
+    page_id = story.start_page_id
+    while True:
+        t = time.perf_counter()
+        data = fetch(story.page(page_id)["image_url"])
+        latencies.append(time.perf_counter() - t)
+        sizes.append(len(data))
+        if prefetch is not None:
+            prefetch(page_image_urls(story, page_id))
+        choices = story.page(page_id)["choices"]
+        if len(choices) < 2:
+            return latencies, sizes
+        time.sleep(think)
+        page_id = choices[0]["next_page"]
+
+
+def download(url):
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=150, help="latência do servidor de fotos")
+    parser.add_argument("--mbps", type=float, default=40, help="banda do servidor de fotos, em megabits/s")
+    parser.add_argument("--think-ms", type=float, default=1500, help="tempo entre trocas de página")
+    args = parser.parse_args()
+
+    server = PhotoServer(args.latency_ms / 1000, args.mbps * 1e6 / 8)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    story = make_story(args.pages, f"http://127.0.0.1:{server.server_port}")
+    # Gera as fotos antes de medir
+    for page_id in story.page_ids():
+        server.photo("/" + story.page(page_id)["image_url"].rsplit("/", 1)[1])
+    think = args.think_ms / 1000
+
+    rows = [("direto", *walk(story, download, think))]
+    tmp = tempfile.mkdtemp()
+    try:
+        cold = ImageCache(os.path.join(tmp, "frio"))
+        rows.append(("cache frio", *walk(story, cold.get, think)))
+        warm = ImageCache(os.path.join(tmp, "prefetch"))
+        rows.append(("prefetch", *walk(story, warm.get, think, prefetch=warm.prefetch)))
+        rows.append(("cache quente", *walk(story, warm.get, think, prefetch=warm.prefetch)))
+        cold.close()
+        warm.close()
+    finally:
+        shutil.rmtree(tmp)
+        server.shutdown()
+
+    print(f"{'modo':<14}{'trocas':>7}{'média (ms)':>12}{'p95 (ms)':>10}{'máx (ms)':>10}{'KB/troca':>10}")
+    for mode, latencies, sizes in rows:
+        p95 = statistics.quantiles(latencies, n=20, method="inclusive")[-1] if len(latencies) > 1 else latencies[0]
+        print(f"{mode:<14}{len(latencies):>7}{statistics.mean(latencies) * 1000:>12.1f}{p95 * 1000:>10.1f}"
+              f"{max(latencies) * 1000:>10.1f}{statistics.mean(sizes) / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
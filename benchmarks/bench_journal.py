@@ -0,0 +1,128 @@
+"""
+Benchmark do journal (journal.py):
+
+1. Latência de GameRoom.vote (o que exposed_vote executa) sem journal e com
+   cada política de fsync, comparando o acréscimo com um orçamento (--budget-us).
+2. Tempo de recuperação de um journal com --events eventos (votos e chat
+   espalhados por várias salas): reaplicando tudo, e com um snapshot feito
+   em 90% dos eventos (só a cauda é reaplicada).
+
+Uso: python benchmarks/bench_journal.py [--votes 20000] [--events 1000000] [--budget-us 50]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from journal import Journal, FSYNC_NEVER, FSYNC_POLICIES
+from rooms import RoomRegistry
+
+ROOMS = 100
+PLAYERS_PER_ROOM = 4
+
+
+class FakeConn:
+    pass
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def measure_votes(journal, count):
+    registry = RoomRegistry(journal=journal, snapshot_every=None)
+    room = registry.default_room
+    for name in ("ana", "bia"):
+        room.connect(FakeConn(), name)
+    latencies = []
+    for i in range(count):
+        t = time.perf_counter()
+        room.vote("ana" if i % 2 else "bia", i % 2)
+        latencies.append(time.perf_counter() - t)
+    registry.push.close()
+    return latencies
+
+
+def fill_journal(directory, events, snapshot_at=None):
+    """Gera `events` eventos com as operações reais das salas; retorna o tamanho em disco."""
+    journal = Journal(directory, fsync=FSYNC_NEVER)
+    registry = RoomRegistry(journal=journal, snapshot_every=None)
+    rooms = [registry.create(f"sala{i}") for i in range(ROOMS)]
+    players = [f"jogador{p}" for p in range(PLAYERS_PER_ROOM)]
+    for room in rooms:
+        for name in players:
+            room.connect(FakeConn(), name)
+    i = 0
+    while journal.seq < events:
+        room = rooms[i % ROOMS]
+        name = players[i // ROOMS % PLAYERS_PER_ROOM]
+        if i % 5 == 4:
+            room.send_chat_message(name, f"mensagem {i}")
+        else:
+            room.vote(name, (i // 7) % 2)
+        i += 1
+        if snapshot_at is not None and journal.seq >= snapshot_at:
+            journal.snapshot(registry.capture_states)
+            snapshot_at = None
+    journal.close()
+    registry.push.close()
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def measure_recovery(directory):
+    t = time.perf_counter()
+    journal = Journal(directory, fsync=FSYNC_NEVER)
+    registry = RoomRegistry(journal=journal, snapshot_every=None)
+    elapsed = time.perf_counter() - t
+    journal.close()
+    registry.push.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--votes", type=int, default=20000)
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--budget-us", type=float, default=50, help="acréscimo máximo aceitável na mediana do voto")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        vote_rows = [("sem journal", measure_votes(None, args.votes))]
+        for policy in FSYNC_POLICIES:
+            journal = Journal(os.path.join(tmp, f"votos-{policy}"), fsync=policy)
+            vote_rows.append((policy, measure_votes(journal, args.votes)))
+            journal.close()
+
+        full_dir, tail_dir = os.path.join(tmp, "completo"), os.path.join(tmp, "snapshot")
+        recovery_rows = [
+            ("só journal", fill_journal(full_dir, args.events), measure_recovery(full_dir)),
+            ("snapshot em 90%", fill_journal(tail_dir, args.events, snapshot_at=args.events * 9 // 10),
+             measure_recovery(tail_dir)),
+        ]
+    finally:
+        shutil.rmtree(tmp)
+
+    base = statistics.median(vote_rows[0][1])
+    print(f"{'fsync':<14}{'p50 (µs)':>10}{'p99 (µs)':>10}{'acréscimo p50':>15}  orçamento ({args.budget_us:.0f} µs)")
+    for name, latencies in vote_rows:
+        p50 = statistics.median(latencies)
+        added = (p50 - base) * 1e6
+        verdict = "" if name == "sem journal" else ("ok" if added <= args.budget_us else "ACIMA")
+        print(f"{name:<14}{p50 * 1e6:>10.1f}{percentile(latencies, 0.99) * 1e6:>10.1f}{added:>15.1f}  {verdict}")
+
+    print()
+    print(f"{'recuperação':<18}{'eventos':>10}{'disco (MB)':>12}{'tempo (s)':>11}{'eventos/s':>12}")
+    for name, size, elapsed in recovery_rows:
+        print(f"{name:<18}{args.events:>10}{size / 1e6:>12.1f}{elapsed:>11.2f}{args.events / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
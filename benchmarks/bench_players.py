@@ -0,0 +1,185 @@
+"""
+Benchmark do registro de jogadores: VoteTally atual (ids inteiros densos,
+votos num array e conjuntos em bitsets) contra o desenho anterior (sets e
+dicts de usernames, reproduzido em SetVoteTally), com N jogadores na sala.
+
+Mede a memória das estruturas (tracemalloc, sem contar as strings dos nomes,
+que as duas compartilham) e o custo das operações de uma rodada:
+    voto          registrar (ou trocar) um voto
+    quórum        all_voted() + all_ready(), feito a cada clique em "Avançar"
+    falta 1       montar a mensagem "Aguardando 1/N votarem: ..." (um jogador sem votar)
+    falta metade  a mesma mensagem com metade dos jogadores sem votar
+    snapshot      os votos publicados no GameSnapshot a cada voto (antes: cópia do dict + json.dumps)
+    reset         zerar votos e "pronto" para a próxima página
+
+Uso: python benchmarks/bench_players.py [--players 1000 100000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vote_tally import VoteTally, describe_waiting
+
+
+class SetVoteTally:
+    """O VoteTally anterior: sets de usernames mantidos a cada escrita."""
+    def __init__(self):
+        self.players = set()
+        self.active = set()
+        self.required = set()
+        self.votes = {}
+        self.counts = {}
+        self.voters_by_choice = {}
+        self.ready = set()
+        self.waiting_vote = set()
+        self.waiting_ready = set()
+
+    def add_player(self, username):
+        if username in self.players:
+            return False
+        self.players.add(username)
+        if username in self.active:
+            self._require(username)
+        return True
+
+    def set_active(self, username, active):
+        if active:
+            self.active.add(username)
+            if username in self.players:
+                self._require(username)
+        else:
+            self.active.discard(username)
+            self.required.discard(username)
+            self.waiting_vote.discard(username)
+            self.waiting_ready.discard(username)
+
+    def _require(self, username):
+        self.required.add(username)
+        if username not in self.votes:
+            self.waiting_vote.add(username)
+        if username not in self.ready:
+            self.waiting_ready.add(username)
+
+    def vote(self, username, choice_index):
+        previous = self.votes.get(username)
+        if previous is not None:
+            self.counts[previous] -= 1
+            self.voters_by_choice[previous].discard(username)
+        self.votes[username] = choice_index
+        self.counts[choice_index] = self.counts.get(choice_index, 0) + 1
+        self.voters_by_choice.setdefault(choice_index, set()).add(username)
+        self.waiting_vote.discard(username)
+        return previous
+
+    def set_ready(self, username):
+        self.ready.add(username)
+        self.waiting_ready.discard(username)
+
+    def clear_ready(self):
+        self.ready.clear()
+        self.waiting_ready = set(self.required)
+
+    def reset(self):
+        self.votes.clear()
+        self.counts.clear()
+        self.voters_by_choice.clear()
+        self.waiting_vote = set(self.required)
+        self.clear_ready()
+
+    def all_voted(self):
+        return not self.waiting_vote
+
+    def all_ready(self):
+        return not self.waiting_ready
+
+
+# Operações de cada desenho: (nome, função(tally, names))
+def waiting_message_sets(tally, names):
+    waiting = tally.waiting_vote
+    return f"Aguardando {len(waiting)}/{len(tally.required)} votarem: {describe_waiting(waiting)}"
+
+
+def waiting_message_bits(tally, names):
+    waiting = tally.names(tally.waiting_vote)
+    return f"Aguardando {len(waiting)}/{tally.num_required()} votarem: {describe_waiting(waiting)}"
+
+
+DESIGNS = {
+    "sets": (SetVoteTally, {
+        "quórum": lambda tally, names: tally.all_voted() or tally.all_ready(),
+        "falta": waiting_message_sets,
+        "snapshot": lambda tally, names: json.dumps(dict(tally.votes)),
+    }),
+    "bitsets": (VoteTally, {
+        "quórum": lambda tally, names: tally.all_voted() or tally.all_ready(),
+        "falta": waiting_message_bits,
+        "snapshot": lambda tally, names: tally.snapshot_votes(),
+    }),
+}
+
+
+def build(cls, names, missing):
+    """Sala com todos os jogadores conectados e todos votando, menos os `missing` últimos."""
+    tally = cls()
+    for name in names:
+        tally.add_player(name)
+        tally.set_active(name, True)
+    for i, name in enumerate(names[:len(names) - missing]):
+        tally.vote(name, i % 3)
+    return tally
+
+
+def measure_memory(cls, names):
+    tracemalloc.start()
+    tally = build(cls, names, 1)
+    for name in names[::2]:
+        tally.set_ready(name)
+    size, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tally
+    return size
+
+
+def timed(fn, repeat, setup=None):
+    """Melhor tempo (µs) de fn() em `repeat` execuções (fn(setup()), com setup fora da medição)."""
+    best = float("inf")
+    for _ in range(repeat):
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'jogadores':>10}  {'desenho':<8}{'bytes/jogador':>14}{'voto µs':>10}{'quórum µs':>11}"
+          f"{'falta 1 µs':>12}{'falta metade µs':>17}{'snapshot µs':>14}{'reset µs':>10}")
+    for n in args.players:
+        names = [f"jogador{i:06d}" for i in range(n)]
+        for design, (cls, ops) in DESIGNS.items():
+            memory = measure_memory(cls, names)
+            one_missing = build(cls, names, 1)
+            half_missing = build(cls, names, n // 2)
+            voter = names[n // 3]
+            vote_us = timed(lambda: one_missing.vote(voter, 1), args.repeat)
+            quorum_us = timed(lambda: ops["quórum"](one_missing, names), args.repeat)
+            missing_one_us = timed(lambda: ops["falta"](one_missing, names), args.repeat)
+            missing_half_us = timed(lambda: ops["falta"](half_missing, names), args.repeat)
+            snapshot_us = timed(lambda: ops["snapshot"](one_missing, names), args.repeat)
+            reset_us = timed(lambda tally: tally.reset(), 3, setup=lambda: build(cls, names, n // 2))
+            print(f"{n:>10}  {design:<8}{memory / n:>14.0f}{vote_us:>10.1f}{quorum_us:>11.1f}"
+                  f"{missing_one_us:>12.1f}{missing_half_us:>17.0f}{snapshot_us:>14.0f}{reset_us:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark de leitura do estado do jogo com um escritor ativo.
+
+Compara o caminho atual (snapshot pré-serializado, sem lock) com o caminho
+antigo (lock global + json.dumps a cada leitura), variando o número de
+threads leitoras enquanto uma thread escritora vota e manda mensagens.
+
+Uso: python benchmarks/bench_snapshot_reads.py [--seconds 2] [--chat 1000]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rooms import RoomRegistry
+from story_data import story_pages
+
+
+def locked_read(room):
+    """Reproduz o getter antigo: serializa tudo segurando o lock."""
+    with room.lock:
+        page_id = room.current_page_id
+        return (page_id, json.dumps(story_pages[page_id]), json.dumps(room.chat.messages()),
+                json.dumps(room.tally.votes_dict()), len(room.connections), room.tally.num_players())
+
+
+def snapshot_read(room):
+    # Leitura completa de um cliente novo (página, janela do chat e votos)
+    return room.get_state_since(None)
+
+
+def make_room(chat_size):
+    registry = RoomRegistry(chat_capacity=max(chat_size, 1))
+    room = registry.default_room
+    with room.lock:
+        for i in range(chat_size):
+            room._append_chat(f"[bot{i % 50}] mensagem de teste número {i}")
+        room._publish_snapshot()
+    return registry, room
+
+
+def run(read_fn, readers, seconds, chat_size):
+    registry, room = make_room(chat_size)
+    stop = threading.Event()
+    reads = [0] * readers
+    writes = [0]
+
+    def reader(slot):
+        count = 0
+        while not stop.is_set():
+            read_fn(room)
+            count += 1
+        reads[slot] = count
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            room.vote(f"bot{i % 50}", i % 2)
+            i += 1
+        writes[0] = i
+
+    threads = [threading.Thread(target=reader, args=(slot,)) for slot in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    registry.push.close()
+    return sum(reads) / seconds, writes[0] / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--chat", type=int, default=1000, help="mensagens no chat antes de começar")
+    parser.add_argument("--readers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"chat={args.chat} mensagens, {args.seconds}s por rodada")
+    print(f"{'modo':<10}{'leitores':>10}{'leituras/s':>15}{'votos/s':>12}")
+    for name, fn in (("lock", locked_read), ("snapshot", snapshot_read)):
+        for readers in args.readers:
+            reads_per_sec, writes_per_sec = run(fn, readers, args.seconds, args.chat)
+            print(f"{name:<10}{readers:>10}{reads_per_sec:>15.0f}{writes_per_sec:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
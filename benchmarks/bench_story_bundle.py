@@ -0,0 +1,86 @@
+"""
+Benchmark de carga da história: tempo de inicialização e memória (RSS) do
+RoomRegistry com a história num dicionário Python (como story_data) e com
+o bundle compilado aberto por mmap, para histórias geradas de vários tamanhos.
+
+Cada medição roda num subprocesso novo. A versão em dicionário é um módulo
+.py gerado e importado (já com o .pyc em cache, como num servidor reiniciado).
+
+Uso: python benchmarks/bench_story_bundle.py [--pages 10000 100000]
+"""
+import argparse
+import os
+import pprint
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from story_bundle import compile_bundle
+from story_gen import generate_story
+
+LOAD_DICT = """
+import sys, time
+t = time.perf_counter()
+sys.path.insert(0, {tmp!r})
+from story_gen_module import story_pages
+from story_bundle import InMemoryStory
+from rooms import RoomRegistry
+registry = RoomRegistry(story=InMemoryStory(story_pages, "p0"))
+"""
+
+LOAD_BUNDLE = """
+import time
+t = time.perf_counter()
+from story_bundle import StoryBundle
+from rooms import RoomRegistry
+registry = RoomRegistry(story=StoryBundle({path!r}))
+"""
+
+REPORT = """
+elapsed = time.perf_counter() - t
+room = registry.default_room
+room.get_state_since(None) # primeira leitura da página inicial
+rss = [line for line in open("/proc/self/status") if line.startswith("VmRSS")][0].split()[1]
+print(elapsed, int(rss) // 1024)
+registry.push.close()
+"""
+
+
+def measure(code):
+    out = subprocess.run([sys.executable, "-c", code + REPORT], cwd=ROOT, capture_output=True, text=True, check=True)
+    elapsed, rss = out.stdout.split()[-2:]
+    return float(elapsed), int(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'páginas':>9}{'modo':>10}{'início (s)':>12}{'RSS (MB)':>10}{'arquivo (MB)':>14}")
+    for num_pages in args.pages:
+        pages, start = generate_story(num_pages)
+        with tempfile.TemporaryDirectory() as tmp:
+            module_path = os.path.join(tmp, "story_gen_module.py")
+            with open(module_path, "w", encoding="utf-8") as f:
+                f.write("story_pages = " + pprint.pformat(pages, width=200) + "\n")
+            bundle_path = os.path.join(tmp, "story.bundle")
+            started = time.perf_counter()
+            compile_bundle(pages, start, bundle_path)
+            compile_time = time.perf_counter() - started
+
+            measure(LOAD_DICT.format(tmp=tmp)) # primeira importação só gera o .pyc
+            for mode, code, path in (("dict", LOAD_DICT.format(tmp=tmp), module_path),
+                                     ("bundle", LOAD_BUNDLE.format(path=bundle_path), bundle_path)):
+                elapsed, rss = measure(code)
+                size = os.path.getsize(path) / 2**20
+                print(f"{num_pages:>9}{mode:>10}{elapsed:>12.3f}{rss:>10}{size:>14.1f}")
+            print(f"{'':>9}  (compilar o bundle levou {compile_time:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark da análise do grafo da história (story_graph.StoryGraph): tempo
+para analisar histórias geradas de vários tamanhos, abertas como bundle
+compilado. O tempo por página deve ficar praticamente constante (análise linear).
+
+Uso: python benchmarks/bench_story_graph.py [--pages 10000 100000 1000000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from story_bundle import StoryBundle, compile_bundle
+from story_gen import generate_story
+from story_graph import StoryGraph
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.pages:
+            path = os.path.join(tmp, f"historia{count}.bundle")
+            pages, start_page_id = generate_story(count)
+            compile_bundle(pages, start_page_id, path)
+            del pages
+
+            story = StoryBundle(path)
+            t = time.perf_counter()
+            graph = StoryGraph(story)
+            elapsed = time.perf_counter() - t
+            t = time.perf_counter()
+            graph.page_info(start_page_id)
+            query = time.perf_counter() - t
+            summary = graph.summary()
+            rows.append((count, summary["choices"], summary["endings"], summary["cycles"], elapsed, query))
+            story.close()
+
+    print(f"{'páginas':>10}{'escolhas':>10}{'finais':>9}{'ciclos':>8}{'análise (s)':>13}{'µs/página':>11}{'page_info (ms)':>16}")
+    for count, choices, endings, cycles, elapsed, query in rows:
+        print(f"{count:>10}{choices:>10}{endings:>9}{cycles:>8}{elapsed:>13.2f}{elapsed / count * 1e6:>11.1f}{query * 1000:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark da codificação do estado (wire.py): JSON (o get_state_since de
+sempre) contra a codificação compacta, por atualização de um cliente.
+
+Cenários, numa sala com --players jogadores que já votaram e chat cheio:
+    entrada     cliente novo: página, janela do chat, todos os votos e a tabela de nomes
+    chat+voto   uma mensagem e um voto novos desde a última atualização
+    rodada      20 mensagens e metade dos jogadores trocando o voto
+    sem mudança nada mudou (o polling comum)
+
+Para cada um: bytes na rede (a resposta serializada pelo brine do RPyC),
+tempo do servidor para montar a resposta e tempo do cliente para decodificá-la.
+
+Uso: python benchmarks/bench_wire.py [--players 10 100 1000] [--repeat 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from rpyc.core import brine
+
+from rooms import RoomRegistry
+from wire import CompactDecoder, decode_json_state
+
+
+def make_room(players):
+    registry = RoomRegistry(chat_capacity=500)
+    room = registry.create("bench")
+    with room.lock:
+        for i in range(players):
+            room._add_player(f"jogador{i}")
+            room._set_vote(f"jogador{i}", i % 2)
+        for i in range(500):
+            room._append_chat(f"[jogador{i % players}] mensagem de teste número {i}, indo pela esquerda")
+        room._publish_snapshot()
+    return registry, room
+
+
+def mutate(room, players, messages, votes):
+    with room.lock:
+        for i in range(messages):
+            room._append_chat(f"[jogador{i % players}] mais uma mensagem, agora a {i}")
+        for i in range(votes):
+            room._set_vote(f"jogador{i}", ((room.tally.vote_of(f"jogador{i}") or 0) + 1) % 2)
+        room._publish_snapshot()
+
+
+def timed(fn, repeat):
+    t = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - t) / repeat
+
+
+def scenario(room, versions, names, repeat, fresh_decoder):
+    """(bytes json, bytes compacto, µs servidor json, compacto, µs cliente json, compacto)."""
+    json_reply, json_server = timed(lambda: room.get_state_since(versions), repeat)
+    compact_reply, compact_server = timed(lambda: room.get_state_since_compact(versions, names.names_state()),
+                                          repeat)
+
+    _, json_client = timed(lambda: decode_json_state(json_reply), repeat)
+    if fresh_decoder:
+        _, compact_client = timed(lambda: CompactDecoder().decode(compact_reply), repeat)
+    else:
+        _, compact_client = timed(lambda: names.decode(compact_reply), repeat)
+
+    # As duas codificações têm que trazer exatamente o mesmo estado
+    expected = decode_json_state(json_reply)
+    got = (CompactDecoder() if fresh_decoder else names).decode(compact_reply)
+    assert got == expected, (got, expected)
+    return (len(brine.dump(json_reply)), len(brine.dump(compact_reply)),
+            json_server * 1e6, compact_server * 1e6, json_client * 1e6, compact_client * 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'cenário':<24}{'bytes json':>11}{'compacto':>10}{'razão':>7}"
+          f"{'servidor json (µs)':>20}{'compacto':>10}{'cliente json (µs)':>19}{'compacto':>10}")
+    for players in args.players:
+        registry, room = make_room(players)
+        repeat = max(args.repeat * 10 // max(players, 10), 20)
+
+        # Cliente que já sabe tudo até aqui (e já tem a tabela de nomes)
+        known = CompactDecoder()
+        known.decode(room.get_state_since_compact(None, known.names_state()))
+        rows = [("entrada", scenario(room, None, CompactDecoder(), repeat, fresh_decoder=True))]
+
+        versions = room.snapshot.versions
+        mutate(room, players, messages=1, votes=1)
+        rows.append(("chat+voto", scenario(room, versions, known, repeat, fresh_decoder=False)))
+        mutate(room, players, messages=20, votes=players // 2)
+        rows.append(("rodada", scenario(room, versions, known, repeat, fresh_decoder=False)))
+        rows.append(("sem mudança", scenario(room, room.snapshot.versions, known, repeat, fresh_decoder=False)))
+
+        for name, (json_bytes, compact_bytes, json_server, compact_server, json_client, compact_client) in rows:
+            label = f"{name} ({players} jog.)"
+            print(f"{label:<24}{json_bytes:>11}{compact_bytes:>10}{json_bytes / compact_bytes:>7.1f}"
+                  f"{json_server:>20.1f}{compact_server:>10.1f}{json_client:>19.1f}{compact_client:>10.1f}")
+        registry.push.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Teste de carga: N jogadores simulados (bots feitos com client.StoryGameClient,
+pelo mesmo protocolo RPyC) entram, conversam, votam e clicam "avançar"
+seguindo perfis de comportamento. Mede os percentis de latência de cada RPC
+e o tempo até os push chegarem, e grava um relatório JSON.
+
+Push medidos:
+    push:chat    do envio de uma mensagem até ela chegar a cada bot da sala (fan-out)
+    push:voto    do voto até o push com ele voltar ao próprio bot
+    push:página  do "avançar" que trocou a página até o push da nova página
+
+Os bots são divididos em salas de --room-size jogadores; quando a história
+chega a um final, a sala inteira passa para uma sala nova e continua.
+Sem --connect, sobe um server.py local (porta --port) para cada rodada.
+
+Uso:
+    python benchmarks/loadtest.py --bots 10 50 100 --duration 30
+    python benchmarks/loadtest.py --bots 200 --processes 4 --profile ativo:80,spam:20
+    python benchmarks/loadtest.py --connect 127.0.0.1:18861 --bots 50
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from client import StoryGameClient
+
+# Perfil -> (intervalo de "pensar" entre ações em segundos, chance de mandar chat a cada ação)
+PROFILES = {
+    "ocioso": ((5.0, 10.0), 0.0),
+    "casual": ((1.0, 3.0), 0.2),
+    "ativo": ((0.2, 0.8), 0.5),
+    "spam": ((0.01, 0.05), 0.9),
+}
+CHAT_MARKER = "carga@"
+PUSH_WAIT = 5.0 # segundos esperando o push da página depois de um avanço bem-sucedido
+
+
+class BotClient(StoryGameClient):
+    """StoryGameClient sem tela: registra latências em vez de desenhar."""
+    def __init__(self, username, room_id, profile, seed):
+        super().__init__(username, room_id)
+        self.think, self.chat_chance = PROFILES[profile]
+        self.rng = random.Random(seed)
+        self.samples = {} # métrica -> latências em segundos
+        self.errors = {} # métrica -> número de erros
+        self.samples_lock = threading.Lock()
+        self.vote_sent = None
+        self.page_pushed = threading.Event()
+        self.page_pushed_at = None
+        self.stopping = False
+
+    def record(self, metric, seconds):
+        with self.samples_lock:
+            self.samples.setdefault(metric, []).append(seconds)
+
+    def timed(self, metric, fn, *args, **kwargs):
+        t = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            with self.samples_lock:
+                self.errors[metric] = self.errors.get(metric, 0) + 1
+            raise
+        self.record(metric, time.perf_counter() - t)
+        return result
+
+    # --- Sem tela ---
+
+    def on_disconnect(self, conn):
+        if not self.stopping:
+            with self.samples_lock:
+                self.errors["desconexão"] = self.errors.get("desconexão", 0) + 1
+
+    def _print_full_game_state(self):
+        pass
+
+    # --- Push ---
+
+    def exposed_on_page_update(self, page_id, page_json, room_id=None):
+        self.page_pushed_at = time.perf_counter()
+        self.page_pushed.set()
+
+    def exposed_on_chat_update(self, messages_json, room_id=None):
+        now = time.time()
+        for message in json.loads(messages_json)["messages"]:
+            _, marker, sent = message.rpartition(CHAT_MARKER)
+            if marker:
+                self.record("push:chat", now - float(sent))
+
+    def exposed_on_vote_update(self, votes_json, room_id=None):
+        sent = self.vote_sent
+        if sent is not None and self.username in json.loads(votes_json)["votes"]:
+            self.vote_sent = None
+            self.record("push:voto", time.perf_counter() - sent)
+
+    # --- Comportamento ---
+
+    def play(self, deadline):
+        service = self.game_service
+        while time.time() < deadline:
+            self.timed("get_state_since", self.update_game_state)
+            page = self.current_page_data
+            if page is None:
+                time.sleep(0.1)
+                continue
+            if not page["choices"]:
+                # Final da história: a sala toda segue para a próxima
+                base, _, generation = self.room_id.rpartition("-")
+                next_room = f"{base}-{int(generation) + 1}"
+                ok, _msg = self.timed("join_room", service.exposed_join_room, next_room)
+                if ok:
+                    self.room_id = next_room
+                    self.state_versions = None
+                continue
+
+            if self.rng.random() < self.chat_chance:
+                self.timed("send_chat_message", service.exposed_send_chat_message, self.username,
+                           f"oi {CHAT_MARKER}{time.time():.6f}", room_id=self.room_id)
+            self.vote_sent = time.perf_counter()
+            self.timed("vote", service.exposed_vote, self.username,
+                       self.rng.randrange(len(page["choices"])), room_id=self.room_id)
+            self.pause()
+
+            self.page_pushed.clear()
+            t = time.perf_counter()
+            ok, _msg = self.timed("check_and_advance_page", service.exposed_check_and_advance_page,
+                                  self.username, room_id=self.room_id)
+            if ok and self.page_pushed.wait(PUSH_WAIT):
+                self.record("push:página", max(self.page_pushed_at - t, 0.0))
+            self.pause()
+
+    def pause(self):
+        low, high = self.think
+        time.sleep(self.rng.uniform(low, high))
+
+
+def run_bots(specs, host, port, deadline, ramp, results=None):
+    """Roda os bots (threads) deste processo; devolve (amostras, erros) somados."""
+    bots = []
+    threads = []
+
+    def start(username, room_id, profile, seed, delay):
+        time.sleep(delay)
+        bot = BotClient(username, room_id, profile, seed)
+        bots.append(bot)
+        try:
+            t = time.perf_counter()
+            if not bot.connect_to_server(host, port):
+                raise ConnectionError(username)
+            bot.record("connect", time.perf_counter() - t)
+            bot.play(deadline)
+        except Exception:
+            with bot.samples_lock:
+                bot.errors["bot"] = bot.errors.get("bot", 0) + 1
+        finally:
+            bot.stopping = True
+            if bot.conn is not None:
+                bot.conn.close()
+
+    # A saída do StoryGameClient (conexão, mensagens) não interessa aqui
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, (username, room_id, profile, seed) in enumerate(specs):
+            thread = threading.Thread(target=start, args=(username, room_id, profile, seed, ramp * i / max(len(specs), 1)),
+                                      daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join(max(deadline - time.time(), 0) + 10)
+
+    samples, errors = {}, {}
+    for bot in bots:
+        for metric, values in bot.samples.items():
+            samples.setdefault(metric, []).extend(values)
+        for metric, count in bot.errors.items():
+            errors[metric] = errors.get(metric, 0) + count
+    if results is not None:
+        results.put((samples, errors))
+    return samples, errors
+
+
+def parse_profiles(spec):
+    weights = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition(":")
+        if name not in PROFILES:
+            raise SystemExit(f"Perfil desconhecido: {name} (disponíveis: {', '.join(PROFILES)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def make_specs(count, room_size, profiles, seed):
+    rng = random.Random(seed)
+    names, weights = list(profiles), list(profiles.values())
+    return [(f"bot{i}", f"carga{i // room_size}-0", rng.choices(names, weights)[0], seed + i) for i in range(count)]
+
+
+def run_load(count, args, host, port):
+    specs = make_specs(count, args.room_size, parse_profiles(args.profile), args.seed)
+    deadline = time.time() + args.ramp + args.duration
+    if args.processes <= 1:
+        samples, errors = run_bots(specs, host, port, deadline, args.ramp)
+    else:
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=run_bots, args=(specs[i::args.processes], host, port, deadline,
+                                                                    args.ramp, results))
+                     for i in range(args.processes)]
+        for process in processes:
+            process.start()
+        samples, errors = {}, {}
+        for _ in processes:
+            part_samples, part_errors = results.get()
+            for metric, values in part_samples.items():
+                samples.setdefault(metric, []).extend(values)
+            for metric, n in part_errors.items():
+                errors[metric] = errors.get(metric, 0) + n
+        for process in processes:
+            process.join()
+    return samples, errors
+
+
+def start_server(port, server_args):
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "server.py"), "--port", str(port), *server_args],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=ROOT)
+    time.sleep(1.5)
+    return process
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def summarize(samples, errors, duration):
+    summary = {}
+    for metric in sorted(set(samples) | set(errors)):
+        values = samples.get(metric, [])
+        summary[metric] = {
+            "count": len(values),
+            "errors": errors.get(metric, 0),
+            "per_second": len(values) / duration,
+        }
+        if values:
+            summary[metric].update({f"p{int(p * 100)}_ms": percentile(values, p) * 1000 for p in (0.5, 0.9, 0.99)})
+            summary[metric]["max_ms"] = max(values) * 1000
+    return summary
+
+
+def print_summary(count, summary):
+    print(f"\n=== {count} bots ===")
+    print(f"{'métrica':<24}{'n':>8}{'/s':>8}{'p50 (ms)':>10}{'p90 (ms)':>10}{'p99 (ms)':>10}{'máx (ms)':>10}{'erros':>7}")
+    for metric, row in summary.items():
+        if row["count"]:
+            print(f"{metric:<24}{row['count']:>8}{row['per_second']:>8.1f}{row['p50_ms']:>10.1f}{row['p90_ms']:>10.1f}"
+                  f"{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}{row['errors']:>7}")
+        else:
+            print(f"{metric:<24}{0:>8}{'':>8}{'':>10}{'':>10}{'':>10}{'':>10}{row['errors']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bots", type=int, nargs="+", default=[10, 50, 100], help="uma rodada para cada quantidade")
+    parser.add_argument("--duration", type=float, default=30, help="segundos de carga por rodada (depois da rampa)")
+    parser.add_argument("--ramp", type=float, default=5, help="segundos para todos os bots entrarem")
+    parser.add_argument("--room-size", type=int, default=5, help="bots por sala")
+    parser.add_argument("--profile", default="casual:50,ativo:50", help="perfis e pesos, ex.: ativo:80,spam:20")
+    parser.add_argument("--processes", type=int, default=1, help="processos de bots (cada um com suas threads)")
+    parser.add_argument("--connect", default=None, help="host:porta de um servidor já rodando (senão sobe um local)")
+    parser.add_argument("--port", type=int, default=19700, help="porta do servidor local")
+    parser.add_argument("--server-args", default="--image-cache=", help="argumentos extras para o server.py local")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--report", default="loadtest_report.json", help="arquivo do relatório JSON")
+    args = parser.parse_args()
+
+    report = {"config": vars(args), "runs": []}
+    port = args.port
+    for count in args.bots:
+        server = None
+        if args.connect:
+            host, _, connect_port = args.connect.rpartition(":")
+            connect_port = int(connect_port)
+        else:
+            host, connect_port = "127.0.0.1", port
+            server = start_server(port, args.server_args.split())
+            port += 1
+        try:
+            samples, errors = run_load(count, args, host, connect_port)
+        finally:
+            if server is not None:
+                server.kill()
+        summary = summarize(samples, errors, args.duration)
+        print_summary(count, summary)
+        report["runs"].append({"bots": count, "metrics": summary})
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nRelatório gravado em {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Micro-benchmarks dos caminhos quentes do StoryGameService, chamados no
+próprio processo (sem rede), com clientes falsos no lugar das conexões RPyC:
+
+    get_atomic_game_state    com 10, 1k e 100k mensagens no chat
+    vote                     com 10 a 10k jogadores na sala
+    check_and_advance_page   com 10 a 10k jogadores: esperando votos, avançando e desempatando
+    fan-out                  de send_chat_message até o push chegar a todos os clientes
+
+Os resultados (mediana e mínimo em µs por operação) são gravados em JSON;
+com --compare, cada caso é comparado com um resultado anterior e os que
+ficaram mais lentos que --threshold são marcados (código de saída 1).
+
+Uso:
+    python benchmarks/microbench.py --output base.json
+    python benchmarks/microbench.py --output novo.json --compare base.json [--threshold 10]
+    python benchmarks/microbench.py --only vote --quick
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from push import PUSH_CALLBACKS
+from rooms import RoomRegistry
+from server import StoryGameService
+
+CASES = []
+
+
+def case(name):
+    def register(fn):
+        CASES.append((name, fn))
+        return fn
+    return register
+
+
+class StubConn:
+    """Conexão falsa: o suficiente para o servidor registrar o jogador e mandar push."""
+    def __init__(self, username):
+        self.username = username
+
+
+def make_game(players, chat_capacity=500, fanout=None):
+    """
+    Registro novo com `players` jogadores conectados à sala padrão. Com
+    `fanout` (função chamada a cada push), os jogadores recebem push por
+    callbacks locais. Retorna (registry, sala, serviço, usernames).
+    """
+    registry = RoomRegistry(chat_capacity=chat_capacity)
+    usernames = [f"jogador{i}" for i in range(players)]
+    for username in usernames:
+        conn = StubConn(username)
+        if fanout is not None:
+            registry.push.register(conn, callbacks={kind: fanout for kind in PUSH_CALLBACKS})
+        StoryGameService(registry).attach(conn, username)
+    return registry, registry.default_room, StoryGameService(registry), usernames
+
+
+def measure(op, sizes, setup=None):
+    """
+    µs por operação em sizes.repeat rodadas. Sem setup, cada rodada chama op()
+    várias vezes seguidas; com setup, só op() é cronometrada e setup() roda
+    antes de cada chamada. O número de chamadas por rodada é calibrado (como
+    no timeit) para a rodada durar cerca de sizes.round_seconds.
+    """
+    t = time.perf_counter()
+    if setup is not None:
+        setup()
+    op()
+    once = max(time.perf_counter() - t, 1e-7) # com o setup, que também conta no tempo da rodada
+    number = max(1, min(sizes.max_number, int(sizes.round_seconds / once)))
+    repeat = sizes.repeat
+
+    rounds = []
+    for _ in range(repeat):
+        if setup is None:
+            t = time.perf_counter()
+            for _ in range(number):
+                op()
+            rounds.append((time.perf_counter() - t) / number)
+        else:
+            total = 0.0
+            for _ in range(number):
+                setup()
+                t = time.perf_counter()
+                op()
+                total += time.perf_counter() - t
+            rounds.append(total / number)
+    return {"median_us": statistics.median(rounds) * 1e6, "min_us": min(rounds) * 1e6,
+            "number": number, "repeat": repeat}
+
+
+# --- Casos ---
+
+@case("get_atomic_game_state")
+def bench_atomic_state(sizes):
+    for chat_size in sizes.chat:
+        registry, room, service, _ = make_game(10, chat_capacity=max(chat_size, 1))
+        with room.lock:
+            for i in range(chat_size):
+                room._append_chat(f"[jogador{i % 10}] mensagem de teste número {i}")
+            room._publish_snapshot()
+        yield {"chat": chat_size}, measure(service.exposed_get_atomic_game_state, sizes)
+        registry.push.close()
+
+
+@case("vote")
+def bench_vote(sizes):
+    for players in sizes.players:
+        registry, _room, service, usernames = make_game(players)
+        state = {"i": 0}
+
+        def op():
+            i = state["i"] = state["i"] + 1
+            service.exposed_vote(usernames[i % players], i % 2)
+        yield {"players": players}, measure(op, sizes)
+        registry.push.close()
+
+
+def prepare_round(room, usernames, choices):
+    """Volta a sala para a página inicial com todos votados e prontos, menos o último."""
+    with room.lock:
+        room._set_page(room.story.start_page_id)
+        room._reset_votes()
+        for username, choice in zip(usernames, choices):
+            room._set_vote(username, choice)
+        for username in usernames[:-1]:
+            room._set_ready(username)
+        room._publish_snapshot()
+
+
+@case("check_and_advance_page")
+def bench_advance(sizes):
+    for players in sizes.players:
+        registry, room, service, usernames = make_game(players)
+        last = usernames[-1]
+
+        # Caso comum: o jogador clica "avançar" com votos faltando
+        with room.lock:
+            room._reset_votes()
+            room._publish_snapshot()
+        yield ({"players": players, "scenario": "aguardando"},
+               measure(lambda: service.exposed_check_and_advance_page(last), sizes))
+
+        # O último clique, que processa os votos e troca a página
+        unanimous = [0] * players
+        yield ({"players": players, "scenario": "avanço"},
+               measure(lambda: service.exposed_check_and_advance_page(last), sizes,
+                       setup=lambda: prepare_round(room, usernames, unanimous)))
+
+        # Empate: zera votos e "pronto" e avisa no chat
+        split = [i % 2 for i in range(players)]
+        yield ({"players": players, "scenario": "empate"},
+               measure(lambda: service.exposed_check_and_advance_page(last), sizes,
+                       setup=lambda: prepare_round(room, usernames, split)))
+        registry.push.close()
+
+
+@case("fan-out")
+def bench_fanout(sizes):
+    for clients in sizes.clients:
+        delivered = threading.Semaphore(0)
+
+        def on_push(*args):
+            delivered.release()
+
+        registry, _room, service, _ = make_game(clients, fanout=on_push)
+        state = {"i": 0}
+
+        def op():
+            state["i"] += 1
+            service.exposed_send_chat_message("jogador0", f"mensagem {state['i']}")
+            for _ in range(clients):
+                delivered.acquire()
+        yield {"clients": clients}, measure(op, sizes)
+        registry.push.close()
+
+
+# --- Execução e comparação ---
+
+class Sizes:
+    def __init__(self, quick):
+        self.chat = [10, 1000] if quick else [10, 1000, 100000]
+        self.players = [10, 100] if quick else [10, 100, 1000, 10000]
+        self.clients = [10, 100] if quick else [10, 100, 1000]
+        self.round_seconds = 0.05 if quick else 0.2
+        self.max_number = 10000
+        self.repeat = 3 if quick else 5
+
+
+def case_key(name, params):
+    return name + "[" + ",".join(f"{key}={value}" for key, value in params.items()) + "]"
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(only, quick):
+    sizes = Sizes(quick)
+    results = {}
+    # O servidor imprime a cada entrada/clique; aqui isso só atrapalharia a medição
+    with open(os.devnull, "w") as devnull:
+        for name, fn in CASES:
+            if only and name not in only:
+                continue
+            for params, result in _quiet(fn(sizes), devnull):
+                key = case_key(name, params)
+                results[key] = dict(result, case=name, params=params)
+                print(f"{key:<60}{result['median_us']:>12.1f} µs", file=sys.stderr)
+    return results
+
+
+def _quiet(generator, devnull):
+    while True:
+        with contextlib.redirect_stdout(devnull):
+            try:
+                item = next(generator)
+            except StopIteration:
+                return
+        yield item
+
+
+def compare(results, baseline, threshold):
+    """Linhas (caso, antes, agora, variação %, regressão?) para os casos presentes nos dois."""
+    rows = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        change = (result["median_us"] - before["median_us"]) / before["median_us"] * 100
+        rows.append((key, before["median_us"], result["median_us"], change, change > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="microbench.json", help="onde gravar os resultados")
+    parser.add_argument("--compare", default=None, help="resultado anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=10.0, help="%% de piora na mediana que conta como regressão")
+    parser.add_argument("--only", nargs="+", default=None, choices=[name for name, _ in CASES])
+    parser.add_argument("--quick", action="store_true", help="tamanhos e repetições menores")
+    args = parser.parse_args()
+
+    results = run_suite(args.only, args.quick)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {"commit": git_commit(), "python": platform.python_version(), "machine": platform.machine(),
+                     "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "quick": args.quick},
+            "results": results,
+        }, f, indent=2, ensure_ascii=False)
+
+    print(f"{'caso':<60}{'mediana (µs)':>14}{'mínimo (µs)':>13}")
+    for key, result in results.items():
+        print(f"{key:<60}{result['median_us']:>14.1f}{result['min_us']:>13.1f}")
+    print(f"\nResultados gravados em {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline["results"], args.threshold)
+        print(f"\nComparação com {args.compare} (commit {baseline['meta'].get('commit')}):")
+        print(f"{'caso':<60}{'antes (µs)':>12}{'agora (µs)':>12}{'variação':>10}")
+        for key, before, now, change, regressed in rows:
+            print(f"{key:<60}{before:>12.1f}{now:>12.1f}{change:>+9.1f}%{'  REGRESSÃO' if regressed else ''}")
+        if any(row[4] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
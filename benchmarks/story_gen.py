@@ -0,0 +1,28 @@
+"""Gera histórias grandes e ramificadas (formato de story_data) para os benchmarks."""
+import random
+
+
+def generate_story(num_pages, seed=42, ending_ratio=0.1, max_choices=3):
+    """
+    Páginas p0..pN-1 começando em p0. Cada página aponta para páginas
+    aleatórias (com ciclos); cerca de ending_ratio delas são finais.
+    Retorna (páginas, id da página inicial).
+    """
+    rng = random.Random(seed)
+    pages = {}
+    for i in range(num_pages):
+        if i > 0 and rng.random() < ending_ratio:
+            choices = []
+        else:
+            choices = [
+                {"text": f"Escolha {c + 1} da página {i}.", "emoji": "👉",
+                 "next_page": f"p{rng.randrange(num_pages)}"}
+                for c in range(rng.randint(1, max_choices))
+            ]
+        pages[f"p{i}"] = {
+            "text": f"Página {i}. " + "Você segue pela floresta escura, ouvindo passos ao longe. " * 3,
+            "emoji": "🌳",
+            "image_url": f"https://example.com/imagens/{i}.jpg",
+            "choices": choices,
+        }
+    return pages, "p0"
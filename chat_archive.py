@@ -0,0 +1,321 @@
+"""
+Arquivo do chat em disco: o histórico completo de cada sala, para moderação
+e replay, enquanto a sala só guarda na memória o chat ao vivo (ChatRingBuffer).
+
+GameRoom entrega cada mensagem com append(), que só enfileira; uma thread
+própria codifica e grava as mensagens em lotes. Cada sala tem um diretório
+com segmentos:
+    chat-<seq>.seg   registros a partir da mensagem <seq>: Q seq, I tamanho, mensagem em JSON (UTF-8)
+    chat-<seq>.idx   índice esparso do segmento: (seq, offset) a cada INDEX_EVERY registros
+Quando o segmento passa de segment_bytes, o próximo começa.
+
+Para ler um intervalo (read, page), uma busca binária acha o segmento e
+outra a entrada do índice mais próxima; daí em diante os registros são
+lidos por um mmap do segmento. O custo não depende do tamanho do arquivo:
+no máximo INDEX_EVERY registros pulados mais os lidos.
+
+Os seqs são os do chat da sala. Numa queda, o último lote pode não chegar
+ao disco, e então o arquivo fica com um buraco. As leituras só devolvem
+trechos contíguos.
+"""
+import glob
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_right
+
+from metrics import METRICS
+
+RECORD = struct.Struct("<QI")      # seq, tamanho da mensagem
+INDEX_ENTRY = struct.Struct("<QQ") # seq, offset do registro no segmento
+INDEX_EVERY = 128                  # registros entre entradas do índice
+SEGMENT_BYTES = 64 * 1024 * 1024
+FLUSH_INTERVAL = 0.05              # segundos acumulando mensagens por lote
+
+ARCHIVED_MESSAGES = METRICS.counter("story_chat_archived_messages_total", "Mensagens gravadas no arquivo do chat").labels()
+ARCHIVE_BATCH = METRICS.histogram("story_chat_archive_batch_messages", "Mensagens por lote gravado no arquivo do chat",
+                                  buckets=(1, 5, 10, 50, 100, 500, 1000, 5000)).labels()
+
+SAFE_ROOM_ID = re.compile(r"[\w-]{1,64}")
+
+
+class ArchiveSegment:
+    """
+    Um segmento do arquivo de uma sala. Só a thread de escrita altera o
+    segmento; leitores sem lock usam `size` (atualizado depois da escrita)
+    e o índice, em que o offset é acrescentado antes do seq.
+    """
+    def __init__(self, path, first_seq):
+        self.path = path
+        self.index_path = path[:-4] + ".idx"
+        self.first_seq = first_seq
+        self.seqs = array("Q")    # índice esparso: seq -> offsets[i]
+        self.offsets = array("Q")
+        self.size = 0             # bytes já escritos (e visíveis para leitura)
+        self.unindexed = 0        # registros desde a última entrada do índice
+        self.map = None
+        self.map_size = 0
+
+    def view(self):
+        """mmap com tudo o que já foi escrito (mapeado de novo quando o segmento cresce)."""
+        size = self.size
+        if self.map_size < size:
+            with open(self.path, "rb") as f:
+                # O mapa antigo não é fechado: uma leitura em andamento ainda pode usá-lo
+                self.map, self.map_size = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ), size
+        return self.map
+
+    def records(self, start_seq, end):
+        """(seq, mensagem em JSON) a partir do maior ponto do índice <= start_seq, até o byte `end`."""
+        data = self.view()
+        if data is None:
+            return
+        i = bisect_right(self.seqs, start_seq) - 1
+        pos = self.offsets[i] if i >= 0 else 0
+        end = min(end, len(data))
+        while pos < end:
+            seq, size = RECORD.unpack_from(data, pos)
+            pos += RECORD.size
+            if seq >= start_seq:
+                yield seq, data[pos:pos + size].decode("utf-8")
+            pos += size
+
+    def load(self):
+        """Carrega o índice do disco (só as entradas que apontam para registros já gravados)."""
+        self.size = os.path.getsize(self.path)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            for seq, offset in INDEX_ENTRY.iter_unpack(data[:len(data) - len(data) % INDEX_ENTRY.size]):
+                if offset >= self.size:
+                    break
+                self.offsets.append(offset)
+                self.seqs.append(seq)
+
+    def recover_tail(self):
+        """
+        Segmento ativo depois de um reinício: acha o último registro inteiro,
+        corta um registro pela metade (queda no meio da escrita) e retorna o
+        último seq gravado (ou None se o segmento está vazio).
+        """
+        pos = self.offsets[-1] if self.offsets else 0
+        last_seq = None
+        count = 0
+        with open(self.path, "rb") as f:
+            f.seek(pos)
+            data = f.read()
+        cursor = 0
+        while cursor + RECORD.size <= len(data):
+            seq, size = RECORD.unpack_from(data, cursor)
+            if cursor + RECORD.size + size > len(data):
+                break
+            cursor += RECORD.size + size
+            last_seq = seq
+            count += 1
+        if pos + cursor < self.size:
+            os.truncate(self.path, pos + cursor)
+            self.size = pos + cursor
+        self.unindexed = count % INDEX_EVERY
+        return last_seq
+
+
+class RoomArchive:
+    """Segmentos de uma sala, em ordem; o último é o que recebe as escritas."""
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.segments = []
+        self.firsts = [] # first_seq de cada segmento, para a busca binária
+        self.last_seq = 0 # maior seq já enfileirado
+        self.file = None
+        self.index_file = None
+        for path in sorted(glob.glob(os.path.join(directory, "chat-*.seg"))):
+            segment = ArchiveSegment(path, int(os.path.basename(path)[5:-4]))
+            segment.load()
+            self.segments.append(segment)
+            self.firsts.append(segment.first_seq)
+        if self.segments:
+            last = self.segments[-1]
+            self.last_seq = last.recover_tail() or last.first_seq - 1
+            self._open(last)
+
+    def _open(self, segment):
+        if self.file is not None:
+            self.file.close()
+            self.index_file.close()
+        self.file = open(segment.path, "ab")
+        self.index_file = open(segment.index_path, "ab")
+
+    def write(self, entries, segment_bytes):
+        """Grava [(seq, mensagem), ...] em ordem (chamado só pela thread de escrita)."""
+        out = bytearray()
+        index = bytearray()
+        segment = self.segments[-1] if self.segments else None
+        base = segment.size if segment is not None else 0
+        new_offsets = []
+        for seq, message in entries:
+            if segment is None or base + len(out) >= segment_bytes:
+                if segment is not None:
+                    self._flush(segment, out, index, new_offsets)
+                    out, index, new_offsets = bytearray(), bytearray(), []
+                segment = ArchiveSegment(os.path.join(self.directory, f"chat-{seq:012d}.seg"), seq)
+                self.segments.append(segment)
+                self.firsts.append(seq)
+                self._open(segment)
+                base = 0
+            if segment.unindexed == 0:
+                index += INDEX_ENTRY.pack(seq, base + len(out))
+                new_offsets.append((seq, base + len(out)))
+            segment.unindexed = (segment.unindexed + 1) % INDEX_EVERY
+            body = json.dumps(message).encode("utf-8")
+            out += RECORD.pack(seq, len(body))
+            out += body
+        self._flush(segment, out, index, new_offsets)
+
+    def _flush(self, segment, out, index, new_offsets):
+        # Os dados vão para o disco antes do índice, que nunca aponta para além deles
+        self.file.write(out)
+        self.file.flush()
+        self.index_file.write(index)
+        self.index_file.flush()
+        segment.size += len(out)
+        for seq, offset in new_offsets:
+            segment.offsets.append(offset)
+            segment.seqs.append(seq)
+
+    def read(self, start_seq, limit, upto_seq=None):
+        """Até `limit` registros (seq, mensagem em JSON) com seq >= start_seq (e <= upto_seq), em ordem."""
+        out = []
+        i = max(bisect_right(self.firsts, start_seq) - 1, 0)
+        segments = self.segments[i:]
+        for segment in segments:
+            for seq, encoded in segment.records(start_seq, segment.size):
+                if upto_seq is not None and seq > upto_seq:
+                    return out
+                out.append((seq, encoded))
+                if len(out) >= limit:
+                    return out
+        return out
+
+    def first_seq(self):
+        return self.firsts[0] if self.firsts else None
+
+    def size(self):
+        return sum(segment.size for segment in self.segments)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.index_file.close()
+
+
+class ChatArchive:
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        self.rooms = {}
+        self.lock = threading.Condition()
+        self.buffer = [] # (RoomArchive, seq, mensagem) ainda não gravados
+        self.closed = False
+        self.writer = threading.Thread(target=self._writer_loop, name="chat-archive-writer", daemon=True)
+        self.writer.start()
+
+    def room(self, room_id):
+        """Arquivo da sala (carregado do disco no primeiro uso)."""
+        room = self.rooms.get(room_id)
+        if room is None:
+            with self.lock:
+                room = self.rooms.get(room_id)
+                if room is None:
+                    room = self.rooms[room_id] = RoomArchive(os.path.join(self.directory, _room_dirname(room_id)))
+        return room
+
+    def append(self, room_id, seq, message):
+        """
+        Enfileira uma mensagem (não bloqueia). Seqs que o arquivo já tem são
+        ignorados: na recuperação do journal, as mensagens reaplicadas só
+        preenchem o que faltou gravar antes da queda.
+        """
+        room = self.room(room_id)
+        with self.lock:
+            if seq <= room.last_seq:
+                return
+            room.last_seq = seq
+            self.buffer.append((room, seq, message))
+            self.lock.notify()
+
+    def read(self, room_id, start_seq, limit, upto_seq=None):
+        """
+        Trecho contíguo de até `limit` mensagens a partir da primeira com seq >=
+        start_seq: [(seq, mensagem, mensagem_json)], como ChatRingBuffer.window.
+        """
+        entries = self.room(room_id).read(start_seq, limit, upto_seq)
+        for i in range(1, len(entries)):
+            if entries[i][0] != entries[i - 1][0] + 1:
+                entries = entries[:i] # buraco de uma queda: para aqui
+                break
+        return [(seq, json.loads(encoded), encoded) for seq, encoded in entries]
+
+    def page(self, room_id, before_seq, limit):
+        """
+        As até `limit` mensagens imediatamente anteriores a before_seq, se o
+        arquivo as tiver sem buraco até before_seq - 1 (senão, só o trecho contíguo final).
+        """
+        start = max(before_seq - limit, 1)
+        entries = self.room(room_id).read(start, limit, before_seq - 1)
+        if not entries or entries[-1][0] != before_seq - 1:
+            return []
+        i = len(entries) - 1
+        while i > 0 and entries[i - 1][0] == entries[i][0] - 1:
+            i -= 1
+        return [(seq, json.loads(encoded), encoded) for seq, encoded in entries[i:]]
+
+    def first_seq(self, room_id):
+        """Seq da mensagem mais antiga do arquivo da sala (None se vazio)."""
+        return self.room(room_id).first_seq()
+
+    def size(self):
+        return sum(room.size() for room in list(self.rooms.values()))
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.lock.notify()
+        self.writer.join()
+        for room in self.rooms.values():
+            room.close()
+
+    def _writer_loop(self):
+        while True:
+            with self.lock:
+                self.lock.wait_for(lambda: self.buffer or self.closed)
+                if self.closed and not self.buffer:
+                    return
+            time.sleep(self.flush_interval) # deixa o lote crescer
+            with self.lock:
+                batch, self.buffer = self.buffer, []
+            by_room = {}
+            for room, seq, message in batch:
+                by_room.setdefault(room, []).append((seq, message))
+            for room, entries in by_room.items():
+                try:
+                    room.write(entries, self.segment_bytes)
+                except OSError as e:
+                    print(f"Erro ao gravar o arquivo do chat em {room.directory}: {e}")
+            ARCHIVED_MESSAGES.inc(len(batch))
+            ARCHIVE_BATCH.observe(len(batch))
+
+
+def _room_dirname(room_id):
+    """Diretório da sala: o próprio id, se for um nome seguro; senão, um hash dele."""
+    if SAFE_ROOM_ID.fullmatch(room_id):
+        return room_id
+    return "sala-" + hashlib.md5(room_id.encode("utf-8")).hexdigest()
@@ -0,0 +1,102 @@
+import json
+
+
+class ChatRingBuffer:
+    """
+    Chat ao vivo com capacidade fixa. Cada mensagem recebe um número de
+    sequência (1, 2, 3...) e fica no slot seq % capacidade, guardada já
+    codificada em JSON; quando o buffer enche, a mais antiga é sobrescrita.
+
+    Escritas devem acontecer sob o lock do jogo. Leituras podem ser feitas
+    sem lock a partir de um last_seq publicado: cada slot guarda o próprio
+    seq, então uma mensagem sobrescrita no meio da leitura é detectada e
+    simplesmente fica de fora (só acontece com as mais antigas).
+    """
+    def __init__(self, capacity=500):
+        if capacity < 1:
+            raise ValueError("A capacidade do chat deve ser positiva.")
+        self.capacity = capacity
+        self.slots = [None] * capacity # (seq, mensagem, mensagem_json)
+        self.last_seq = 0
+        self.json_cache = (None, None) # (upto_seq, array JSON) da última chamada de messages_json
+
+    def append(self, message):
+        """Adiciona uma mensagem e retorna o seq dela."""
+        seq = self.last_seq + 1
+        self.slots[seq % self.capacity] = (seq, message, json.dumps(message))
+        self.last_seq = seq
+        return seq
+
+    def skip_to(self, last_seq):
+        """A próxima mensagem recebe o seq last_seq + 1 (as já guardadas continuam com os seus)."""
+        self.last_seq = max(self.last_seq, last_seq)
+
+    def restore(self, entries, last_seq):
+        """Recarrega mensagens salvas ([seq, mensagem], em ordem) e o último seq (recuperação do journal)."""
+        self.slots = [None] * self.capacity
+        for seq, message in entries:
+            self.slots[seq % self.capacity] = (seq, message, json.dumps(message))
+        self.last_seq = last_seq
+        self.json_cache = (None, None)
+
+    def first_seq(self, upto_seq=None):
+        """Menor seq que ainda pode estar no buffer (considerando até upto_seq)."""
+        upto_seq = self.last_seq if upto_seq is None else upto_seq
+        return max(upto_seq - self.capacity + 1, 1)
+
+    def window(self, start_seq, upto_seq):
+        """
+        Entradas (seq, mensagem, mensagem_json) com start_seq <= seq <= upto_seq
+        que ainda estão no buffer, em ordem crescente.
+        """
+        entries = []
+        for seq in range(max(start_seq, self.first_seq(upto_seq)), upto_seq + 1):
+            entry = self.slots[seq % self.capacity]
+            if entry is not None and entry[0] == seq:
+                entries.append(entry)
+        return entries
+
+    def since(self, after_seq, upto_seq):
+        """
+        Mensagens depois de after_seq (até upto_seq), ou None se alguma delas
+        já foi descartada do buffer e o cliente precisa ressincronizar.
+        """
+        entries = self.window(after_seq + 1, upto_seq)
+        if len(entries) != upto_seq - after_seq:
+            return None
+        return entries
+
+    def page(self, before_seq, limit, upto_seq):
+        """As `limit` mensagens mais recentes com seq < before_seq."""
+        end = min(before_seq - 1, upto_seq)
+        return self.window(end - limit + 1, end)
+
+    def messages(self, upto_seq=None):
+        """Todas as mensagens ainda no buffer, como texto."""
+        upto_seq = self.last_seq if upto_seq is None else upto_seq
+        return [message for _seq, message, _encoded in self.window(1, upto_seq)]
+
+    def messages_json(self, upto_seq=None):
+        """
+        Mesmo que messages, já como array JSON: junta as mensagens já codificadas,
+        e só uma vez por seq publicado (as leituras seguintes reaproveitam o texto).
+        """
+        upto_seq = self.last_seq if upto_seq is None else upto_seq
+        cached_seq, cached = self.json_cache
+        if cached_seq == upto_seq:
+            return cached
+        chat_json = "[" + ", ".join(encoded for _seq, _message, encoded in self.window(1, upto_seq)) + "]"
+        self.json_cache = (upto_seq, chat_json) # uma única atribuição: leitores sem lock veem o par inteiro
+        return chat_json
+
+
+def encode_chat_entries(entries, **extra):
+    """
+    Codifica uma sequência contígua de entradas do buffer no formato enviado
+    aos clientes: {"first_seq": n, "messages": [...]}, mais os campos de `extra`.
+    As mensagens já estão codificadas, então isso é só concatenação.
+    """
+    first_seq = entries[0][0] if entries else None
+    items = ", ".join(encoded for _seq, _message, encoded in entries)
+    fields = "".join(json.dumps(key) + ": " + json.dumps(value) + ", " for key, value in extra.items())
+    return "{" + fields + '"first_seq": ' + json.dumps(first_seq) + ', "messages": [' + items + "]}"
@@ -4,16 +4,28 @@ import sys
 import time
 import os
 import json # Importa a biblioteca JSON
+from wire import negotiate, CompactDecoder, decode_json_state, decode_round_deadline, ENCODING_COMPACT
+
+# Fase do prazo da rodada -> o que falta os jogadores fazerem
+ROUND_PHASES = {"vote": "votar", "ready": "digitar 'avancar'"}
 
 class StoryGameClient(rpyc.Service):
-    def __init__(self, username):
+    def __init__(self, username, room_id=None):
         self.username = username
+        self.room_id = room_id # None = sala padrão do servidor
         self.conn = None
         self.game_service = None
         self.current_page_id = None
         self.current_page_data = None
         self.chat_messages = []
+        self.chat_first_seq = None # seq da mensagem mais antiga que temos localmente
         self.votes = {}
+        self.vote_tally = [] # votos por escolha, já calculados pelo servidor
+        self.state_versions = None # versões (página, chat, votos) já recebidas do servidor
+        self.decoder = None # CompactDecoder, se o servidor fala a codificação compacta (senão JSON)
+        self.state_fresh = False # o estado local já veio na resposta do último comando
+        self.round_deadline = None # (fase, instante em time.monotonic() em que vence) ou None
+        self.audience = None # último {"round", "tally", "viewers"} da votação da plateia
         self.display_lock = threading.RLock()
 
     def on_connect(self, conn):
@@ -27,36 +39,47 @@ class StoryGameClient(rpyc.Service):
     def exposed_get_username(self):
         # O servidor chama isso no on_connect
         return self.username
+
+    def exposed_get_room_id(self):
+        # Também no on_connect: a sala em que o jogador entra (None = sala padrão)
+        return self.room_id
      
     #trocar o ip do host para o ip do pc que esta sendo o servidor no radmin vpn
     def connect_to_server(self, host="26.254.252.239", port=18861):
         try:
             self.conn = rpyc.connect(host, port, service=self)
             self.game_service = self.conn.root
+            if negotiate(self.game_service) == ENCODING_COMPACT:
+                self.decoder = CompactDecoder()
             
             self.thread = threading.Thread(target=self.conn.serve_threaded)
             self.thread.daemon = True
             self.thread.start()
             with self.display_lock:
                 print(f"Conectado ao servidor como {self.username}")
-            
+
+            if self.room_id:
+                # A sala já foi no handshake (exposed_get_room_id); o join_room só espera
+                # o servidor aplicá-la antes dos RPCs seguintes (depois dele, não faz nada)
+                success, msg = self.game_service.exposed_join_room(self.room_id)
+                with self.display_lock:
+                    print(msg)
+                if not success:
+                    return False
+
+            self.fetch_round_deadline()
             return True
         except Exception as e:
             print(f"Erro ao conectar: {e}")
             return False
 
     def update_game_state(self):
-        """Busca o estado mais recente do jogo no servidor."""
+        """Busca no servidor apenas o que mudou desde a última atualização."""
         try:
-            # Busca todos os dados de forma atômica
-            current_page_id, current_page_json, chat_json, votes_json = self.game_service.exposed_get_atomic_game_state()
-
-            self.current_page_id = current_page_id
-            
-            # Converte as strings JSON de volta para objetos Python
-            self.current_page_data = json.loads(current_page_json)
-            self.chat_messages = json.loads(chat_json)
-            self.votes = json.loads(votes_json)
+            if self.state_fresh:
+                self.state_fresh = False
+            else:
+                self.fetch_state()
             
             # Redesenha a tela inteira
             self._print_full_game_state()
@@ -67,6 +90,84 @@ class StoryGameClient(rpyc.Service):
             with self.display_lock:
                 print(f"\nErro ao atualizar estado: {e}")
 
+    def fetch_state(self):
+        """Uma ida e volta (get_state_since) aplicando ao estado local só o que mudou."""
+        if self.decoder is not None:
+            data = self.game_service.exposed_get_state_since_compact(
+                self.state_versions, self.decoder.names_state(), room_id=self.room_id)
+            if data is not None: # None: a sala não existe (mais)
+                self._apply_state_delta(self.decoder.decode(data))
+        else:
+            delta = self.game_service.exposed_get_state_since(self.state_versions, room_id=self.room_id)
+            if delta is not None:
+                self._apply_state_delta(decode_json_state(delta))
+
+    def fetch_round_deadline(self):
+        """Prazo da rodada atual; depois disso, ele chega pelo push on_round_update."""
+        self.round_deadline = decode_round_deadline(self.game_service.exposed_get_round_deadline(room_id=self.room_id))
+
+    def round_remaining(self):
+        """(fase, segundos restantes) do prazo da rodada, ou None se não houver prazo."""
+        deadline = self.round_deadline
+        if deadline is None:
+            return None
+        phase, ends_at = deadline
+        return phase, max(ends_at - time.monotonic(), 0.0)
+
+    def _apply_state_delta(self, delta):
+        """Aplica ao estado local a resposta de get_state_since, já decodificada (ver wire.py)."""
+        versions, page_id, page_data, chat_delta, votes_delta, _current_players, _total_players = delta
+        with self.display_lock:
+            if page_data is not None:
+                self.current_page_id = page_id
+                self.current_page_data = page_data
+
+            if chat_delta is not None:
+                if chat_delta["reset"]:
+                    self.chat_messages = chat_delta["messages"]
+                    self.chat_first_seq = chat_delta["first_seq"]
+                else:
+                    self.chat_messages.extend(chat_delta["messages"])
+
+            if votes_delta is not None:
+                if votes_delta["reset"]:
+                    self.votes = votes_delta["votes"]
+                else:
+                    self.votes.update(votes_delta["votes"])
+                self.vote_tally = votes_delta["tally"]
+
+            self.state_versions = tuple(versions)
+
+    def run_commands(self, *commands):
+        """
+        Executa os comandos numa única ida e volta (execute_batch) e aplica o
+        estado que volta na resposta; a próxima atualização da tela não
+        precisa buscá-lo de novo. Retorna o (sucesso, mensagem) do último comando executado.
+        """
+        if self.decoder is not None:
+            results, data = self.game_service.exposed_execute_batch(
+                self.username, commands, self.state_versions, self.decoder.names_state(), room_id=self.room_id)
+            if data is None: # a sala não existe: os resultados trazem o erro
+                return results[-1]
+            self._apply_state_delta(self.decoder.decode(data))
+        else:
+            results, delta = self.game_service.exposed_execute_batch(
+                self.username, commands, self.state_versions, room_id=self.room_id)
+            if delta is None:
+                return results[-1]
+            self._apply_state_delta(decode_json_state(delta))
+        self.state_fresh = True
+        return results[-1]
+
+    def load_older_chat(self):
+        """Busca no servidor a página de mensagens anterior à mais antiga que temos."""
+        page = json.loads(self.game_service.exposed_get_chat_page(self.chat_first_seq, room_id=self.room_id))
+        with self.display_lock:
+            if page["messages"]:
+                self.chat_messages = page["messages"] + self.chat_messages
+                self.chat_first_seq = page["first_seq"]
+        return page["has_more"]
+
     def _print_full_game_state(self):
         """Limpa o console e desenha a UI do jogo."""
         with self.display_lock:
@@ -76,7 +177,7 @@ class StoryGameClient(rpyc.Service):
                 return
 
             print("=" * 50)
-            print(f"Página Atual: {self.current_page_id}")
+            print(f"Sala: {self.room_id or 'principal'} | Página Atual: {self.current_page_id}")
             print("=" * 50)
             print(self.current_page_data["text"])
             print("\nOpções:")
@@ -88,28 +189,29 @@ class StoryGameClient(rpyc.Service):
 
             print("\n" + "-" * 50)
             print("Votos Atuais:")
-            if self.votes:
-                vote_counts = {}
-                # Os votos vêm como { "usuario": "indice_str" }
-                for voter, choice_idx_str in self.votes.items():
-                    choice_idx = int(choice_idx_str) 
-                    vote_counts[choice_idx] = vote_counts.get(choice_idx, 0) + 1
-                
-                choices_len = len(self.current_page_data["choices"])
-                for choice_idx, count in vote_counts.items():
-                    if 0 <= choice_idx < choices_len:
+            if any(self.vote_tally):
+                # A contagem por opção já vem pronta do servidor
+                for choice_idx, count in enumerate(self.vote_tally):
+                    if count:
                         print(f"  Opção {choice_idx + 1}: {count} votos")
             else:
                 print("  Nenhum voto ainda.")
+            if self.audience and self.audience["viewers"]:
+                counts = ", ".join(f"opção {i + 1}: {count}" for i, count in enumerate(self.audience["tally"]))
+                print(f"  Plateia ({self.audience['viewers']} espectadores): {counts}")
+            remaining = self.round_remaining()
+            if remaining is not None:
+                phase, seconds = remaining
+                print(f"Tempo para {ROUND_PHASES.get(phase, phase)}: {seconds:.0f}s (depois a rodada é decidida com os votos que houver)")
             print("-" * 50)
 
-            print("Chat:")
+            print("Chat: (digite 'historico' para ver mensagens anteriores)")
             for msg in self.chat_messages:
                 print(f"  {msg}")
             print("=" * 50)
 
     # Callbacks do servidor (usados para notificações push)
-    def exposed_on_page_update(self, page_id, page_json):
+    def exposed_on_page_update(self, page_id, page_json, room_id=None):
         """Chamado pelo servidor quando a página avança."""
         page_changed = (self.current_page_id != page_id)
         self.current_page_id = page_id
@@ -119,23 +221,35 @@ class StoryGameClient(rpyc.Service):
             with self.display_lock:
                 print(f"\n[SISTEMA] A página mudou! Pressione Enter para atualizar a tela.")
 
-    def exposed_on_chat_update(self, messages_json):
-        """Chamado pelo servidor quando uma nova msg de chat chega."""
-        new_messages = json.loads(messages_json)
-        if len(new_messages) > len(self.chat_messages):
+    def exposed_on_chat_update(self, messages_json, room_id=None):
+        """Chamado pelo servidor quando uma nova msg de chat chega (só as mensagens novas)."""
+        # O chat local é mantido só pela sincronização incremental (update_game_state),
+        # senão as mensagens novas seriam aplicadas duas vezes.
+        new_messages = json.loads(messages_json)["messages"]
+        if new_messages:
             with self.display_lock:
                 print(f"\n[SISTEMA] Nova mensagem no chat. Pressione Enter para atualizar.")
-        
-        self.chat_messages = new_messages
 
-    def exposed_on_vote_update(self, votes_json):
-        """Chamado pelo servidor quando um novo voto é registrado."""
-        new_votes = json.loads(votes_json)
-        if new_votes != self.votes:
+    def exposed_on_vote_update(self, votes_json, room_id=None):
+        """Chamado pelo servidor quando um novo voto é registrado (só os votos alterados)."""
+        # Assim como o chat, os votos locais só mudam pela sincronização incremental
+        votes_delta = json.loads(votes_json)
+        if votes_delta["reset"] or any(self.votes.get(user) != idx for user, idx in votes_delta["votes"].items()):
              with self.display_lock:
                 print(f"\n[SISTEMA] Um voto foi registrado. Pressione Enter para atualizar.")
-        
-        self.votes = new_votes 
+
+    def exposed_on_round_update(self, round_json, room_id=None):
+        """Chamado pelo servidor quando o prazo da rodada é armado, trocado ou desarmado."""
+        self.round_deadline = decode_round_deadline(round_json)
+        remaining = self.round_remaining()
+        if remaining is not None:
+            phase, seconds = remaining
+            with self.display_lock:
+                print(f"\n[SISTEMA] {seconds:.0f}s para {ROUND_PHASES.get(phase, phase)}. Pressione Enter para atualizar.")
+
+    def exposed_on_audience_update(self, audience_json, room_id=None):
+        """Contagem agregada da plateia, até 10 vezes por segundo: só guarda, sem avisar."""
+        self.audience = json.loads(audience_json)
 
     def handle_input(self, user_input):
         """Processa os comandos digitados pelo usuário."""
@@ -143,11 +257,32 @@ class StoryGameClient(rpyc.Service):
             if user_input.lower().startswith("chat "):
                 message = user_input[5:].strip()
                 if message:
-                    self.game_service.exposed_send_chat_message(self.username, message)
+                    success, msg = self.run_commands(("chat", message))
+                    if not success:
+                        with self.display_lock:
+                            print(f"\n[SISTEMA] {msg}") # ex.: limite de mensagens
+                            time.sleep(1.5)
             
+            elif user_input.lower() == "historico":
+                if not self.load_older_chat():
+                    with self.display_lock:
+                        print("\n[SISTEMA] Não há mensagens mais antigas.")
+                        time.sleep(1.5)
+
+            elif user_input.lower() == "salas":
+                rooms = json.loads(self.game_service.exposed_list_rooms())
+                with self.display_lock:
+                    print("\n[SISTEMA] Salas:")
+                    for room in rooms:
+                        print(f"  {room['room_id']}: página {room['page_id']}, {room['current_players']} jogador(es) conectado(s)")
+                    input("Pressione Enter para voltar.")
+
+            elif user_input.lower().startswith("sala "):
+                self.switch_room(user_input[5:].strip())
+
             elif user_input.lower() == "avancar":
                 # A função do servidor agora retorna uma msg de status
-                success, msg = self.game_service.exposed_check_and_advance_page(self.username)
+                success, msg = self.run_commands(("advance",))
                 if not success:
                     with self.display_lock:
                         # Exibe a msg (ex: "Aguardando Winicius...")
@@ -156,9 +291,14 @@ class StoryGameClient(rpyc.Service):
 
             elif user_input: # Ignora 'Enter' vazio
                 try:
-                    choice_index = int(user_input) - 1
+                    # "2!" vota na opção 2 e já tenta avançar, na mesma ida e volta
+                    advance = user_input.endswith("!")
+                    choice_index = int(user_input.rstrip("!")) - 1
                     if self.current_page_data and 0 <= choice_index < len(self.current_page_data["choices"]):
-                        success, msg = self.game_service.exposed_vote(self.username, choice_index)
+                        commands = [("vote", choice_index)]
+                        if advance:
+                            commands.append(("advance",))
+                        success, msg = self.run_commands(*commands)
                         if not success:
                             with self.display_lock:
                                 print(f"\n[SISTEMA] {msg}")
@@ -169,7 +309,7 @@ class StoryGameClient(rpyc.Service):
                             time.sleep(1.5)
                 except ValueError:
                     with self.display_lock:
-                        print(f"\n[SISTEMA] Comando inválido. Digite um número, 'chat <mensagem>' ou 'avancar'.")
+                        print(f"\n[SISTEMA] Comando inválido. Digite um número (com ! para já avançar), 'chat <mensagem>', 'historico', 'salas', 'sala <id>' ou 'avancar'.")
                         time.sleep(1.5)
             
             # Se o input for vazio (só Enter), o loop vai rodar e atualizar a tela
@@ -179,6 +319,32 @@ class StoryGameClient(rpyc.Service):
                 print("\nConexão com o servidor perdida.")
             os._exit(1)
 
+    def switch_room(self, room_id):
+        """Entra em outra sala (criando se preciso) e descarta o estado local da sala anterior."""
+        if not room_id:
+            return
+        success, msg = self.game_service.exposed_join_room(room_id)
+        with self.display_lock:
+            if success:
+                self._reset_room_state(room_id)
+                self.fetch_round_deadline()
+            print(f"\n[SISTEMA] {msg}")
+            time.sleep(1.5)
+
+    def _reset_room_state(self, room_id):
+        """Esquece o estado local da sala anterior; a próxima sincronização traz tudo da nova."""
+        with self.display_lock:
+            self.room_id = room_id
+            self.state_versions = None
+            self.current_page_id = None
+            self.current_page_data = None
+            self.chat_messages = []
+            self.chat_first_seq = None
+            self.votes = {}
+            self.vote_tally = []
+            self.round_deadline = None
+            self.audience = None
+
     def input_loop(self):
         """Loop principal do jogo: Atualiza a tela, pede input, processa."""
         while True:
@@ -198,11 +364,12 @@ class StoryGameClient(rpyc.Service):
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Uso: python3 client.py <seu_nome_de_usuario>")
+        print("Uso: python3 client.py <seu_nome_de_usuario> [sala]")
         sys.exit(1)
 
     username = sys.argv[1]
-    client = StoryGameClient(username)
+    room_id = sys.argv[2] if len(sys.argv) > 2 else None
+    client = StoryGameClient(username, room_id)
     if client.connect_to_server():
         client.input_loop()
 
@@ -0,0 +1,424 @@
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+
+import rpyc
+from rpyc.utils.helpers import classpartial
+
+from push import PUSH_CALLBACKS, SLOW_POLICY_DROP
+from rooms import DEFAULT_ROOM_ID, CHAT_CAPACITY, CHAT_BROADCAST_INTERVAL
+from server import StoryGameService, SERVICE_USERNAME, serve, check_story
+from story_bundle import open_story
+from image_cache import IMAGE_CACHE_DIR
+from journal import FSYNC_BATCH
+from chat_archive import SEGMENT_BYTES
+from heartbeat import HeartbeatMonitor, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, HEARTBEAT_MISSES
+from rate_limit import CHAT_RATE, CHAT_BURST, ROOM_CHAT_RATE, ROOM_CHAT_BURST
+
+# RPCs de jogo que o roteador repassa ao worker dono da sala
+FORWARDED_RPCS = (
+    "get_atomic_game_state", "get_state_since", "get_chat_page", "get_current_page",
+    "get_chat_messages", "get_votes", "send_chat_message", "vote", "check_and_advance_page",
+    "get_story_analysis", "get_page_image", "get_metrics", "get_encodings", "get_state_since_compact",
+    "execute_batch", "get_round_deadline", "get_audience", "audience_vote", "audience_votes", "get_chat_range",
+)
+
+
+def rendezvous_score(room_id, worker_index):
+    digest = hashlib.md5(f"{room_id}:{worker_index}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+class WorkerInfo:
+    def __init__(self, index, host, port, process):
+        self.index = index
+        self.host = host
+        self.port = port
+        self.process = process
+        self.alive = True
+
+
+class WorkerPool:
+    """
+    Processos worker, cada um com um servidor do jogo completo (server.serve)
+    numa porta local. As salas são divididas entre eles por rendezvous hashing:
+    o dono de uma sala é o worker vivo com maior hash(sala, worker), então
+    quando um worker morre só as salas dele mudam de dono.
+
+    Com journal, cada worker grava em journal_dir/worker<i> e recupera as
+    suas salas quando o cluster é reiniciado. Mas o novo dono das salas de um
+    worker que morre não lê o journal dele: elas recomeçam do início. O
+    arquivo do chat também fica separado por worker, em chat_archive_dir/worker<i>.
+    Com metrics_port, o worker i serve as métricas em metrics_port + i.
+    """
+    def __init__(self, count, host="127.0.0.1", base_port=18900, check_interval=1.0, **serve_kwargs):
+        if count < 1:
+            raise ValueError("O cluster precisa de pelo menos um worker.")
+        self.host = host
+        self.base_port = base_port
+        self.check_interval = check_interval
+        self.serve_kwargs = serve_kwargs
+        self.workers = []
+        self.controls = {} # índice do worker -> conexão de controle (compartilhada por todos os jogadores)
+        self.listeners = [] # funções chamadas com o WorkerInfo quando um worker morre
+        self.lock = threading.Lock()
+        self.count = count
+        self.stopped = threading.Event()
+
+    def start(self, timeout=10.0):
+        for index in range(self.count):
+            port = self.base_port + index
+            kwargs = dict(self.serve_kwargs, hostname=self.host, port=port)
+            if kwargs.get("journal_dir"):
+                # Cada worker tem o seu journal (só um processo escreve em cada diretório)
+                kwargs["journal_dir"] = os.path.join(kwargs["journal_dir"], f"worker{index}")
+            if kwargs.get("chat_archive_dir"):
+                kwargs["chat_archive_dir"] = os.path.join(kwargs["chat_archive_dir"], f"worker{index}")
+            if kwargs.get("metrics_port"):
+                kwargs["metrics_port"] += index
+            process = multiprocessing.Process(
+                target=serve, kwargs=kwargs,
+                name=f"story-worker-{index}", daemon=True)
+            process.start()
+            self.workers.append(WorkerInfo(index, self.host, port, process))
+        for worker in self.workers:
+            self._wait_until_listening(worker, timeout)
+        threading.Thread(target=self._monitor_loop, name="worker-monitor", daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+        for worker in self.workers:
+            worker.alive = False
+            worker.process.terminate()
+        for worker in self.workers:
+            worker.process.join()
+
+    def alive_workers(self):
+        return [worker for worker in self.workers if worker.alive]
+
+    def owner(self, room_id):
+        """Worker vivo responsável pela sala."""
+        alive = self.alive_workers()
+        if not alive:
+            raise RuntimeError("Nenhum worker do cluster está vivo.")
+        return max(alive, key=lambda worker: rendezvous_score(room_id, worker.index))
+
+    def control(self, worker):
+        """Conexão de controle com o worker, para chamadas que não são de um jogador da sala."""
+        with self.lock:
+            conn = self.controls.get(worker.index)
+            if conn is None or conn.closed:
+                conn = rpyc.connect(worker.host, worker.port, service=_ControlService)
+                # responde o get_username do on_connect do worker
+                threading.Thread(target=conn.serve_all, name=f"control-{worker.index}", daemon=True).start()
+                self.controls[worker.index] = conn
+            return conn
+
+    def _wait_until_listening(self, worker, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.control(worker)
+                return
+            except OSError:
+                if time.monotonic() > deadline or not worker.process.is_alive():
+                    raise RuntimeError(f"Worker {worker.index} não subiu na porta {worker.port}.")
+                time.sleep(0.05)
+
+    def check_workers(self):
+        for worker in self.workers:
+            if worker.alive and not worker.process.is_alive():
+                self._worker_died(worker)
+
+    def _monitor_loop(self):
+        while not self.stopped.wait(self.check_interval):
+            self.check_workers()
+
+    def _worker_died(self, worker):
+        with self.lock:
+            if not worker.alive:
+                return
+            worker.alive = False
+            conn = self.controls.pop(worker.index, None)
+        if conn is not None:
+            conn.close()
+        print(f"Worker {worker.index} (porta {worker.port}) morreu; as salas dele vão para os outros workers.")
+        for listener in list(self.listeners):
+            try:
+                listener(worker)
+            except Exception as e:
+                print(f"Erro ao redistribuir salas do worker {worker.index}: {e}")
+
+
+class _ControlService(rpyc.Service):
+    """Lado cliente da conexão de controle roteador -> worker."""
+    def exposed_get_username(self):
+        return SERVICE_USERNAME
+
+
+class _UpstreamService(rpyc.Service):
+    """
+    Lado "cliente" da conexão roteador -> worker de um jogador: responde o
+    handshake (get_username e get_room_id) em nome dele e repassa os
+    callbacks de push.
+    """
+    def __init__(self, session, room_id):
+        self.session = session
+        self.room_id = room_id
+
+    def exposed_get_username(self):
+        return self.session.username
+
+    def exposed_get_room_id(self):
+        return self.room_id
+
+
+def _forward_push(kind):
+    def callback(self, *args):
+        remote = self.session.callbacks.get(kind)
+        if remote is not None:
+            # Não espera o cliente: o timeout e a política de lentidão são do worker
+            rpyc.async_(remote)(*args)
+    callback.__name__ = "exposed_" + kind
+    return callback
+
+
+for _kind in PUSH_CALLBACKS:
+    setattr(_UpstreamService, "exposed_" + _kind, _forward_push(_kind))
+
+
+class RouterService(rpyc.Service):
+    """
+    Serviço que os clientes enxergam no modo cluster. Tem a mesma API do
+    StoryGameService, mas não guarda estado de jogo: repassa cada chamada ao
+    worker dono da sala.
+
+    Cada jogador tem uma conexão própria (home) com o worker da sala em que
+    está, pela qual ele é membro da sala e recebe os push. Chamadas com
+    room_id de uma sala de outro worker vão pela conexão de controle
+    compartilhada com aquele worker (como no servidor único, ler ou votar
+    em outra sala não faz o jogador entrar nela).
+
+    Com `heartbeat`, o roteador vigia as conexões dos jogadores: expulsar uma
+    fecha as conexões dela com os workers, que tiram o jogador da sala.
+    """
+    def __init__(self, pool, sessions, heartbeat=None):
+        self.pool = pool
+        self.sessions = sessions
+        self.heartbeat = heartbeat
+        self.conn = None
+        self.username = None
+        self.callbacks = {}
+        self.room_id = DEFAULT_ROOM_ID
+        self.home = None # (worker, conexão, thread que atende os callbacks)
+        self.watched = set() # salas observadas (só conexões de serviço, ver watch_room)
+        self.watch_upstreams = {} # índice do worker -> (worker, conexão, thread) usada pelo watch_room
+        self.lock = threading.Lock()
+
+    def on_connect(self, conn):
+        try:
+            username = conn.root.get_username()
+            if not username:
+                raise ValueError("Cliente não retornou um username.")
+            for name in PUSH_CALLBACKS:
+                if hasattr(conn.root, name):
+                    self.callbacks[name] = getattr(conn.root, name)
+            if hasattr(conn.root, "get_room_id"):
+                # Sala inicial do handshake: a conexão home já abre nela
+                self.room_id = conn.root.get_room_id() or self.room_id
+            self.conn = conn
+            self.username = username
+            self._home()
+            self.sessions.add(self)
+            if self.heartbeat is not None:
+                self.heartbeat.add(conn)
+            print(f"Cliente conectado ao roteador: {username} (sala {self.room_id})")
+        except Exception as e:
+            print(f"Falha na conexão do cliente: {e}")
+            conn.close()
+
+    def on_disconnect(self, conn):
+        self.sessions.discard(self)
+        if self.heartbeat is not None:
+            self.heartbeat.discard(conn)
+        with self.lock:
+            home, self.home = self.home, None
+            upstreams = list(self.watch_upstreams.values())
+            self.watch_upstreams = {}
+        for _worker, upstream, _thread in ([home] if home else []) + upstreams:
+            upstream.close()
+
+    # --- Conexões com os workers ---
+
+    def _open_upstream(self, worker, room_id, create=True):
+        """
+        Abre uma conexão deste jogador com o worker, já na sala dada: a sala vai
+        no handshake, então o worker coloca o jogador nela uma única vez.
+        """
+        if not create and not any(room["room_id"] == room_id
+                                  for room in json.loads(self.pool.control(worker).root.list_rooms())):
+            return None, False, f"Sala '{room_id}' não existe."
+        upstream = rpyc.connect(worker.host, worker.port, service=classpartial(_UpstreamService, self, room_id))
+        thread = threading.Thread(target=upstream.serve_all, daemon=True)
+        thread.start()
+        return (worker, upstream, thread), True, f"Você entrou na sala {room_id}."
+
+    def _home(self):
+        """Conexão do jogador com o worker que hoje é dono da sala dele (reabre se o dono mudou)."""
+        worker = self.pool.owner(self.room_id)
+        with self.lock:
+            home = self.home
+            if home is not None and home[0] is worker and not home[1].closed:
+                return home[1]
+            self.home, _ok, _msg = self._open_upstream(worker, self.room_id)
+        if home is not None:
+            home[1].close()
+        return self.home[1]
+
+    def _conn_for(self, room_id):
+        if self.username is None:
+            # Chamada feita enquanto o on_connect ainda espera o get_username: ainda
+            # não há conexão própria, mas as ações recebem o username explicitamente
+            return self.pool.control(self.pool.owner(room_id or self.room_id))
+        if room_id is None or room_id == self.room_id:
+            return self._home()
+        worker = self.pool.owner(room_id)
+        if worker is self.pool.owner(self.room_id):
+            return self._home()
+        return self.pool.control(worker)
+
+    def _worker_died(self, worker):
+        home = self.home
+        if home is not None and home[0] is worker:
+            # Reconecta já (e não na próxima chamada) para o jogador voltar a receber push
+            self._home()
+        if self.watch_upstreams.pop(worker.index, None) is not None:
+            # Observar de novo é idempotente: as salas do worker morto passam a ser observadas no novo dono
+            for room_id in list(self.watched):
+                self.exposed_watch_room(room_id)
+
+    # --- Salas ---
+
+    def exposed_list_rooms(self):
+        rooms = []
+        for worker in self.pool.alive_workers():
+            for room in json.loads(self.pool.control(worker).root.list_rooms()):
+                # Todo worker tem sua própria sala padrão; só vale a do dono
+                if self.pool.owner(room["room_id"]) is worker:
+                    rooms.append(room)
+        return json.dumps(rooms)
+
+    def exposed_create_room(self, room_id=None):
+        if room_id is None:
+            # Id aleatório escolhido aqui para a sala já nascer no worker dono
+            room_id = uuid.uuid4().hex[:8]
+        return self.pool.control(self.pool.owner(room_id)).root.create_room(room_id)
+
+    def exposed_watch_room(self, room_id):
+        """Repassa o watch_room por uma conexão desta sessão com o worker dono (os push voltam por ela)."""
+        worker = self.pool.owner(room_id)
+        with self.lock:
+            entry = self.watch_upstreams.get(worker.index)
+            if entry is None or entry[1].closed:
+                entry, _ok, _msg = self._open_upstream(worker, DEFAULT_ROOM_ID)
+                self.watch_upstreams[worker.index] = entry
+        ok, msg = entry[1].root.watch_room(room_id)
+        if ok:
+            self.watched.add(room_id)
+        return ok, msg
+
+    def exposed_join_room(self, room_id, create=True):
+        if room_id == self.room_id:
+            return True, f"Você já está na sala {room_id}."
+        if self.username is None:
+            # O on_connect ainda está esperando o get_username: só troca a sala inicial
+            self.room_id = room_id
+            return True, f"Você entrou na sala {room_id}."
+        worker = self.pool.owner(room_id)
+        if worker is self.pool.owner(self.room_id):
+            ok, msg = self._home().root.join_room(room_id, create)
+            if ok:
+                self.room_id = room_id
+            return ok, msg
+
+        # A sala é de outro worker: entra lá e sai da antiga fechando a conexão antiga
+        new_home, ok, msg = self._open_upstream(worker, room_id, create)
+        if ok:
+            with self.lock:
+                old_home, self.home = self.home, new_home
+                self.room_id = room_id
+            if old_home is not None:
+                old_home[1].close()
+        return ok, msg
+
+
+def _forward_rpc(name):
+    signature = inspect.signature(getattr(StoryGameService, "exposed_" + name))
+
+    def method(self, *args, **kwargs):
+        room_id = signature.bind(self, *args, **kwargs).arguments.get("room_id")
+        try:
+            return getattr(self._conn_for(room_id).root, name)(*args, **kwargs)
+        except EOFError:
+            # O worker caiu antes do monitor perceber: confere agora e tenta de novo no novo dono
+            self.pool.check_workers()
+            return getattr(self._conn_for(room_id).root, name)(*args, **kwargs)
+    method.__name__ = "exposed_" + name
+    method.__doc__ = f"Repassa {name} ao worker dono da sala."
+    return method
+
+
+for _name in FORWARDED_RPCS:
+    setattr(RouterService, "exposed_" + _name, _forward_rpc(_name))
+
+
+def make_router(pool, hostname="0.0.0.0", port=18861, heartbeat=None):
+    """ThreadedServer do roteador, já redistribuindo os jogadores quando um worker morre."""
+    from rpyc.utils.server import ThreadedServer
+
+    sessions = set()
+
+    def reassign(worker):
+        for session in list(sessions):
+            session._worker_died(worker)
+    pool.listeners.append(reassign)
+    return ThreadedServer(classpartial(RouterService, pool, sessions, heartbeat), hostname=hostname, port=port)
+
+
+def serve_cluster(workers, hostname="0.0.0.0", port=18861, worker_base_port=18900,
+                  push_workers=4, slow_policy=SLOW_POLICY_DROP, chat_capacity=CHAT_CAPACITY, story_path=None,
+                  image_cache_dir=IMAGE_CACHE_DIR, image_cache_mb=200, journal_dir=None, journal_fsync=FSYNC_BATCH,
+                  metrics_port=None, vote_timeout=None, ready_timeout=None, audience_weight=0.0,
+                  chat_archive_dir=None, chat_segment_bytes=SEGMENT_BYTES, chat_rate=CHAT_RATE,
+                  chat_burst=CHAT_BURST, room_chat_rate=ROOM_CHAT_RATE, room_chat_burst=ROOM_CHAT_BURST,
+                  chat_broadcast_interval=CHAT_BROADCAST_INTERVAL, heartbeat_interval=HEARTBEAT_INTERVAL,
+                  heartbeat_timeout=HEARTBEAT_TIMEOUT, heartbeat_misses=HEARTBEAT_MISSES):
+    """
+    Sobe os workers e o roteador na porta pública (bloqueia até o roteador parar).
+    O heartbeat dos jogadores roda no roteador; nos workers ele vigia as conexões do roteador.
+    """
+    # Valida a história uma vez aqui, antes de subir os workers (InvalidStory)
+    check_story(open_story(story_path or "story_data"))
+    pool = WorkerPool(workers, base_port=worker_base_port, push_workers=push_workers,
+                      slow_policy=slow_policy, chat_capacity=chat_capacity, story_path=story_path,
+                      image_cache_dir=image_cache_dir, image_cache_mb=image_cache_mb,
+                      journal_dir=journal_dir, journal_fsync=journal_fsync, metrics_port=metrics_port,
+                      vote_timeout=vote_timeout, ready_timeout=ready_timeout, audience_weight=audience_weight,
+                      chat_archive_dir=chat_archive_dir, chat_segment_bytes=chat_segment_bytes,
+                      chat_rate=chat_rate, chat_burst=chat_burst, room_chat_rate=room_chat_rate,
+                      room_chat_burst=room_chat_burst, chat_broadcast_interval=chat_broadcast_interval,
+                      heartbeat_interval=heartbeat_interval, heartbeat_timeout=heartbeat_timeout,
+                      heartbeat_misses=heartbeat_misses)
+    pool.start()
+    heartbeat = HeartbeatMonitor(heartbeat_interval, heartbeat_timeout, heartbeat_misses).start() if heartbeat_interval else None
+    try:
+        make_router(pool, hostname, port, heartbeat).start()
+    finally:
+        if heartbeat is not None:
+            heartbeat.stop()
+        pool.stop()
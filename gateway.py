@@ -0,0 +1,236 @@
+"""
+Gateway asyncio: o mesmo jogo do server.py, mas com todas as conexões num
+único event loop em vez de uma thread por jogador. Serve para muitos
+jogadores conectados ao mesmo tempo, quase sempre parados.
+
+Protocolo (TCP): cada mensagem é um JSON em UTF-8 precedido do tamanho em
+4 bytes (big-endian).
+
+    cliente -> {"op": "hello", "username": "ana", "room_id": "principal"}
+    gateway -> {"ok": true}
+    (espectador: {"op": "hello", "username": "ana", "room_id": "principal", "spectator": true};
+    recebe os push da sala sem ser jogador e só tem as operações de SPECTATOR_OPS)
+    cliente -> {"id": 1, "op": "vote", "args": ["ana", 0]}
+    gateway -> {"id": 1, "result": [true, "Voto registrado."]}
+    gateway -> {"push": "on_vote_update", "args": [...]}
+
+As operações e seus argumentos (lista posicional ou dict nomeado) são os
+mesmos RPCs do StoryGameService, sem o prefixo exposed_; os resultados
+também (tuplas viram listas). Erros voltam como {"id": n, "error": "..."}.
+"""
+import asyncio
+import json
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from push import PUSH_CALLBACKS
+from server import StoryGameService, SERVICE_USERNAME
+
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 1 << 20
+# Acima disso (bytes ainda não enviados) o push conta como entrega lenta
+MAX_WRITE_BUFFER = 256 * 1024
+# Threads que executam os RPCs (podem esperar o lock da sala, o fsync do journal, o disco)
+RPC_WORKERS = 32
+
+GATEWAY_OPS = frozenset((
+    "list_rooms", "create_room", "join_room",
+    "get_atomic_game_state", "get_state_since", "get_chat_page", "get_chat_range", "get_current_page",
+    "get_chat_messages", "get_votes", "get_round_deadline", "get_story_analysis",
+    "send_chat_message", "vote", "check_and_advance_page", "execute_batch",
+    "get_audience", "audience_vote", "audience_votes",
+))
+SPECTATOR_OPS = frozenset((
+    "list_rooms", "get_atomic_game_state", "get_state_since", "get_chat_page", "get_chat_range", "get_current_page",
+    "get_chat_messages", "get_votes", "get_round_deadline", "get_audience", "audience_vote", "audience_votes",
+))
+
+
+def encode_frame(message):
+    data = json.dumps(message).encode("utf-8")
+    return FRAME_HEADER.pack(len(data)) + data
+
+
+class ClientLagging(Exception):
+    pass
+
+
+class GatewayConnection(asyncio.Protocol):
+    """
+    Uma conexão de jogador. Os RPCs rodam no executor do loop (podem
+    bloquear: lock da sala, fsync do journal, leitura do arquivo do chat), um
+    de cada vez e na ordem em que chegaram; o loop só lê e escreve frames.
+    Os push chegam das threads do PushDispatcher e são passados ao loop com
+    call_soon_threadsafe.
+    """
+    def __init__(self, registry, loop):
+        self.registry = registry
+        self.loop = loop
+        self.transport = None
+        self.buffer = bytearray()
+        self.service = None # StoryGameService desta conexão, criado no hello
+        self.ops = GATEWAY_OPS # SPECTATOR_OPS para espectadores
+        self.greeted = False # hello recebido (o service só existe depois que ele é processado)
+        self.last_call = None # task da última requisição: a próxima espera por ela
+        self.closed = False
+
+    def __repr__(self):
+        peer = self.transport.get_extra_info("peername") if self.transport else None
+        return f"<GatewayConnection {peer}>"
+
+    # --- asyncio.Protocol ---
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        while len(self.buffer) >= FRAME_HEADER.size:
+            (size,) = FRAME_HEADER.unpack_from(self.buffer)
+            if size > MAX_FRAME_SIZE:
+                self._fail("Mensagem grande demais.")
+                return
+            end = FRAME_HEADER.size + size
+            if len(self.buffer) < end:
+                return
+            payload = bytes(self.buffer[FRAME_HEADER.size:end])
+            del self.buffer[:end]
+            try:
+                message = json.loads(payload)
+            except ValueError:
+                self._fail("JSON inválido.")
+                return
+            if not isinstance(message, dict):
+                self._fail("Mensagem deve ser um objeto JSON.")
+                return
+            self._handle(message)
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self._enqueue(self._disconnect)
+
+    def _disconnect(self):
+        if self.service is not None and self.service.conn is not None:
+            self.service.on_disconnect(self)
+
+    # --- Requisições ---
+
+    def _handle(self, message):
+        op = message.get("op")
+        if not self.greeted:
+            if op != "hello":
+                self._fail("A primeira mensagem deve ser hello.")
+                return
+            self.greeted = True
+            self._enqueue(self._hello, message)
+            return
+        self._enqueue(self._request, message.get("id"), op, message.get("args", []))
+
+    def _enqueue(self, fn, *args):
+        """Roda fn(*args) no executor depois da requisição anterior; o que ela retornar é enviado ao cliente."""
+        self.last_call = self.loop.create_task(self._call(self.last_call, partial(fn, *args)))
+
+    async def _call(self, previous, fn):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            reply = await self.loop.run_in_executor(None, fn)
+        except Exception as e:
+            print(f"Erro no gateway: {e}")
+            self._fail("Erro interno.")
+            return
+        if isinstance(reply, dict) and "error" in reply:
+            self._fail(reply["error"]) # hello recusado
+        elif reply is not None:
+            self.send(reply)
+
+    def _request(self, request_id, op, args):
+        """Executa um RPC (no executor) e retorna o frame da resposta, já codificado."""
+        try:
+            if op not in self.ops:
+                raise ValueError(f"Operação desconhecida: {op}")
+            method = getattr(self.service, "exposed_" + op)
+            result = method(**args) if isinstance(args, dict) else method(*args)
+            # Codificado aqui: um resultado que não vira JSON também volta como erro
+            return encode_frame({"id": request_id, "result": result})
+        except Exception as e:
+            return encode_frame({"id": request_id, "error": str(e)})
+
+    def _hello(self, message):
+        """Coloca a conexão na sala (no executor); retorna a resposta do hello."""
+        username = message.get("username")
+        if not username or not isinstance(username, str) or username == SERVICE_USERNAME:
+            return {"error": "Username inválido."}
+        service = StoryGameService(self.registry)
+        room_id = message.get("room_id")
+        if message.get("spectator"):
+            self.service = service
+            self.ops = SPECTATOR_OPS
+            self.registry.push.register(self, callbacks=self._push_callbacks())
+            service.spectate(self, room_id)
+            return {"ok": True}
+        if room_id:
+            # Antes do attach o join_room só escolhe a sala inicial
+            ok, msg = service.exposed_join_room(room_id)
+            if not ok:
+                return {"error": msg}
+        self.service = service
+        self.registry.push.register(self, callbacks=self._push_callbacks())
+        service.attach(self, username)
+        return {"ok": True}
+
+    def send(self, message):
+        """Envia uma mensagem (dict, ou frame já codificado). Só na thread do loop."""
+        if not self.closed:
+            self.transport.write(message if isinstance(message, bytes) else encode_frame(message))
+
+    def _fail(self, error):
+        self.send({"error": error})
+        self.close()
+
+    def close(self):
+        """Pode ser chamado de qualquer thread (ex.: política de cliente lento do push)."""
+        self.loop.call_soon_threadsafe(self._close)
+
+    def _close(self):
+        if not self.closed:
+            self.closed = True
+            self.transport.close()
+
+    # --- Push ---
+
+    def _push_callbacks(self):
+        return {kind: self._push_callback(kind) for kind in PUSH_CALLBACKS}
+
+    def _push_callback(self, kind):
+        def callback(*args):
+            if self.closed:
+                return
+            if self.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                raise ClientLagging(f"{self.transport.get_write_buffer_size()} bytes esperando envio")
+            frame = encode_frame({"push": kind, "args": args})
+            self.loop.call_soon_threadsafe(self._write_push, frame)
+        return callback
+
+    def _write_push(self, frame):
+        if not self.closed:
+            self.transport.write(frame)
+
+
+async def run_gateway(registry, hostname="0.0.0.0", port=18862):
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(RPC_WORKERS, thread_name_prefix="gateway-rpc"))
+    server = await loop.create_server(lambda: GatewayConnection(registry, loop), hostname, port, backlog=1024)
+    print(f"Gateway asyncio ouvindo em {hostname}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def start_gateway_thread(registry, hostname="0.0.0.0", port=18862):
+    """Roda o gateway numa thread própria, ao lado do ThreadedServer do RPyC."""
+    thread = threading.Thread(target=asyncio.run, args=(run_gateway(registry, hostname, port),),
+                              name="gateway", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,164 @@
+"""
+Detecção de clientes mortos por heartbeat.
+
+Uma conexão RPyC cujo cliente travou (ou sumiu atrás da VPN) sem fechar o
+TCP continua aberta para sempre: o jogador segue na sala como ativo, sendo
+exigido para avançar, e cada push para ele espera o delivery_timeout.
+
+O HeartbeatMonitor manda, a cada `interval` segundos, um ping do protocolo
+RPyC para todas as conexões de uma vez (sem esperar uma para mandar a
+próxima) e espera as respostas por até `timeout` segundos. Quem falhar
+`misses` pings seguidos é expulso: o socket é derrubado (shutdown), a
+thread da conexão recebe EOF e o on_disconnect normal do serviço tira o
+jogador da sala e dos push.
+
+O envio também tem prazo: cada socket vigiado ganha um timeout de envio
+(SO_SNDTIMEO) de timeout * misses segundos. Sem ele, um cliente que parou
+de ler enche o buffer do socket e o send do ping (ou de um push) bloqueia
+para sempre, travando a rodada de pings de todo mundo. Com ele, o send
+falha, o RPyC fecha a conexão e o monitor a expulsa.
+"""
+import socket
+import struct
+import sys
+import threading
+
+from rpyc.core import consts
+from rpyc.core.async_ import AsyncResultTimeout
+
+from metrics import METRICS
+
+HEARTBEAT_INTERVAL = 3.0 # segundos entre rodadas de ping
+HEARTBEAT_TIMEOUT = 2.0  # segundos esperando a resposta de cada ping
+HEARTBEAT_MISSES = 2     # pings seguidos sem resposta até expulsar a conexão
+PING_DATA = "ping"
+
+HEARTBEAT_MISSED = METRICS.counter("story_heartbeat_misses_total", "Pings de heartbeat sem resposta no prazo").labels()
+HEARTBEAT_EVICTIONS = METRICS.counter("story_heartbeat_evictions_total",
+                                      "Conexões expulsas por não responder ao heartbeat").labels()
+
+
+class WatchedConnection:
+    __slots__ = ("sock", "misses")
+
+    def __init__(self, sock):
+        self.sock = sock # cópia (dup) do socket: continua válida mesmo depois que o RPyC fecha o dele
+        self.misses = 0  # pings seguidos sem resposta
+
+
+class HeartbeatMonitor:
+    def __init__(self, interval=HEARTBEAT_INTERVAL, timeout=HEARTBEAT_TIMEOUT, misses=HEARTBEAT_MISSES):
+        self.interval = interval
+        self.timeout = timeout
+        self.misses = max(misses, 1)
+        self.connections = {} # conn -> WatchedConnection
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="heartbeat", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def add(self, conn):
+        try:
+            sock = self._watch_socket(conn)
+        except (OSError, EOFError, ValueError) as e:
+            if not conn.closed:
+                print(f"Aviso: o heartbeat não vai vigiar a conexão {conn}: {e}")
+            return
+        with self.lock:
+            old = self.connections.pop(conn, None)
+            self.connections[conn] = WatchedConnection(sock)
+        if old is not None:
+            old.sock.close()
+
+    def discard(self, conn):
+        with self.lock:
+            watched = self.connections.pop(conn, None)
+        if watched is not None:
+            watched.sock.close()
+
+    def check(self):
+        """Uma rodada de pings; retorna as conexões expulsas."""
+        with self.lock:
+            conns = list(self.connections)
+        pings = []
+        evicted = []
+        for conn in conns:
+            try:
+                pings.append((conn, conn.async_request(consts.HANDLE_PING, PING_DATA, timeout=self.timeout)))
+            except Exception:
+                # Fechada, ou o send estourou o prazo (e o RPyC fechou o stream): a
+                # thread da conexão pode continuar presa no recv, então derruba o socket
+                if self._evict(conn, "envio do ping falhou"):
+                    evicted.append(conn)
+        for conn, result in pings:
+            try:
+                result.wait() # os pings foram todos enviados juntos: a rodada leva no máximo ~timeout
+                alive = result.value == PING_DATA
+            except AsyncResultTimeout:
+                alive = False
+            except Exception:
+                if self._evict(conn, "conexão fechada durante o ping"):
+                    evicted.append(conn)
+                continue
+            with self.lock:
+                watched = self.connections.get(conn)
+                if watched is None:
+                    continue
+                if alive:
+                    watched.misses = 0
+                    continue
+                HEARTBEAT_MISSED.inc()
+                watched.misses += 1
+                if watched.misses < self.misses:
+                    continue
+            if self._evict(conn, f"sem resposta a {self.misses} heartbeat(s) seguidos"):
+                evicted.append(conn)
+        return evicted
+
+    def _watch_socket(self, conn):
+        """
+        Liga o timeout de envio no socket da conexão e retorna uma cópia dele.
+        socket.dup funciona também no Windows (onde os.dup não aceita sockets).
+        """
+        original = socket.socket(fileno=conn.fileno())
+        try:
+            send_timeout = self.timeout * self.misses
+            if sys.platform == "win32":
+                value = int(send_timeout * 1000) # DWORD em milissegundos
+            else:
+                seconds = int(send_timeout)
+                value = struct.pack("ll", seconds, int((send_timeout - seconds) * 1e6)) # struct timeval
+            original.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, value)
+            return original.dup()
+        finally:
+            original.detach() # o socket original continua sendo do RPyC
+
+    def _evict(self, conn, reason):
+        """Derruba a conexão; retorna False se ela já tinha saído (on_disconnect chegou antes)."""
+        with self.lock:
+            watched = self.connections.pop(conn, None)
+        if watched is None:
+            return False
+        print(f"Conexão removida ({reason}): {conn}")
+        HEARTBEAT_EVICTIONS.inc()
+        try:
+            # shutdown (e não close) não bloqueia num socket travado e acorda a
+            # thread que atende a conexão, que então roda o on_disconnect
+            watched.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        watched.sock.close()
+        return True
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Erro no monitor de heartbeat: {e}")
@@ -0,0 +1,212 @@
+"""
+Cache local das imagens das cenas. O servidor baixa a imagem de cada página
+uma vez, reduz (Pillow) para o tamanho de exibição e guarda em disco pelo
+hash do conteúdo; os clientes recebem esses bytes pelo RPC get_page_image em
+vez de cada navegador baixar a foto original.
+
+Quando uma página vira a atual, as imagens das páginas seguintes
+(choices[*].next_page) são baixadas em segundo plano, então a troca de
+página normalmente já encontra a imagem pronta.
+
+Estrutura do diretório:
+    blobs/ab/abcdef....jpg   imagem reduzida, nomeada pelo sha256 dos bytes
+    urls/<sha256 da URL>     o hash do blob daquela URL
+"""
+import hashlib
+import io
+import os
+import threading
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+IMAGE_CACHE_DIR = "image_cache"
+IMAGE_CACHE_MAX_BYTES = 200 * 1024 * 1024
+MAX_IMAGE_SIZE = (960, 640) # largura e altura máximas depois de reduzir
+JPEG_QUALITY = 80
+DOWNLOAD_TIMEOUT = 15.0 # segundos
+PREFETCH_WORKERS = 4
+USER_AGENT = "adventure-game-image-cache/1.0"
+
+
+class ImageCache:
+    """
+    Cache endereçado por conteúdo com limite de tamanho em disco (LRU).
+    Downloads da mesma URL ao mesmo tempo são feitos uma vez só.
+    """
+    def __init__(self, directory=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES, max_size=MAX_IMAGE_SIZE,
+                 quality=JPEG_QUALITY, workers=PREFETCH_WORKERS, timeout=DOWNLOAD_TIMEOUT):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_size = max_size
+        self.quality = quality
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.blobs = OrderedDict() # digest -> tamanho em bytes, do menos para o mais usado
+        self.total_bytes = 0
+        self.urls = {} # url -> digest já conhecido (evita ler urls/ a cada acesso)
+        self.pending = {} # url -> Future do download em andamento
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-fetch")
+        os.makedirs(os.path.join(directory, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "urls"), exist_ok=True)
+        self._load()
+
+    # --- API ---
+
+    def get(self, url, timeout=None):
+        """Bytes da imagem reduzida (baixando se preciso), ou None se o download falhou."""
+        for _attempt in range(2):
+            path = self.path(url, timeout)
+            if path is None:
+                return None
+            try:
+                with open(path, "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                # Removida por outro processo usando o mesmo diretório (workers do cluster): baixa de novo
+                self._forget(url)
+        return None
+
+    def path(self, url, timeout=None):
+        """Caminho do arquivo em cache (baixando se preciso), ou None se o download falhou."""
+        digest = self._lookup(url)
+        if digest is None:
+            try:
+                digest = self._fetch_async(url).result(timeout if timeout is not None else self.timeout)
+            except Exception as e:
+                print(f"Falha ao obter a imagem {url}: {e}")
+                return None
+        return self._blob_path(digest)
+
+    def prefetch(self, urls):
+        """Começa a baixar (em segundo plano) as URLs que ainda não estão no cache."""
+        for url in urls:
+            if url and self._lookup(url) is None:
+                self._fetch_async(url)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- Download e redução ---
+
+    def _fetch_async(self, url):
+        with self.lock:
+            future = self.pending.get(url)
+            if future is None:
+                future = self.executor.submit(self._fetch, url)
+                self.pending[url] = future
+        return future
+
+    def _fetch(self, url):
+        try:
+            request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                original = response.read()
+            data = self._downscale(original)
+            digest = hashlib.sha256(data).hexdigest()
+            self._store(url, digest, data)
+            return digest
+        finally:
+            with self.lock:
+                self.pending.pop(url, None)
+
+    def _downscale(self, original):
+        with Image.open(io.BytesIO(original)) as image:
+            image.thumbnail(self.max_size)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            out = io.BytesIO()
+            image.save(out, "JPEG", quality=self.quality, optimize=True)
+        return out.getvalue()
+
+    # --- Disco e LRU ---
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, "blobs", digest[:2], digest + ".jpg")
+
+    def _url_path(self, url):
+        return os.path.join(self.directory, "urls", hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def _lookup(self, url):
+        """Digest da URL se o blob ainda está no cache (marcando como usado agora)."""
+        digest = self.urls.get(url)
+        if digest is None:
+            try:
+                with open(self._url_path(url), encoding="ascii") as f:
+                    digest = f.read().strip()
+            except FileNotFoundError:
+                return None
+            self.urls[url] = digest
+        with self.lock:
+            if digest not in self.blobs:
+                return None
+            self.blobs.move_to_end(digest)
+        return digest
+
+    def _forget(self, url):
+        digest = self.urls.pop(url, None)
+        with self.lock:
+            size = self.blobs.pop(digest, None)
+            if size is not None:
+                self.total_bytes -= size
+
+    def _store(self, url, digest, data):
+        path = self._blob_path(digest)
+        with self.lock:
+            known = digest in self.blobs
+        if not known:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_atomic(path, data)
+        _write_atomic(self._url_path(url), digest.encode("ascii"))
+        self.urls[url] = digest
+        with self.lock:
+            if digest not in self.blobs:
+                self.blobs[digest] = len(data)
+                self.total_bytes += len(data)
+            self.blobs.move_to_end(digest)
+            evicted = self._evict()
+        for old in evicted:
+            try:
+                os.remove(self._blob_path(old))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """Tira do LRU os blobs menos usados até caber no limite (chamar com self.lock)."""
+        evicted = []
+        while self.total_bytes > self.max_bytes and len(self.blobs) > 1:
+            digest, size = self.blobs.popitem(last=False)
+            self.total_bytes -= size
+            evicted.append(digest)
+        return evicted
+
+    def _load(self):
+        """Reconstrói o LRU a partir do disco (ordem pela data de modificação)."""
+        blobs_dir = os.path.join(self.directory, "blobs")
+        found = []
+        for prefix in os.listdir(blobs_dir):
+            for name in os.listdir(os.path.join(blobs_dir, prefix)):
+                if name.endswith(".jpg"):
+                    stat = os.stat(os.path.join(blobs_dir, prefix, name))
+                    found.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _mtime, digest, size in sorted(found):
+            self.blobs[digest] = size
+            self.total_bytes += size
+        for old in self._evict():
+            os.remove(self._blob_path(old))
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def page_image_urls(story, page_id):
+    """URL da imagem da página e das páginas seguintes (as que podem virar a atual)."""
+    page = story.page(page_id)
+    page_ids = [page_id, *(choice["next_page"] for choice in page["choices"])]
+    return [story.page(next_id).get("image_url") for next_id in page_ids if next_id in story]
@@ -0,0 +1,206 @@
+"""
+Journal do estado do jogo: toda mutação das salas (entrada e saída de
+jogadores, votos, "pronto", chat, avanço de página, reset por empate) vira
+um evento numa sequência global, gravado em disco em lotes por uma thread
+própria. De tempos em tempos o estado inteiro das salas é gravado num
+snapshot; na reinicialização o servidor carrega o snapshot mais recente e
+reaplica só os eventos posteriores a ele.
+
+Arquivos no diretório do journal:
+    journal-<seq>.log    eventos a partir de <seq>, um JSON por linha: [seq, sala, tipo, *args]
+    snapshot-<seq>.json  estado das salas; cobre todos os segmentos anteriores a <seq>
+
+Política de fsync:
+    always  o RPC só responde depois do fsync do lote (group commit)
+    batch   fsync a cada lote, em segundo plano (perde no máximo o último lote numa queda de energia)
+    never   só write(); o sistema operacional decide quando ir para o disco
+"""
+import glob
+import json
+import os
+import threading
+import time
+
+FSYNC_ALWAYS = "always"
+FSYNC_BATCH = "batch"
+FSYNC_NEVER = "never"
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_BATCH, FSYNC_NEVER)
+
+FLUSH_INTERVAL = 0.005 # segundos acumulando eventos por lote (batch/never)
+SNAPSHOT_EVERY = 50000 # eventos entre snapshots
+SNAPSHOT_CHECK_INTERVAL = 1.0
+
+
+class Journal:
+    def __init__(self, directory, fsync=FSYNC_BATCH, flush_interval=FLUSH_INTERVAL):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync desconhecida: {fsync}")
+        self.directory = directory
+        self.fsync = fsync
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Condition()
+        self.buffer = [] # linhas ainda não escritas
+        # Serializa as escritas no arquivo com a troca de segmento do snapshot
+        # (sempre adquirido antes de self.lock)
+        self.io_lock = threading.Lock()
+        self.durable = threading.Condition(threading.Lock())
+        self.durable_seq = 0 # último seq escrito (e com fsync, se a política pede)
+        self.closed = False
+
+        self.snapshot_seq, self.snapshot_path = self._latest_snapshot()
+        self.seq = self._last_seq_on_disk()
+        self.durable_seq = self.seq
+        self.file = self._open_segment(self.seq + 1)
+        self.writer = threading.Thread(target=self._writer_loop, name="journal-writer", daemon=True)
+        self.writer.start()
+
+    # --- Escrita ---
+
+    def append(self, room_id, kind, *args):
+        """Registra um evento e retorna o seq dele (não bloqueia; ver wait)."""
+        with self.lock:
+            self.seq += 1
+            self.buffer.append(json.dumps([self.seq, room_id, kind, *args], separators=(",", ":")) + "\n")
+            self.lock.notify()
+            return self.seq
+
+    def wait(self, seq):
+        """Com fsync=always, bloqueia até o evento `seq` estar em disco."""
+        if self.fsync != FSYNC_ALWAYS:
+            return
+        with self.durable:
+            self.durable.wait_for(lambda: self.durable_seq >= seq or self.closed)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.lock.notify()
+        self.writer.join()
+        self.file.close()
+
+    def _writer_loop(self):
+        while True:
+            with self.lock:
+                self.lock.wait_for(lambda: self.buffer or self.closed)
+                if self.closed and not self.buffer:
+                    break
+            if self.fsync != FSYNC_ALWAYS:
+                time.sleep(self.flush_interval) # deixa o lote crescer; ninguém espera por ele
+            with self.io_lock:
+                self._write_pending(sync=self.fsync != FSYNC_NEVER)
+        with self.durable:
+            self.durable.notify_all()
+
+    def _write_pending(self, sync):
+        """Escreve o buffer no segmento atual (chamar com self.io_lock adquirido)."""
+        with self.lock:
+            lines, self.buffer = self.buffer, []
+            last_seq = self.seq
+        if lines:
+            self.file.write("".join(lines))
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+        with self.durable:
+            self.durable_seq = last_seq
+            self.durable.notify_all()
+
+    # --- Snapshots ---
+
+    def start_snapshots(self, capture, every=SNAPSHOT_EVERY, check_interval=SNAPSHOT_CHECK_INTERVAL):
+        """Thread que grava um snapshot (capture() -> estados das salas) a cada `every` eventos."""
+        def loop():
+            while not self.closed:
+                time.sleep(check_interval)
+                if self.seq - self.snapshot_seq >= every:
+                    try:
+                        self.snapshot(capture)
+                    except Exception as e:
+                        print(f"Erro ao gravar o snapshot do journal: {e}")
+        threading.Thread(target=loop, name="journal-snapshots", daemon=True).start()
+
+    def snapshot(self, capture):
+        """
+        Troca de segmento e grava o estado capturado. Cada sala informa o seq
+        do último evento já incluído no estado dela (capturado depois da troca),
+        então os segmentos anteriores ficam cobertos e podem ser apagados.
+        """
+        with self.io_lock:
+            # Os eventos pendentes vão para o segmento antigo antes da troca
+            self._write_pending(sync=True)
+            with self.lock:
+                start_seq = self.seq + 1
+                self.file.close()
+                self.file = self._open_segment(start_seq)
+        rooms = capture()
+        path = os.path.join(self.directory, f"snapshot-{start_seq:012d}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"seq": start_seq, "rooms": rooms}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        old_snapshot = self.snapshot_path
+        self.snapshot_seq, self.snapshot_path = start_seq, path
+        for segment_seq, segment in self._segments():
+            if segment_seq < start_seq:
+                os.remove(segment)
+        if old_snapshot:
+            os.remove(old_snapshot)
+        return path
+
+    # --- Recuperação ---
+
+    def load(self):
+        """
+        Estado para a recuperação: (estados das salas no snapshot, gerador dos
+        eventos (seq, sala, tipo, args) gravados depois dele).
+        """
+        rooms = []
+        if self.snapshot_path:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                rooms = json.load(f)["rooms"]
+        return rooms, self._events(self.snapshot_seq)
+
+    def _events(self, after_seq):
+        for _segment_seq, segment in self._segments():
+            with open(segment, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        seq, room_id, kind, *args = json.loads(line)
+                    except ValueError:
+                        break # linha cortada por uma queda no meio da escrita
+                    if seq >= after_seq:
+                        yield seq, room_id, kind, args
+
+    def _segments(self):
+        segments = []
+        for path in glob.glob(os.path.join(self.directory, "journal-*.log")):
+            segments.append((int(os.path.basename(path)[8:-4]), path))
+        return sorted(segments)
+
+    def _latest_snapshot(self):
+        snapshots = sorted(glob.glob(os.path.join(self.directory, "snapshot-*.json")))
+        if not snapshots:
+            return 0, None
+        return int(os.path.basename(snapshots[-1])[9:-5]), snapshots[-1]
+
+    def _last_seq_on_disk(self):
+        last_seq = self.snapshot_seq - 1 if self.snapshot_seq else 0
+        segments = self._segments()
+        if segments:
+            # Só o último segmento importa; os anteriores terminam antes dele
+            _segment_seq, path = segments[-1]
+            last_seq = max(last_seq, segments[-1][0] - 1)
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        last_seq = json.loads(line)[0]
+                    except ValueError:
+                        break
+        return last_seq
+
+    def _open_segment(self, start_seq):
+        return open(os.path.join(self.directory, f"journal-{start_seq:012d}.log"), "a", encoding="utf-8")
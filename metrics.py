@@ -0,0 +1,240 @@
+"""
+Métricas do servidor, sempre ligadas e baratas o bastante para isso: cada
+observação é um bisect e um incremento sob um lock curto. Os valores ficam
+em memória e são exportados no formato texto do Prometheus, pelo RPC
+get_metrics e (com --metrics-port) por um endpoint HTTP local.
+
+Cada módulo declara as suas métricas no registro global METRICS:
+
+    RPC_LATENCY = METRICS.histogram("story_rpc_seconds", "Latência dos RPCs", ("method",))
+    RPC_LATENCY.labels("vote").observe(0.0004)
+
+Gauges são funções chamadas só na hora da coleta (ex.: clientes conectados),
+então não custam nada nos caminhos quentes.
+"""
+import bisect
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Limites dos buckets (le) em segundos e em unidades (tamanhos)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 100000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # o último é o +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def samples(self):
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            yield "_bucket", (("le", _format_bound(bound)),), cumulative
+        yield "_sum", (), total
+        yield "_count", (), cumulative
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        yield "", (), self.value
+
+
+class MetricFamily:
+    """Uma métrica com os seus rótulos: um filho (Histogram/Counter) por combinação de valores."""
+    def __init__(self, name, help, kind, labelnames, factory):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self.factory = factory
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        """Filho dos rótulos dados; guarde o retorno para não repetir a busca no caminho quente."""
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} espera os rótulos {self.labelnames}")
+            with self.lock:
+                child = self.children.setdefault(values, self.factory())
+        return child
+
+    def render(self, out):
+        for values, child in sorted(self.children.items()):
+            labels = tuple(zip(self.labelnames, values))
+            for suffix, extra, value in child.samples():
+                out.append(f"{self.name}{suffix}{_format_labels(labels + extra)} {_format_value(value)}")
+
+
+class GaugeFamily:
+    """Gauge calculado na coleta: fn() devolve um número, ou {valores dos rótulos: número}."""
+    def __init__(self, name, help, labelnames, fn):
+        self.name = name
+        self.help = help
+        self.kind = "gauge"
+        self.labelnames = labelnames
+        self.fn = fn
+
+    def render(self, out):
+        value = self.fn()
+        if not self.labelnames:
+            value = {(): value}
+        for values, v in sorted(value.items()):
+            out.append(f"{self.name}{_format_labels(tuple(zip(self.labelnames, values)))} {_format_value(v)}")
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.families = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(MetricFamily(name, help, "histogram", labelnames, lambda: Histogram(buckets)))
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(MetricFamily(name, help, "counter", labelnames, Counter))
+
+    def gauge(self, name, help, fn, labelnames=()):
+        """Registra (ou substitui, ex.: quando o servidor sobe de novo no mesmo processo) um gauge."""
+        with self.lock:
+            self.families[name] = GaugeFamily(name, help, labelnames, fn)
+
+    def _add(self, family):
+        with self.lock:
+            existing = self.families.get(family.name)
+            if existing is not None:
+                return existing
+            self.families[family.name] = family
+            return family
+
+    def render(self):
+        """Todas as métricas no formato texto do Prometheus."""
+        with self.lock:
+            families = sorted(self.families.values(), key=lambda family: family.name)
+        out = []
+        for family in families:
+            out.append(f"# HELP {family.name} {family.help}")
+            out.append(f"# TYPE {family.name} {family.kind}")
+            try:
+                family.render(out)
+            except Exception as e:
+                out.append(f"# erro ao coletar {family.name}: {e}")
+        return "\n".join(out) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+class TimedLock:
+    """
+    threading.Lock (só com `with`) que mede quanto tempo cada thread esperou
+    para adquiri-lo e quanto tempo o segurou.
+    """
+    __slots__ = ("lock", "wait", "hold", "acquired_at")
+
+    def __init__(self, wait, hold):
+        self.lock = threading.Lock()
+        self.wait = wait # Histogram
+        self.hold = hold # Histogram
+        self.acquired_at = 0.0
+
+    def __enter__(self):
+        started = time.perf_counter()
+        self.lock.acquire()
+        self.acquired_at = now = time.perf_counter()
+        self.wait.observe(now - started)
+
+    def __exit__(self, *exc_info):
+        held = time.perf_counter() - self.acquired_at
+        self.lock.release()
+        self.hold.observe(held)
+
+
+def timed(name, fn, latency, errors):
+    """Envolve fn para observar a latência em latency.labels(name) e contar as exceções em errors."""
+    histogram = latency.labels(name)
+    counter = errors.labels(name)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            counter.inc()
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started)
+    return wrapper
+
+
+# --- Endpoint HTTP ---
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass # uma linha por coleta do Prometheus só poluiria o log do servidor
+
+
+def start_metrics_server(port, hostname="127.0.0.1", registry=METRICS):
+    """Serve /metrics numa thread daemon; retorna o servidor HTTP (shutdown() para parar)."""
+    server = ThreadingHTTPServer((hostname, port), MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+# --- Formato texto ---
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,208 @@
+import queue
+import threading
+import time
+from functools import partial
+
+import rpyc
+
+from metrics import METRICS
+
+# Callbacks que os clientes podem expor, na ordem em que são entregues
+# (a página vem antes dos votos para o cliente nunca ver votos da página errada).
+PUSH_CALLBACKS = ("on_page_update", "on_chat_update", "on_vote_update", "on_round_update", "on_audience_update")
+
+# Políticas para clientes lentos
+SLOW_POLICY_DROP = "drop"              # para de enviar push; o cliente continua podendo fazer polling
+SLOW_POLICY_DISCONNECT = "disconnect"  # fecha a conexão do cliente
+
+PUSH_DELIVERY = METRICS.histogram("story_push_delivery_seconds",
+                                  "Duração de cada entrega de push a um cliente, por callback", ("kind",))
+PUSH_FAILURES = METRICS.counter("story_push_failures_total", "Entregas de push que falharam ou expiraram", ("kind",))
+PUSH_DROPPED = METRICS.counter("story_push_dropped_clients_total",
+                               "Clientes removidos das notificações por estarem lentos").labels()
+
+
+class ClientChannel:
+    """
+    Fila de saída de um cliente. Guarda no máximo um update pendente por tipo
+    de callback (e por tópico, ex.: sala): um update novo substitui (ou é combinado com) o anterior
+    ainda não entregue (coalescência), então a fila é limitada por construção.
+    """
+    def __init__(self, conn, callbacks, remote=True):
+        self.conn = conn
+        self.callbacks = callbacks # nome do callback -> método remoto (descoberto uma vez no on_connect)
+        self.remote = remote # False: callbacks locais que só enfileiram (ex.: gateway asyncio)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.queued = False # True enquanto o canal está na fila dos workers ou sendo drenado
+        self.oldest_pending = None # instante do update pendente mais antigo
+        self.strikes = 0 # entregas lentas/falhas consecutivas
+        self.closed = False
+
+
+class PushDispatcher:
+    """
+    Entrega as notificações push fora da thread do RPC que causou a mudança.
+    publish() só enfileira e retorna; um pool de workers drena os canais,
+    um cliente por vez por canal, com timeout em cada entrega.
+    """
+    def __init__(self, workers=4, delivery_timeout=2.0, slow_threshold=0.5,
+                 max_strikes=3, max_lag=5.0, slow_policy=SLOW_POLICY_DROP):
+        if slow_policy not in (SLOW_POLICY_DROP, SLOW_POLICY_DISCONNECT):
+            raise ValueError(f"Política de cliente lento desconhecida: {slow_policy}")
+        self.delivery_timeout = delivery_timeout
+        self.slow_threshold = slow_threshold
+        self.max_strikes = max_strikes
+        self.max_lag = max_lag
+        self.slow_policy = slow_policy
+
+        self.channels = {} # conn -> ClientChannel
+        self.channels_lock = threading.Lock()
+        self.tasks = queue.Queue()
+        self.workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"push-worker-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def register(self, conn, callbacks=None):
+        """
+        Descobre uma única vez quais callbacks o cliente expõe e cria o canal dele.
+        Conexões que não são RPyC passam `callbacks` locais prontos; eles não
+        podem bloquear e devem levantar exceção se o cliente estiver atrasado.
+        """
+        remote = callbacks is None
+        if remote:
+            callbacks = {}
+            for name in PUSH_CALLBACKS:
+                if hasattr(conn.root, name):
+                    callbacks[name] = getattr(conn.root, name)
+        channel = ClientChannel(conn, callbacks, remote)
+        with self.channels_lock:
+            self.channels[conn] = channel
+        return channel
+
+    def unregister(self, conn):
+        with self.channels_lock:
+            channel = self.channels.pop(conn, None)
+        if channel:
+            with channel.lock:
+                channel.closed = True
+                channel.pending = {}
+
+    def publish(self, kind, *args, targets=None, topic=None, merge=None):
+        """
+        Enfileira um update para os clientes que expõem o callback. Não bloqueia.
+        `targets` limita às conexões dadas (ex.: as de uma sala); None é todo mundo.
+        Updates pendentes são coalescidos por (kind, topic): por padrão o novo
+        substitui o anterior; se `merge` for dado, merge(args_pendentes, args_novos)
+        decide o que fica (ex.: concatenar mensagens).
+        """
+        now = time.monotonic()
+        key = (kind, topic)
+        with self.channels_lock:
+            if targets is None:
+                channels = list(self.channels.values())
+            else:
+                channels = [self.channels[conn] for conn in targets if conn in self.channels]
+
+        for channel in channels:
+            if kind not in channel.callbacks:
+                continue
+            lagging = False
+            with channel.lock:
+                if channel.closed:
+                    continue
+                if merge is not None and key in channel.pending:
+                    channel.pending[key] = merge(channel.pending[key], args)
+                else:
+                    channel.pending[key] = args
+                if channel.oldest_pending is None:
+                    channel.oldest_pending = now
+                if channel.queued:
+                    # Já tem entrega em andamento: o update fica coalescido no canal
+                    lagging = now - channel.oldest_pending > self.max_lag
+                else:
+                    channel.queued = True
+                    self.tasks.put(partial(self._drain, channel))
+            if lagging:
+                self._drop_slow_client(channel, "fila de push atrasada")
+
+    def lagging_clients(self):
+        """Quantos canais estão com entregas lentas ou com falha (strikes) no momento."""
+        with self.channels_lock:
+            return sum(1 for channel in self.channels.values() if channel.strikes)
+
+    def close(self):
+        """Encerra os workers (usado em testes/benchmarks que criam vários serviços)."""
+        for _ in self.workers:
+            self.tasks.put(None)
+
+    # --- Workers ---
+
+    def _worker_loop(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            try:
+                task()
+            except Exception as e:
+                print(f"Erro no worker de notificações: {e}")
+
+    def _drain(self, channel):
+        with channel.lock:
+            pending = channel.pending
+            channel.pending = {}
+            channel.oldest_pending = None
+
+        for kind in PUSH_CALLBACKS:
+            for (pending_kind, _topic), args in pending.items():
+                if pending_kind == kind and not channel.closed:
+                    self._deliver(channel, kind, args)
+
+        # Se chegaram updates durante a entrega, o canal volta para o fim da fila
+        with channel.lock:
+            if channel.pending and not channel.closed:
+                self.tasks.put(partial(self._drain, channel))
+            else:
+                channel.queued = False
+
+    def _deliver(self, channel, kind, args):
+        started = time.monotonic()
+        try:
+            if channel.remote:
+                result = rpyc.async_(channel.callbacks[kind])(*args)
+                result.set_expiry(self.delivery_timeout)
+                result.wait()
+                result.value # relança a exceção remota, se houver
+            else:
+                channel.callbacks[kind](*args)
+            elapsed = time.monotonic() - started
+            slow = elapsed > self.slow_threshold
+        except Exception as e:
+            print(f"Erro ao notificar cliente ({kind}): {e}")
+            elapsed = time.monotonic() - started
+            PUSH_FAILURES.labels(kind).inc()
+            slow = True
+        PUSH_DELIVERY.labels(kind).observe(elapsed)
+
+        channel.strikes = channel.strikes + 1 if slow else 0
+        if channel.strikes >= self.max_strikes:
+            self._drop_slow_client(channel, f"{channel.strikes} entregas lentas ou com falha")
+
+    def _drop_slow_client(self, channel, reason):
+        if channel.closed:
+            return
+        print(f"Cliente lento removido das notificações ({reason}): {channel.conn}")
+        PUSH_DROPPED.inc()
+        self.unregister(channel.conn)
+        if self.slow_policy == SLOW_POLICY_DISCONNECT:
+            self.tasks.put(partial(self._close_quietly, channel.conn))
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
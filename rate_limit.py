@@ -0,0 +1,104 @@
+"""
+Limite de mensagens no chat (token bucket), por jogador e por sala.
+
+Cada balde ganha `rate` fichas por segundo, até `burst`; cada mensagem gasta
+uma. Sem ficha, a mensagem é recusada e o jogador recebe quanto esperar.
+A verificação acontece antes do lock da sala (ver GameRoom.send_chat_message),
+então quem está inundando o chat não chega a disputar o lock com os votos.
+"""
+import threading
+import time
+
+from metrics import METRICS
+
+CHAT_RATE = 2.0          # mensagens por segundo de cada jogador
+CHAT_BURST = 8           # mensagens seguidas que um jogador pode mandar de uma vez
+ROOM_CHAT_RATE = 20.0    # mensagens por segundo somando todos os jogadores da sala
+ROOM_CHAT_BURST = 60
+PURGE_EVERY = 1024       # baldes criados entre as limpezas dos baldes parados
+
+CHAT_THROTTLED = METRICS.counter("story_chat_throttled_total", "Mensagens de chat recusadas pelo limite",
+                                 ("scope",))
+THROTTLED_USER = CHAT_THROTTLED.labels("jogador")
+THROTTLED_ROOM = CHAT_THROTTLED.labels("sala")
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst, now):
+        self.tokens = float(burst)
+        self.updated = now
+
+
+class RateLimits:
+    """
+    Baldes por chave (jogador ou sala) com a mesma taxa. rate <= 0 desliga o
+    limite. Thread-safe; o lock só protege contas, sem E/S.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.buckets = {}
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def take(self, key, count=1, now=None):
+        """Gasta `count` fichas do balde de `key`. Retorna 0 se conseguiu, ou os segundos até ter fichas."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.burst, now)
+                self.created += 1
+                if self.created % PURGE_EVERY == 0:
+                    self._purge(now)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+            if bucket.tokens >= count:
+                bucket.tokens -= count
+                return 0.0
+            return (count - bucket.tokens) / self.rate
+
+    def give_back(self, key, count=1):
+        """Devolve fichas gastas (quando outro limite recusou a mesma mensagem)."""
+        if self.rate <= 0:
+            return
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.tokens = min(self.burst, bucket.tokens + count)
+
+    def _purge(self, now):
+        """Esquece os baldes que já estariam cheios: recriados, ficam iguais."""
+        full_after = self.burst / self.rate
+        for key in [key for key, bucket in self.buckets.items() if now - bucket.updated >= full_after]:
+            del self.buckets[key]
+
+
+class ChatLimits:
+    """Limites do chat de todas as salas: um balde por jogador e um por sala."""
+    def __init__(self, rate=CHAT_RATE, burst=CHAT_BURST, room_rate=ROOM_CHAT_RATE, room_burst=ROOM_CHAT_BURST):
+        self.users = RateLimits(rate, burst)
+        self.rooms = RateLimits(room_rate, room_burst)
+
+    def check(self, room_id, username, count=1):
+        """None se as `count` mensagens podem passar; senão, a mensagem de erro para o jogador."""
+        now = time.monotonic()
+        wait = self.users.take(username, count, now)
+        if wait:
+            THROTTLED_USER.inc(count)
+            return f"Muitas mensagens seguidas: aguarde {wait:.1f}s para mandar outra."
+        wait = self.rooms.take(room_id, count, now)
+        if wait:
+            self.users.give_back(username, count)
+            THROTTLED_ROOM.inc(count)
+            return f"O chat da sala está muito movimentado: aguarde {wait:.1f}s para mandar outra."
+        return None
+
+    def refund(self, room_id, username, count=1):
+        """Devolve as fichas de mensagens liberadas por check que acabaram não sendo enviadas."""
+        self.users.give_back(username, count)
+        self.rooms.give_back(room_id, count)
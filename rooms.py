@@ -0,0 +1,1052 @@
+import json
+import random
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from story_data import story_pages, current_page_id, chat_messages, votes
+from story_bundle import InMemoryStory
+from story_graph import StoryGraph
+from image_cache import page_image_urls
+from journal import SNAPSHOT_EVERY
+from audience import AudienceTally, AUDIENCE_TICK
+from timer_wheel import TimerWheel, TIMER_TICK
+from metrics import METRICS, SIZE_BUCKETS, TimedLock
+from push import PushDispatcher
+from chat_buffer import ChatRingBuffer, encode_chat_entries
+from wire import encode_state
+from vote_tally import PlayerIds, VoteTally, describe_waiting
+
+DEFAULT_ROOM_ID = "principal" # sala do jogo original; todo cliente começa nela
+
+# Versões "impossíveis" usadas quando o cliente ainda não tem estado algum
+NO_VERSIONS = (-1, -1, -1)
+
+CHAT_CAPACITY = 500 # mensagens mantidas no chat ao vivo
+CHAT_SYNC_WINDOW = 50 # mensagens enviadas quando o cliente precisa ressincronizar o chat
+CHAT_PAGE_MAX = 200 # limite de mensagens por chamada de get_chat_page
+CHAT_BROADCAST_INTERVAL = 0.1 # segundos entre pushes de chat de uma sala (mensagens no meio vão juntas)
+
+# Métricas das salas (somadas em todas as salas: um rótulo por sala não teria limite)
+LOCK_WAIT = METRICS.histogram("story_room_lock_wait_seconds", "Espera para adquirir o lock de uma sala").labels()
+LOCK_HOLD = METRICS.histogram("story_room_lock_hold_seconds", "Tempo com o lock de uma sala adquirido").labels()
+CHAT_MESSAGE_SIZE = METRICS.histogram("story_chat_message_chars", "Tamanho das mensagens de chat enviadas",
+                                      buckets=SIZE_BUCKETS).labels()
+ROUND_VOTES = METRICS.histogram("story_round_votes", "Votos em cada rodada encerrada (avanço ou empate)",
+                                buckets=SIZE_BUCKETS).labels()
+PAGE_SECONDS = METRICS.histogram("story_page_seconds", "Tempo em cada página até avançar, por motivo do avanço",
+                                 ("outcome",), buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800, 3600))
+PAGE_SECONDS_ALL = PAGE_SECONDS.labels("todos")   # todos os jogadores ativos votaram e clicaram "Avançar"
+PAGE_SECONDS_DEADLINE = PAGE_SECONDS.labels("prazo")
+CHAT_PUSH_MESSAGES = METRICS.histogram("story_chat_push_messages", "Mensagens em cada push de chat de uma sala",
+                                       buckets=(1, 2, 5, 10, 20, 50)).labels()
+AUDIENCE_VOTES = METRICS.counter("story_audience_votes_total", "Votos da plateia aceitos (contados a cada tick)").labels()
+
+# Fases do prazo da rodada (ver GameRoom._schedule_deadline)
+PHASE_VOTE = "vote"   # do primeiro voto até todos os jogadores ativos votarem
+PHASE_READY = "ready" # depois disso, até todos clicarem "Avançar"
+
+# Fotografia imutável e já serializada do estado de uma sala.
+# Os escritores publicam uma nova a cada mudança (copy-on-write, sob o lock da sala);
+# os leitores só leem room.snapshot, sem lock e sem json.dumps (o JSON com todos
+# os votos é montado uma única vez por snapshot, na primeira leitura).
+GameSnapshot = namedtuple("GameSnapshot", [
+    "versions",             # (page_version, chat_version, votes_version); chat_version é o último seq do chat
+    "page_id",
+    "page_json",
+    "votes",                # SnapshotVotes: votos congelados (username -> escolha); votes.json() dá o JSON
+    "tally",                # votos por escolha da página atual, ex.: (2, 1)
+    "tally_json",
+    "vote_log",             # tupla de usernames na ordem dos votos desde o último reset
+    "votes_reset_version",
+    "current_players",
+    "total_players_ever",
+])
+
+# Prazo armado na roda de temporizadores; `round` é o votes_reset_version da rodada
+RoundDeadline = namedtuple("RoundDeadline", ["phase", "round", "timer"])
+
+# O que mudou desde as versões de um cliente (ver GameRoom.state_delta);
+# chat_entries e votes são None quando não mudaram
+StateDelta = namedtuple("StateDelta", ["snap", "page", "chat_entries", "chat_reset", "votes", "votes_reset"])
+
+
+# Comandos de execute_batch -> ação da GameRoom (chamada com o lock adquirido)
+BATCH_COMMANDS = {
+    "chat": "_send_chat",
+    "vote": "_vote",
+    "advance": "_check_and_advance_page",
+}
+
+# Tipo do evento no journal -> mutação da GameRoom que ele reaplica
+JOURNAL_EVENTS = {
+    "chat": "_append_chat",
+    "vote": "_set_vote",
+    "reset": "_reset_votes",
+    "page": "_set_page",
+    "join": "_add_player",
+    "leave": "_remove_player",
+    "ready": "_set_ready",
+    "unready": "_unset_ready",
+    "clear_ready": "_clear_ready",
+}
+
+
+class RoomNotFound(ValueError):
+    """Sala pedida por um cliente não existe."""
+
+
+class GameRoom:
+    """
+    Uma aventura independente: página atual, votos, estado "pronto", chat e
+    conexões inscritas para push, tudo protegido pelo lock da própria sala.
+    Os métodos públicos têm a mesma assinatura e retorno dos RPCs do servidor.
+
+    Com `timers` (TimerWheel) e vote_timeout/ready_timeout em segundos, cada
+    rodada tem prazo: ao vencer, ela é decidida com os votos que houver.
+    Com audience_weight > 0, espectadores também votam (ver audience.py), e a
+    plateia inteira vale audience_weight votos de jogador. Com `archive`
+    (chat_archive.ChatArchive), todo o chat também vai para o disco, e o
+    histórico anterior ao chat ao vivo é lido de lá; `chat_start_seq` é o
+    último seq já arquivado, para o chat continuar depois dele.
+
+    Com `chat_limits` (rate_limit.ChatLimits), mensagens acima do limite do
+    jogador ou da sala são recusadas antes de pegar o lock. Com
+    chat_broadcast_interval > 0 (e `timers`), a sala manda no máximo um push
+    de chat por intervalo, com todas as mensagens que chegaram nele.
+    """
+    def __init__(self, room_id, push, story, chat_capacity=CHAT_CAPACITY,
+                 start_page_id=None, chat_messages=(), votes=None, images=None, journal=None,
+                 timers=None, vote_timeout=None, ready_timeout=None, audience_weight=0.0, archive=None,
+                 chat_limits=None, chat_broadcast_interval=0.0, chat_start_seq=0):
+        self.room_id = room_id
+        self.push = push
+        self.story = story # InMemoryStory ou StoryBundle, compartilhada por todas as salas
+        self.images = images # ImageCache compartilhado, ou None
+        # Journal compartilhado (journal.Journal), ou None; cada mutação vira um evento
+        self.journal = journal
+        self.journal_seq = 0 # seq do último evento desta sala no journal
+        self.lock = TimedLock(LOCK_WAIT, LOCK_HOLD)
+        self.current_page_id = start_page_id or story.start_page_id
+
+        # Chat ao vivo limitado; a versão do chat é o seq da última mensagem.
+        # O histórico completo fica no arquivo em disco, se houver
+        self.archive = archive
+        self.chat = ChatRingBuffer(chat_capacity)
+        self.chat.skip_to(chat_start_seq)
+        for message in chat_messages:
+            seq = self.chat.append(message)
+            if archive is not None:
+                archive.append(room_id, seq, message)
+        self.chat_limits = chat_limits
+        self.chat_broadcast_interval = chat_broadcast_interval if timers is not None else 0.0
+        self.chat_unsent_seq = None # primeira mensagem ainda não enviada por push (com intervalo)
+        self.chat_broadcast_at = 0.0 # time.monotonic() do último push de chat
+        self.chat_flush = None # Timer do próximo push de chat, se armado
+
+        # Versões monotônicas usadas pela sincronização incremental (get_state_since)
+        self.page_version = 0
+        self.votes_version = 0
+        self.votes_reset_version = 0 # votes_version no último reset dos votos
+        self.vote_log = [] # usernames na ordem em que votaram desde o último reset
+
+        # Conexões que recebem os push desta sala: conn -> username
+        self.connections = {}
+        # Conexões de serviço que recebem os push sem ser jogadoras (ver watch)
+        self.watchers = set()
+
+        # Ids inteiros dos jogadores (a tabela só cresce): índices dos bitsets e do
+        # vetor de votos do tally e ids da codificação compacta (wire.py)
+        self.players = PlayerIds()
+
+        # Votos, estado "pronto" e todos os jogadores que já entraram na sala,
+        # em bitsets indexados pelo id do jogador (quórum com operações de bits)
+        self.tally = VoteTally(self.players, votes)
+        self.max_players_connected = 0 # Mantido, mas a lógica de avanço usará tally.required
+
+        # Prazos das rodadas, atendidos pela roda de temporizadores compartilhada
+        self.timers = timers
+        self.vote_timeout = vote_timeout
+        self.ready_timeout = ready_timeout
+        self.deadline = None # RoundDeadline armado, ou None
+        self.page_started = time.monotonic()
+
+        # Votos da plateia, fora do lock da sala; a rodada deles é o votes_reset_version
+        self.audience_weight = audience_weight
+        self.audience = AudienceTally() if audience_weight else None
+
+        # A época identifica esta instância da sala (e a sua tabela de ids) na codificação compacta
+        self.wire_epoch = random.getrandbits(32)
+
+        self.snapshot = None
+        self._publish_snapshot()
+        self._prefetch_images(self.current_page_id)
+
+    # --- Entrada e saída de jogadores ---
+
+    def connect(self, conn, username):
+        """Inscreve a conexão nos push da sala e registra o jogador."""
+        with self.lock:
+            self._add_player(username)
+            self.connections[conn] = username
+            self.tally.set_active(username, True)
+            current_player_count = len(self.connections)
+            if current_player_count > self.max_players_connected:
+                self.max_players_connected = current_player_count
+            self._schedule_deadline()
+            self._publish_snapshot()
+        self._sync_journal()
+        return current_player_count
+
+    def disconnect(self, conn):
+        """
+        A conexão caiu: para de receber push e perde o estado "pronto" (o voto
+        é mantido). Sem outra conexão na sala, deixa de ser exigido para avançar.
+        """
+        with self.lock:
+            username = self.connections.pop(conn, None)
+            if username and username not in self.connections.values():
+                if self.tally.is_ready(username):
+                    self._unset_ready(username)
+                    print(f"Estado 'pronto' do usuário {username} removido (sala {self.room_id}).")
+                self.tally.set_active(username, False)
+                self._schedule_deadline()
+            self._publish_snapshot()
+        self._sync_journal()
+        return username
+
+    def leave(self, conn):
+        """Saída voluntária: além de desconectar, o jogador deixa de ser exigido para avançar."""
+        with self.lock:
+            username = self.connections.pop(conn, None)
+            if username and username not in self.connections.values():
+                self._remove_player(username)
+                self.tally.set_active(username, False)
+                self._schedule_deadline()
+            self._publish_snapshot()
+        self._sync_journal()
+        return username
+
+    def watch(self, conn):
+        """Inscreve nos push da sala uma conexão que não é de jogador."""
+        with self.lock:
+            self.watchers.add(conn)
+
+    def unwatch(self, conn):
+        with self.lock:
+            self.watchers.discard(conn)
+
+    def summary(self):
+        snap = self.snapshot
+        return {
+            "room_id": self.room_id,
+            "page_id": snap.page_id,
+            "current_players": snap.current_players,
+            "total_players_ever": snap.total_players_ever,
+        }
+
+    # --- Leitores: devolvem o snapshot publicado, sem adquirir o lock ---
+
+    def get_atomic_game_state(self):
+        """Busca página, chat, votos e contagem de jogadores de forma atômica."""
+        snap = self.snapshot
+        chat_json = self.chat.messages_json(snap.versions[1])
+        return snap.page_id, snap.page_json, chat_json, snap.votes.json(), snap.current_players, snap.total_players_ever
+
+    def get_state_since(self, versions=None):
+        """
+        Sincronização incremental: recebe as versões (página, chat, votos) que o
+        cliente já possui e devolve apenas o que mudou desde então.
+        Retorna (versões, page_id, page_json, chat_json, votes_json, jogadores_atuais, total_jogadores);
+        os campos que não mudaram vêm como None.
+        """
+        snap = self.snapshot
+        # Resposta barata: nada mudou
+        if versions is not None and tuple(versions) == snap.versions:
+            return snap.versions, None, None, None, None, snap.current_players, snap.total_players_ever
+
+        delta = self.state_delta(versions, snap)
+        page_id = page_json = chat_json = votes_json = None
+        if delta.page:
+            page_id, page_json = snap.page_id, snap.page_json
+        if delta.chat_entries is not None:
+            chat_json = encode_chat_entries(delta.chat_entries, reset=delta.chat_reset)
+        if delta.votes is not None:
+            changed_votes = snap.votes.json() if delta.votes_reset else json.dumps(delta.votes)
+            votes_json = ('{"reset": ' + json.dumps(delta.votes_reset) + ', "votes": ' + changed_votes +
+                          ', "tally": ' + snap.tally_json + "}")
+        return snap.versions, page_id, page_json, chat_json, votes_json, snap.current_players, snap.total_players_ever
+
+    def get_state_since_compact(self, versions=None, names=None):
+        """
+        Mesmo que get_state_since, na codificação compacta de wire.py. `names`
+        é o (época, quantidade) da tabela de nomes que o cliente já tem.
+        """
+        epoch, known = tuple(names) if names is not None else (None, 0)
+        if epoch != self.wire_epoch:
+            known = 0
+        delta = self.state_delta(versions, self.snapshot)
+        return encode_state(*delta, self.wire_epoch, self.players.names, known, self.players.ids)
+
+    def state_delta(self, versions, snap):
+        """Partes do snapshot `snap` que mudaram desde as versões do cliente (StateDelta)."""
+        page_v, chat_v, votes_v = tuple(versions) if versions is not None else NO_VERSIONS
+        current_page_v, current_chat_v, current_votes_v = snap.versions
+        chat_entries = votes = None
+        chat_reset = votes_reset = False
+
+        if chat_v != current_chat_v:
+            if 0 <= chat_v < current_chat_v:
+                chat_entries = self.chat.since(chat_v, current_chat_v)
+            if chat_entries is None or len(chat_entries) > CHAT_SYNC_WINDOW:
+                # Cliente muito atrasado (ou novo): recebe só a janela mais recente;
+                # o histórico anterior é buscado sob demanda com get_chat_page
+                chat_entries = self.chat.window(current_chat_v - CHAT_SYNC_WINDOW + 1, current_chat_v)
+                chat_reset = True
+
+        if votes_v != current_votes_v:
+            if snap.votes_reset_version <= votes_v < current_votes_v:
+                # Cada mudança de voto desde o último reset ocupa uma posição no log
+                changed = snap.vote_log[votes_v - snap.votes_reset_version:]
+                votes = {user: snap.votes[user] for user in changed}
+            else:
+                votes, votes_reset = snap.votes, True
+
+        return StateDelta(snap, page_v != current_page_v, chat_entries, chat_reset, votes, votes_reset)
+
+    def get_chat_page(self, before_seq=None, limit=CHAT_SYNC_WINDOW):
+        """
+        Histórico do chat sob demanda: as `limit` mensagens anteriores a before_seq
+        (ou as mais recentes, se before_seq for None).
+        Retorna JSON {"first_seq": n, "messages": [...], "has_more": bool}.
+        """
+        upto_seq = self.snapshot.versions[1]
+        if before_seq is None:
+            before_seq = upto_seq + 1
+        before_seq = int(before_seq)
+        limit = max(1, min(int(limit), CHAT_PAGE_MAX))
+        entries = self.chat.page(before_seq, limit, upto_seq)
+        first_seq = self.chat.first_seq(upto_seq)
+        if self.archive is not None:
+            if len(entries) < limit:
+                # O que já saiu do chat ao vivo vem do arquivo em disco
+                older_before = entries[0][0] if entries else min(before_seq, first_seq)
+                entries = self.archive.page(self.room_id, older_before, limit - len(entries)) + entries
+            first_seq = self.archive.first_seq(self.room_id) or first_seq
+        has_more = bool(entries) and entries[0][0] > first_seq
+        return encode_chat_entries(entries, has_more=has_more)
+
+    def get_chat_range(self, start_seq=1, limit=CHAT_SYNC_WINDOW):
+        """
+        Histórico do chat em ordem crescente (moderação e replay): até `limit`
+        mensagens a partir de start_seq, do arquivo em disco e do chat ao vivo.
+        Retorna JSON {"first_seq": n, "messages": [...], "next_seq": n}; next_seq
+        é de onde continuar (null quando chegou à mensagem mais recente).
+        """
+        upto_seq = self.snapshot.versions[1]
+        start_seq = max(int(start_seq), 1)
+        limit = max(1, min(int(limit), CHAT_PAGE_MAX))
+        entries = []
+        if self.archive is not None and start_seq < self.chat.first_seq(upto_seq):
+            entries = self.archive.read(self.room_id, start_seq, limit, upto_seq)
+        # O resto (as mais recentes, talvez ainda não gravadas) vem do chat ao vivo, se continuar o trecho
+        next_seq = entries[-1][0] + 1 if entries else start_seq
+        if len(entries) < limit and next_seq <= upto_seq:
+            live = self.chat.window(next_seq, min(next_seq + limit - len(entries) - 1, upto_seq))
+            if not entries or (live and live[0][0] == next_seq):
+                entries += live
+        next_seq = entries[-1][0] + 1 if entries else None
+        return encode_chat_entries(entries, next_seq=next_seq if next_seq and next_seq <= upto_seq else None)
+
+    def get_current_page(self):
+        snap = self.snapshot
+        return snap.page_id, snap.page_json
+
+    def get_chat_messages(self):
+        return self.chat.messages_json(self.snapshot.versions[1])
+
+    def get_votes(self):
+        return self.snapshot.votes.json()
+
+    def get_audience(self):
+        """JSON {"round", "tally", "viewers"}: contagem da plateia por escolha e quantos espectadores votaram."""
+        if self.audience is None:
+            return '{"round": null, "tally": [], "viewers": 0}'
+        round_id, counts, viewers, _accepted = self.audience.collect()
+        return self._audience_json(round_id, counts, viewers)
+
+    def get_round_deadline(self):
+        """JSON {"phase", "remaining"}: a fase com prazo armado e os segundos que faltam (phase null se nenhum)."""
+        return self._round_json(self.deadline)
+
+    # --- Escritores ---
+
+    def send_chat_message(self, username, message, sender=None):
+        """
+        `sender` é quem está mandando de fato (o login da conexão): é dele o balde
+        do limite do chat. Sem ele, vale o username.
+        """
+        refused = self._check_chat_limit(sender or username)
+        if refused is not None:
+            return False, refused
+        with self.lock:
+            result = self._send_chat(username, message)
+        self._sync_journal()
+        return result
+
+    def vote(self, username, choice_index):
+        with self.lock:
+            result = self._vote(username, choice_index)
+        self._sync_journal()
+        return result
+
+    def check_and_advance_page(self, username):
+        with self.lock:
+            result = self._check_and_advance_page(username)
+        self._sync_journal()
+        return result
+
+    def audience_vote(self, viewer, choice_index, round_id=None):
+        """
+        Voto de um espectador. Não pega o lock da sala nem avisa ninguém na hora:
+        a contagem sai no próximo tick (audience_tick). `round_id` é o "round"
+        do último push on_audience_update; votos de uma rodada encerrada são recusados.
+        """
+        if self.audience is None:
+            return False, "Esta sala não tem votação da plateia."
+        if not _valid_choice(choice_index, len(self.snapshot.tally)):
+            return False, "Escolha inválida."
+        if not self.audience.vote(viewer, choice_index, round_id):
+            return False, "Essa rodada já acabou."
+        return True, "Voto registrado."
+
+    def audience_votes(self, votes, round_id=None):
+        """Vários votos de espectadores [(espectador, escolha), ...] de uma vez; retorna quantos foram aceitos."""
+        if self.audience is None:
+            return 0
+        num_choices = len(self.snapshot.tally)
+        vote = self.audience.vote
+        accepted = 0
+        for viewer, choice_index in votes:
+            if _valid_choice(choice_index, num_choices) and vote(viewer, choice_index, round_id):
+                accepted += 1
+        return accepted
+
+    def audience_tick(self):
+        """Chamado a cada AUDIENCE_TICK: manda a contagem agregada da plateia, se ela mudou."""
+        audience = self.audience
+        if audience is None or not audience.dirty:
+            return
+        audience.dirty = False # antes de coletar: um voto que chegar no meio marca o próximo tick
+        round_id, counts, viewers, accepted = audience.collect(drain=True)
+        AUDIENCE_VOTES.inc(accepted)
+        audience_json = self._audience_json(round_id, counts, viewers)
+        with self.lock:
+            self._publish("on_audience_update", audience_json)
+
+    def _audience_json(self, round_id, counts, viewers):
+        num_choices = len(self.snapshot.tally)
+        return json.dumps({"round": round_id, "tally": [counts.get(i, 0) for i in range(num_choices)],
+                           "viewers": viewers})
+
+    def execute_batch(self, username, commands, sender=None):
+        """
+        Aplica vários comandos do jogador numa única aquisição do lock, em
+        ordem: ("chat", mensagem), ("vote", escolha) ou ("advance",). Para no
+        primeiro que falhar, sem desfazer os anteriores. Retorna a lista de
+        (sucesso, mensagem) dos comandos executados. O limite do chat é
+        verificado antes do lock: uma mensagem recusada encerra o lote ali, e
+        as fichas das mensagens que não chegaram a rodar (o lote parou antes
+        delas) são devolvidas. `sender` é o mesmo de send_chat_message.
+        """
+        sender = sender or username
+        commands = [tuple(command) for command in commands]
+        for command in commands:
+            if not command or command[0] not in BATCH_COMMANDS:
+                raise ValueError(f"Comando desconhecido: {command!r}")
+        refused = None
+        for i, command in enumerate(commands):
+            if command[0] == "chat":
+                refused = self._check_chat_limit(sender)
+                if refused is not None:
+                    commands = commands[:i]
+                    break
+        results = []
+        if commands:
+            with self.lock:
+                for kind, *args in commands:
+                    success, msg = getattr(self, BATCH_COMMANDS[kind])(username, *args)
+                    results.append((success, msg))
+                    if not success:
+                        break
+            self._sync_journal()
+            unsent = sum(1 for kind, *_args in commands[len(results):] if kind == "chat")
+            if unsent and self.chat_limits is not None:
+                self.chat_limits.refund(self.room_id, sender, unsent)
+        if refused is not None and all(success for success, _msg in results):
+            results.append((False, refused))
+        return results
+
+    def _check_chat_limit(self, sender):
+        """None se o jogador pode mandar mais uma mensagem agora; senão, o motivo da recusa."""
+        if self.chat_limits is None:
+            return None
+        return self.chat_limits.check(self.room_id, sender)
+
+    # Ações dos jogadores (chamar com self.lock adquirido); retornam (sucesso, mensagem)
+
+    def _send_chat(self, username, message):
+        CHAT_MESSAGE_SIZE.observe(len(message))
+        seq = self._append_chat(f"[{username}] {message}")
+        self._publish_snapshot()
+        # Enfileirar sob o lock mantém as notificações na mesma ordem das versões
+        self._notify_clients_chat_update(seq)
+        return True, "Mensagem enviada."
+
+    def _vote(self, username, choice_index):
+        # Antes de qualquer _record: um voto que o tally recusaria não pode ir para o journal
+        if not _valid_choice(choice_index, self.story.num_choices(self.current_page_id)):
+            return False, "Escolha inválida."
+
+        self._set_vote(username, choice_index)
+
+        # Se o usuário votar, seu estado de "pronto" é resetado
+        if self.tally.is_ready(username):
+            self._unset_ready(username)
+
+        snap = self._publish_snapshot()
+        self._notify_clients_vote_update(snap, {username: choice_index})
+        self._schedule_deadline()
+        return True, "Voto registrado."
+
+    def _check_and_advance_page(self, username):
+        result = self._try_advance(username)
+        self._schedule_deadline()
+        return result
+
+    def _try_advance(self, username):
+        """Lógica do "avançar" (chamar com self.lock adquirido)."""
+        current_page_data = self.story.page(self.current_page_id)
+        if not current_page_data['choices']:
+            return False, "Página final, sem escolhas."
+
+        # --- LÓGICA DE AVANÇO (USANDO tally.required) ---
+
+        # Exige os jogadores que já entraram na sala e continuam conectados
+        tally = self.tally
+        total_players_required = tally.num_required()
+
+        if total_players_required == 0:
+            return False, "Nenhum jogador conectado."
+
+        # 1. Marca o jogador como "pronto"
+        self._set_ready(username)
+        print(f"[{self.room_id}] Jogador {username} está pronto. Prontos: {tally.num_ready()}/{total_players_required}")
+
+        # 2. Verifica se todos votaram (considerando todos que já entraram)
+        if not tally.all_voted():
+            # Se ainda faltam votos, o clique em "Avançar" não conta — remove o "pronto" deste usuário
+            self._unset_ready(username)
+            waiting_for_vote = tally.names(tally.waiting_vote)
+            msg = f"Aguardando {len(waiting_for_vote)}/{total_players_required} votarem: {describe_waiting(waiting_for_vote)}"
+            return False, msg
+
+        # 3. Se todos votaram, verifica se todos estão prontos (clicaram "Avançar")
+        if not tally.all_ready():
+            waiting_for_ready = tally.names(tally.waiting_ready)
+            msg = f"Aguardando {len(waiting_for_ready)}/{total_players_required} clicarem 'Avançar': {describe_waiting(waiting_for_ready)}"
+            return False, msg
+
+        # 4. Se todos votaram E todos estão prontos, processa os votos
+        return self._resolve_round()
+
+    def _resolve_round(self, timed_out=False):
+        """
+        Decide a rodada com os votos atuais: avança para a escolha vencedora ou,
+        em caso de empate, zera os votos para uma nova votação. Quando o prazo
+        venceu (timed_out), o empate é decidido por sorteio, para a página não
+        ficar presa em votações repetidas.
+        """
+        current_page_data = self.story.page(self.current_page_id)
+        tally = self.tally
+        audience = {}
+        if self.audience is not None:
+            # Votos que chegaram com a página mudando podem apontar para escolhas que esta não tem
+            audience = {choice: score for choice, score in self.audience.scores(self.audience_weight).items()
+                        if choice < len(current_page_data['choices'])}
+        winners = tally.winners(audience)
+
+        if not winners:
+             # Caso excepcional: limpa estado de pronto e recusa avanço
+             self._clear_ready()
+             return False, "Sem votos válidos."
+
+        if len(winners) > 1 and not timed_out:
+            # Lógica de empate: anuncia no chat, reseta votos e estado "pronto" e notifica os clientes
+            ROUND_VOTES.observe(tally.num_votes)
+            seq = self._append_chat(f"[SISTEMA] Houve um empate! Votem novamente para desempatar.")
+
+            # Reseta votos e estado de pronto para a nova votação
+            self._reset_votes()
+            snap = self._publish_snapshot()
+            self._notify_clients_chat_update(seq)
+
+            # Notifica os clientes que os votos foram zerados
+            self._notify_clients_vote_update(snap)
+
+            return False, "Empate na votação. Votem novamente!"
+
+        winning_choice_index = random.choice(winners) if len(winners) > 1 else winners[0]
+
+        if winning_choice_index != -1:
+            if 0 <= winning_choice_index < len(current_page_data['choices']):
+                next_page_id = current_page_data['choices'][winning_choice_index]['next_page']
+                ROUND_VOTES.observe(tally.num_votes)
+                (PAGE_SECONDS_DEADLINE if timed_out else PAGE_SECONDS_ALL).observe(time.monotonic() - self.page_started)
+                self._set_page(next_page_id)
+
+                # Limpa tudo para a nova página (votos persistentes já foram processados)
+                self._reset_votes()
+
+                choice_text = current_page_data['choices'][winning_choice_index]['text']
+                if not timed_out:
+                    seq = self._append_chat(f"[SISTEMA] A maioria votou em: '{choice_text}'. Avançando.")
+                elif len(winners) > 1:
+                    seq = self._append_chat(f"[SISTEMA] Tempo esgotado! Empate decidido por sorteio: '{choice_text}'. Avançando.")
+                else:
+                    seq = self._append_chat(f"[SISTEMA] Tempo esgotado! A maioria dos votos foi para: '{choice_text}'. Avançando.")
+
+                snap = self._publish_snapshot()
+                self._notify_clients_page_update(snap.page_id, snap.page_json)
+                self._notify_clients_chat_update(seq)
+                self._notify_clients_vote_update(snap)
+                return True, f"Avançado para a página: {snap.page_id}"
+            else:
+                return False, "Erro: Voto vencedor inválido."
+        else:
+            return False, "Não foi possível determinar um vencedor."
+
+        # --- FIM DA LÓGICA DE AVANÇO ---
+
+    # --- Prazos da rodada (chamar com self.lock adquirido) ---
+
+    def _schedule_deadline(self):
+        """
+        Arma, troca ou desarma o prazo da rodada conforme o estado atual. O prazo
+        de votação começa no primeiro voto; quando todos os jogadores ativos
+        votaram, passa a valer o prazo para clicarem "Avançar". Um prazo armado
+        nunca é adiado (só trocado pelo de "Avançar"), então a rodada dura no
+        máximo vote_timeout + ready_timeout depois do primeiro voto.
+        """
+        if self.timers is None:
+            return
+        old = deadline = self.deadline
+        if deadline is not None and deadline.round != self.votes_reset_version:
+            self._cancel_deadline() # a rodada dele já acabou
+            deadline = None
+
+        if not self.tally.num_votes:
+            phase = None
+        elif self.ready_timeout and self.tally.all_voted():
+            phase = PHASE_READY
+        elif deadline is not None and deadline.phase == PHASE_READY:
+            phase = PHASE_READY # alguém entrou ou trocou o voto: o prazo de "Avançar" continua
+        elif self.vote_timeout:
+            phase = PHASE_VOTE
+        else:
+            phase = None
+
+        if (deadline.phase if deadline is not None else None) == phase and deadline is old:
+            return # nada mudou
+        if deadline is not None:
+            self._cancel_deadline()
+        if phase is not None:
+            timeout = self.ready_timeout if phase == PHASE_READY else self.vote_timeout
+            round_version = self.votes_reset_version
+            timer = self.timers.schedule(timeout, self._deadline_expired, phase, round_version)
+            self.deadline = RoundDeadline(phase, round_version, timer)
+        self._notify_clients_round_update()
+
+    def _cancel_deadline(self):
+        self.timers.cancel(self.deadline.timer)
+        self.deadline = None
+
+    def _deadline_expired(self, phase, round_version):
+        """Chamado pela roda de temporizadores quando o prazo vence."""
+        with self.lock:
+            deadline = self.deadline
+            if deadline is None or (deadline.phase, deadline.round) != (phase, round_version):
+                return # a rodada acabou (ou o prazo mudou) enquanto o temporizador disparava
+            self.deadline = None
+            print(f"[{self.room_id}] Prazo ({phase}) da rodada esgotado: decidindo com {self.tally.num_votes} voto(s).")
+            self._resolve_round(timed_out=True)
+            self._schedule_deadline()
+        self._sync_journal()
+
+    # --- Mutações de estado (chamar sempre com self.lock adquirido) ---
+    # Cada uma avança a versão correspondente usada por get_state_since.
+
+    # Todas registram um evento no journal; replay_event reaplica as mesmas mutações na recuperação.
+
+    def _append_chat(self, message):
+        self._record("chat", message)
+        seq = self.chat.append(message)
+        if self.archive is not None:
+            self.archive.append(self.room_id, seq, message)
+        return seq
+
+    def _set_vote(self, username, choice_index):
+        # O tally primeiro: se ele recusar o voto, o evento não fica no journal (e não
+        # quebraria a recuperação ao ser reaplicado)
+        self.tally.vote(username, choice_index)
+        self._record("vote", username, choice_index)
+        self.vote_log.append(username)
+        self.votes_version += 1
+
+    def _reset_votes(self):
+        """Zera votos e estado "pronto" (empate ou nova página)."""
+        self._record("reset")
+        self.tally.reset()
+        self.vote_log = []
+        self.votes_version += 1
+        self.votes_reset_version = self.votes_version
+        if self.audience is not None:
+            self.audience.reset(self.votes_reset_version)
+
+    def _set_page(self, page_id):
+        self._record("page", page_id)
+        self.current_page_id = page_id
+        self.page_version += 1
+        self.page_started = time.monotonic()
+
+    def _add_player(self, username):
+        if self.tally.add_player(username):
+            self._record("join", username)
+
+    def _remove_player(self, username):
+        self._record("leave", username)
+        self.tally.remove_player(username)
+
+    def _set_ready(self, username):
+        self._record("ready", username)
+        self.tally.set_ready(username)
+
+    def _unset_ready(self, username):
+        self._record("unready", username)
+        self.tally.unset_ready(username)
+
+    def _clear_ready(self):
+        self._record("clear_ready")
+        self.tally.clear_ready()
+
+    def _record(self, kind, *args):
+        if self.journal is not None:
+            self.journal_seq = self.journal.append(self.room_id, kind, *args)
+
+    def _sync_journal(self):
+        """Com fsync=always, espera o último evento da sala chegar ao disco (chamar sem o lock)."""
+        if self.journal is not None:
+            self.journal.wait(self.journal_seq)
+
+    # --- Journal: snapshot e recuperação ---
+
+    def replay_event(self, seq, kind, args):
+        """Reaplica um evento do journal (na recuperação, antes de o journal ser ligado à sala)."""
+        with self.lock:
+            getattr(self, JOURNAL_EVENTS[kind])(*args)
+            self.journal_seq = seq
+
+    def capture_state(self):
+        """Estado durável da sala para o snapshot do journal (as conexões não entram)."""
+        with self.lock:
+            return {
+                "room_id": self.room_id,
+                "journal_seq": self.journal_seq,
+                "page_id": self.current_page_id,
+                "versions": [self.page_version, self.votes_version, self.votes_reset_version],
+                "chat_last_seq": self.chat.last_seq,
+                "chat": [[seq, message] for seq, message, _json in self.chat.window(1, self.chat.last_seq)],
+                "players": sorted(self.tally.names(self.tally.players)),
+                "votes": self.tally.votes_dict(),
+                "ready": sorted(self.tally.names(self.tally.ready)),
+                "vote_log": self.vote_log,
+            }
+
+    def restore_state(self, state):
+        with self.lock:
+            self.journal_seq = state["journal_seq"]
+            self.current_page_id = state["page_id"]
+            self.page_version, self.votes_version, self.votes_reset_version = state["versions"]
+            self.chat.restore(state["chat"], state["chat_last_seq"])
+            self.tally = VoteTally(self.players, state["votes"])
+            for username in state["players"]:
+                self.tally.add_player(username)
+            for username in state["ready"]:
+                self.tally.set_ready(username)
+            self.vote_log = list(state["vote_log"])
+            if self.audience is not None:
+                self.audience.reset(self.votes_reset_version)
+
+    def continue_archived_chat(self):
+        """Fim da recuperação: se o arquivo do chat tem seqs além dos do journal, o chat continua depois deles."""
+        if self.archive is not None:
+            with self.lock:
+                self.chat.skip_to(self.archive.room(self.room_id).last_seq)
+
+    def attach_journal(self, journal):
+        """Fim da recuperação: publica o estado recuperado e passa a registrar as mutações."""
+        with self.lock:
+            self.journal = journal
+            self._publish_snapshot()
+        self._prefetch_images(self.current_page_id)
+
+    def _publish_snapshot(self):
+        """
+        Publica um novo GameSnapshot com o estado atual (chamar com self.lock adquirido,
+        depois das mutações). A troca de self.snapshot é uma única atribuição, então
+        os leitores sempre enxergam um estado completo e consistente.
+        """
+        tally = tuple(self.tally.tally(self.story.num_choices(self.current_page_id)))
+        snap = GameSnapshot(
+            versions=(self.page_version, self.chat.last_seq, self.votes_version),
+            page_id=self.current_page_id,
+            page_json=self.story.page_json(self.current_page_id),
+            votes=self.tally.snapshot_votes(),
+            tally=tally,
+            tally_json=json.dumps(tally),
+            vote_log=tuple(self.vote_log),
+            votes_reset_version=self.votes_reset_version,
+            current_players=len(self.connections),
+            total_players_ever=self.tally.num_players(),
+        )
+        self.snapshot = snap
+        return snap
+
+    # Funções de notificação: apenas enfileiram no PushDispatcher (não bloqueiam).
+    # Só as conexões da sala recebem, e o id da sala vai como último argumento.
+    def _publish(self, kind, payload, *args, merge=None):
+        self.push.publish(kind, payload, *args, self.room_id, targets=[*self.connections, *self.watchers],
+                          topic=self.room_id, merge=merge)
+
+    def _notify_clients_page_update(self, page_id, page_json):
+        self._publish("on_page_update", page_id, page_json)
+        self._prefetch_images(page_id)
+
+    def _prefetch_images(self, page_id):
+        """Baixa em segundo plano as imagens da página e das que podem vir depois dela."""
+        if self.images is not None:
+            self.images.prefetch(page_image_urls(self.story, page_id))
+
+    def _notify_clients_round_update(self):
+        """Avisa a fase com prazo e os segundos restantes; o cliente faz a contagem regressiva."""
+        self._publish("on_round_update", self._round_json(self.deadline))
+
+    def _round_json(self, deadline):
+        if deadline is None:
+            return '{"phase": null, "remaining": null}'
+        return json.dumps({"phase": deadline.phase, "remaining": round(self.timers.remaining(deadline.timer), 2)})
+
+    def _notify_clients_chat_update(self, seq):
+        """
+        Envia só a mensagem nova; updates ainda não entregues são concatenados.
+        Com chat_broadcast_interval, a primeira mensagem depois de um intervalo
+        sem push sai na hora, e as seguintes esperam o fim do intervalo e saem
+        todas num único push (_flush_chat).
+        """
+        if not self.chat_broadcast_interval:
+            self._publish("on_chat_update", encode_chat_entries(self.chat.window(seq, seq)), merge=_merge_chat_push)
+            CHAT_PUSH_MESSAGES.observe(1)
+            return
+        if self.chat_unsent_seq is None:
+            self.chat_unsent_seq = seq
+        if self.chat_flush is not None:
+            return # o push já agendado leva esta mensagem junto
+        wait = self.chat_broadcast_at + self.chat_broadcast_interval - time.monotonic()
+        if wait <= 0:
+            self._flush_chat()
+        else:
+            self.chat_flush = self.timers.schedule(wait, self._chat_flush_expired)
+
+    def _chat_flush_expired(self):
+        """Chamado pela roda de temporizadores no fim do intervalo entre pushes de chat."""
+        with self.lock:
+            self.chat_flush = None
+            self._flush_chat()
+
+    def _flush_chat(self):
+        """Um push com as mensagens ainda não enviadas (só as últimas CHAT_SYNC_WINDOW; o cliente ressincroniza o resto)."""
+        if self.chat_unsent_seq is None:
+            return
+        last_seq = self.chat.last_seq
+        entries = self.chat.window(max(self.chat_unsent_seq, last_seq - CHAT_SYNC_WINDOW + 1), last_seq)
+        self.chat_unsent_seq = None
+        self.chat_broadcast_at = time.monotonic()
+        self._publish("on_chat_update", encode_chat_entries(entries), merge=_merge_chat_push)
+        CHAT_PUSH_MESSAGES.observe(len(entries))
+
+    def _notify_clients_vote_update(self, snap, changed_votes=None):
+        """
+        Envia {"reset", "votes", "tally", "version"}: só os votos alterados (ou todos,
+        após um reset), a contagem já calculada e a versão dos votos, que o cliente
+        compara com a das sincronizações; updates ainda não entregues são combinados.
+        """
+        version = ', "version": ' + str(snap.versions[2]) + "}"
+        if changed_votes is None:
+            votes_json = '{"reset": true, "votes": ' + snap.votes.json() + ', "tally": ' + snap.tally_json + version
+        else:
+            votes_json = '{"reset": false, "votes": ' + json.dumps(changed_votes) + ', "tally": ' + snap.tally_json + version
+        self._publish("on_vote_update", votes_json, merge=_merge_vote_push)
+
+
+def _valid_choice(choice_index, num_choices):
+    """
+    Índice de escolha vindo de um cliente (voto de jogador, do execute_batch ou
+    da plateia): só int de verdade. bool e float passariam na comparação e
+    iriam parar nas contagens; str levantaria TypeError do outro lado do RPC.
+    """
+    return type(choice_index) is int and 0 <= choice_index < num_choices
+
+
+def _merge_chat_push(pending_args, new_args):
+    """Junta dois pushes de chat pendentes para o mesmo cliente, mantendo no máximo CHAT_SYNC_WINDOW mensagens."""
+    pending = json.loads(pending_args[0])
+    new = json.loads(new_args[0])
+    if pending["first_seq"] is None or pending["first_seq"] + len(pending["messages"]) != new["first_seq"]:
+        return new_args
+    messages = (pending["messages"] + new["messages"])[-CHAT_SYNC_WINDOW:]
+    first_seq = new["first_seq"] + len(new["messages"]) - len(messages)
+    return (json.dumps({"first_seq": first_seq, "messages": messages}),) + new_args[1:]
+
+
+def _merge_vote_push(pending_args, new_args):
+    """Junta dois pushes de voto pendentes para o mesmo cliente."""
+    new = json.loads(new_args[0])
+    if new["reset"]:
+        return new_args
+    pending = json.loads(pending_args[0])
+    pending["votes"].update(new["votes"])
+    pending["tally"] = new["tally"]
+    pending["version"] = new["version"]
+    return (json.dumps(pending),) + new_args[1:]
+
+
+class RoomRegistry:
+    """
+    Todas as salas do servidor. O lock do registro só é usado para criar
+    salas; cada sala tem o seu próprio lock para o jogo em si.
+    """
+    def __init__(self, push=None, chat_capacity=CHAT_CAPACITY, story=None, graph=None, images=None, journal=None,
+                 snapshot_every=SNAPSHOT_EVERY, vote_timeout=None, ready_timeout=None, audience_weight=0.0,
+                 archive=None, chat_limits=None, chat_broadcast_interval=0.0):
+        self.push = push if push is not None else PushDispatcher()
+        self.chat_capacity = chat_capacity
+        # Arquivo do chat em disco (chat_archive.ChatArchive) compartilhado pelas salas, ou None
+        self.archive = archive
+        # Prazos das rodadas (segundos, None = sem prazo): uma só roda de temporizadores para todas as salas
+        self.vote_timeout = vote_timeout
+        self.ready_timeout = ready_timeout
+        # Limites do chat (rate_limit.ChatLimits, None = sem limite) e intervalo mínimo entre pushes de chat
+        self.chat_limits = chat_limits
+        self.chat_broadcast_interval = chat_broadcast_interval
+        if vote_timeout or ready_timeout or audience_weight or chat_broadcast_interval:
+            self.timers = TimerWheel(tick=min(TIMER_TICK, chat_broadcast_interval or TIMER_TICK))
+        else:
+            self.timers = None
+        # Peso da plateia no avanço (0 desliga a votação da plateia); a contagem sai a cada AUDIENCE_TICK
+        self.audience_weight = audience_weight
+        self.rooms = {}
+        self.lock = threading.Lock()
+
+        # História compartilhada por todas as salas; por padrão, a de story_data
+        self.story = story if story is not None else InMemoryStory(story_pages, current_page_id)
+        # Análise do grafo da história (StoryGraph); se não vier pronta, é feita no primeiro uso
+        self.graph = graph
+        self.graph_lock = threading.Lock()
+        # Cache das imagens das cenas (image_cache.ImageCache); None desliga o cache e o prefetch
+        self.images = images
+
+        self.journal = None # ligado só depois da recuperação
+        # Durante a recuperação, os seqs do chat vêm do journal (ver create e continue_archived_chat)
+        self.recovering = journal is not None
+
+        # O jogo original vira a sala padrão, com os dados iniciais de story_data
+        self.default_room = self.create(DEFAULT_ROOM_ID, chat_messages=chat_messages, votes=votes)
+
+        # Com journal, recupera as salas do snapshot e dos eventos seguintes antes de ligá-lo
+        if journal is not None:
+            self.recover(journal)
+            for room in list(self.rooms.values()):
+                room.continue_archived_chat()
+                room.attach_journal(journal)
+            self.recovering = False
+            self.journal = journal
+            if snapshot_every:
+                journal.start_snapshots(self.capture_states, every=snapshot_every)
+
+        if audience_weight:
+            self.timers.schedule(AUDIENCE_TICK, self._audience_tick)
+
+    def create(self, room_id=None, **room_kwargs):
+        """Cria a sala (com id aleatório se room_id for None). Se já existir, devolve a existente."""
+        room_id = room_id or uuid.uuid4().hex[:8]
+        with self.lock:
+            room = self.rooms.get(room_id)
+            if room is None:
+                # Sem journal, a sala recomeça vazia, mas o arquivo do chat continua: os seqs
+                # novos vêm depois dos arquivados, senão colidiriam com os da sessão anterior
+                if self.archive is not None and not self.recovering:
+                    room_kwargs.setdefault("chat_start_seq", self.archive.room(room_id).last_seq)
+                room = GameRoom(room_id, self.push, self.story, self.chat_capacity, images=self.images,
+                                journal=self.journal, timers=self.timers, vote_timeout=self.vote_timeout,
+                                ready_timeout=self.ready_timeout, audience_weight=self.audience_weight,
+                                archive=self.archive, chat_limits=self.chat_limits,
+                                chat_broadcast_interval=self.chat_broadcast_interval, **room_kwargs)
+                self.rooms[room_id] = room
+                if self.journal is not None:
+                    self.journal.append(room_id, "create", room.current_page_id)
+        return room
+
+    def get(self, room_id):
+        room = self.rooms.get(room_id)
+        if room is None:
+            raise RoomNotFound(f"Sala '{room_id}' não existe.")
+        return room
+
+    def list_rooms(self):
+        return [room.summary() for room in list(self.rooms.values())]
+
+    def recover(self, journal):
+        """Reconstrói as salas a partir do snapshot e dos eventos posteriores do journal."""
+        states, events = journal.load()
+        for state in states:
+            self.create(state["room_id"]).restore_state(state)
+        count = 0
+        for seq, room_id, kind, args in events:
+            count += 1
+            if kind == "create":
+                self.create(room_id, start_page_id=args[0])
+                continue
+            room = self.create(room_id)
+            if seq > room.journal_seq: # eventos já incluídos no snapshot da sala são pulados
+                room.replay_event(seq, kind, args)
+        if states or count:
+            print(f"Journal: {len(states)} salas do snapshot, {count} eventos reaplicados.")
+
+    def _audience_tick(self):
+        """Tick da plateia (na roda de temporizadores): manda a contagem de cada sala que recebeu votos."""
+        try:
+            for room in list(self.rooms.values()):
+                room.audience_tick()
+        finally:
+            self.timers.schedule(AUDIENCE_TICK, self._audience_tick)
+
+    def capture_states(self):
+        return [room.capture_state() for room in list(self.rooms.values())]
+
+    def story_graph(self):
+        if self.graph is None:
+            with self.graph_lock:
+                if self.graph is None:
+                    self.graph = StoryGraph(self.story)
+        return self.graph
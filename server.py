@@ -1,259 +1,509 @@
 import rpyc
-import threading
-import time
-import json 
-from story_data import story_pages, current_page_id, chat_messages, votes
+import json
+import sys
+from rpyc.utils.helpers import classpartial
+from push import PushDispatcher, SLOW_POLICY_DROP, SLOW_POLICY_DISCONNECT
+from story_bundle import open_story
+from story_graph import StoryGraph, InvalidStory
+from image_cache import ImageCache, IMAGE_CACHE_DIR
+from journal import Journal, FSYNC_POLICIES, FSYNC_BATCH
+from chat_archive import ChatArchive, SEGMENT_BYTES
+from heartbeat import HeartbeatMonitor, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, HEARTBEAT_MISSES
+from rate_limit import ChatLimits, CHAT_RATE, CHAT_BURST, ROOM_CHAT_RATE, ROOM_CHAT_BURST
+from rooms import RoomRegistry, RoomNotFound, DEFAULT_ROOM_ID, CHAT_CAPACITY, CHAT_SYNC_WINDOW, CHAT_BROADCAST_INTERVAL
+from metrics import METRICS, timed, start_metrics_server
+from wire import ENCODINGS
+
+# Nome reservado das conexões de serviço (controle do roteador do cluster,
+# conexão compartilhada do app Streamlit): não são jogadores, não entram em
+# sala nenhuma e só recebem push das salas que pedirem com watch_room.
+SERVICE_USERNAME = "__service__"
+
+RPC_LATENCY = METRICS.histogram("story_rpc_seconds", "Latência dos RPCs exposed_* do StoryGameService", ("method",))
+RPC_ERRORS = METRICS.counter("story_rpc_errors_total", "RPCs que terminaram com exceção", ("method",))
 
 class StoryGameService(rpyc.Service):
-    def exposed_get_atomic_game_state(self):
-        """Busca página, chat, votos e contagem de jogadores de forma atômica."""
-        with self.lock:
-            page_id = self.current_page_id
-            page_data_json = json.dumps(story_pages[page_id])
-            chat_json = json.dumps(list(self.chat_messages))
-            votes_json = json.dumps(dict(self.votes))
-            
-            # NOVO: Adiciona contagem de jogadores
-            current_players = len(self.client_map)
-            total_players_ever = len(self.all_player_names)
-            
-            return page_id, page_data_json, chat_json, votes_json, current_players, total_players_ever
-        
-
-    def __init__(self):
-        self.current_page_id = current_page_id
-        self.chat_messages = chat_messages
-        self.votes = votes
-        self.lock = threading.Lock()
-        self.clients = [] 
-        self.client_map = {} # Mapeia 'conn.root' (serviço cliente) -> 'username'
-        self.players_ready_to_advance = set()
-        
-        # NOVO: Rastreia todos os jogadores que já se conectaram
-        self.all_player_names = set() 
-        self.max_players_connected = 0 # Mantido, mas a lógica de avanço usará all_player_names
+    """
+    Serviço RPyC do jogo. O RPyC cria uma instância por conexão (ver classpartial
+    no __main__), então cada instância sabe quem é o seu cliente; o estado do
+    jogo fica nas salas do RoomRegistry compartilhado.
+
+    Todos os RPCs de jogo aceitam um room_id opcional; sem ele vale a sala em
+    que a conexão está (a sala padrão, a menos que tenha chamado join_room).
+
+    Com `heartbeat` (heartbeat.HeartbeatMonitor), a conexão é vigiada por
+    pings e expulsa se o cliente parar de responder.
+    """
+    def __init__(self, registry, heartbeat=None):
+        self.registry = registry
+        self.heartbeat = heartbeat
+        self.conn = None
+        self.username = None
+        self.room_id = DEFAULT_ROOM_ID
+        self.watching = set() # salas observadas por uma conexão de serviço
+
+    def _room(self, room_id=None):
+        return self.registry.get(room_id or self.room_id)
 
     def on_connect(self, conn):
         try:
             # o cliente expõe exposed_get_username — o RPyC permite chamar conn.root.get_username()
-            username = conn.root.get_username() 
+            username = conn.root.get_username()
             if not username:
                 raise ValueError("Cliente não retornou um username.")
-            
-            # NOVO: Adiciona o nome ao conjunto persistente
-            with self.lock:
-                self.all_player_names.add(username)
-                
-            self.client_map[conn.root] = username
-            self.clients.append(conn)
-            
-            current_player_count = len(self.client_map)
-            if current_player_count > self.max_players_connected:
-                self.max_players_connected = current_player_count
-                
-            print(f"Cliente conectado: {conn} (Usuário: {username})")
-            print(f"Jogadores atuais: {current_player_count}. Máximo de jogadores: {self.max_players_connected}")
-            print(f"Lista de todos os jogadores que já entraram: {self.all_player_names}")
 
+            # Descobre os callbacks do cliente antes de pegar qualquer lock (são chamadas remotas)
+            self.registry.push.register(conn)
+            if self.heartbeat is not None:
+                self.heartbeat.add(conn)
+            if username == SERVICE_USERNAME:
+                self.conn = conn
+                for room_id in self.watching:
+                    self.registry.create(room_id).watch(conn)
+                return
+            # A sala inicial também faz parte do handshake (exposed_get_room_id, opcional):
+            # a conexão entra direto nela, sem passar pela sala padrão
+            if hasattr(conn.root, "get_room_id"):
+                room_id = conn.root.get_room_id()
+                if room_id:
+                    ok, msg = self.exposed_join_room(room_id)
+                    if not ok:
+                        raise ValueError(msg)
+            self.attach(conn, username)
 
         except Exception as e:
             print(f"Falha na conexão do cliente: {e}")
-            conn.close() 
+            conn.close()
+
+    def attach(self, conn, username):
+        """
+        Coloca a conexão (já registrada no push) na sala dela. Separado do
+        on_connect para ser reaproveitado pelo gateway asyncio.
+        """
+        self.conn = conn
+        self.username = username
+
+        # Todo cliente começa na sala padrão (o jogo original), a não ser que tenha
+        # dado outra no handshake ou chamado join_room enquanto ele era respondido
+        room = self._room()
+        current_player_count = room.connect(conn, username)
+
+        print(f"Cliente conectado: {conn} (Usuário: {username}, Sala: {room.room_id})")
+        print(f"Jogadores atuais: {current_player_count}. Máximo de jogadores: {room.max_players_connected}")
+        print(f"Total de jogadores que já entraram: {room.tally.num_players()}")
+
+    def spectate(self, conn, room_id=None):
+        """
+        Conexão de espectador (já registrada no push, ex.: gateway com "spectator"):
+        recebe os push da sala sem ser jogadora, e vota pela plateia (audience_vote).
+        """
+        self.conn = conn
+        room = self.registry.create(room_id or self.room_id)
+        self.room_id = room.room_id
+        self.watching.add(room.room_id)
+        room.watch(conn)
 
     def on_disconnect(self, conn):
         print(f"Cliente desconectado: {conn}")
-        if conn in self.clients:
-            self.clients.remove(conn)
-        
-        username = self.client_map.pop(conn.root, None) 
-        
-        # Quando desconecta, removemos apenas o estado "pronto"
-        if username and username in self.players_ready_to_advance:
-            self.players_ready_to_advance.remove(username)
-            print(f"Estado 'pronto' do usuário {username} removido.")
-        
+        self.registry.push.unregister(conn)
+        if self.heartbeat is not None:
+            self.heartbeat.discard(conn)
+        for room_id in self.watching:
+            self.registry.get(room_id).unwatch(conn)
+        if self.username is None:
+            return
+        try:
+            room = self._room()
+        except RoomNotFound:
+            return
+        username = room.disconnect(conn)
+
         # NÃO remover o voto do jogador — voto persiste mesmo se desconectar
-        if username and username in self.votes:
+        if username and room.tally.has_voted(username):
             print(f"Usuário {username} desconectado. Seu voto foi mantido.")
 
-    def exposed_get_current_page(self):
-        with self.lock:
-            page_data_json = json.dumps(story_pages[self.current_page_id])
-            return self.current_page_id, page_data_json 
-
-    def exposed_get_chat_messages(self):
-        with self.lock:
-            return json.dumps(list(self.chat_messages)) 
-
-    def exposed_get_votes(self):
-        with self.lock:
-            return json.dumps(dict(self.votes)) 
-
-    def exposed_send_chat_message(self, username, message):
-        chat_json = None 
-        with self.lock:
-            self.chat_messages.append(f"[{username}] {message}")
-            chat_json = json.dumps(list(self.chat_messages)) 
-        
-        self._notify_clients_chat_update(chat_json) 
-        return True
-
-    def exposed_vote(self, username, choice_index):
-        votes_json = None 
-        with self.lock:
-            current_page = story_pages[self.current_page_id]
-            if not (0 <= choice_index < len(current_page['choices'])):
-                return False, "Escolha inválida."
-
-            self.votes[username] = choice_index
-            
-            # Se o usuário votar, seu estado de "pronto" é resetado
-            if username in self.players_ready_to_advance:
-                self.players_ready_to_advance.remove(username)
-                
-            votes_json = json.dumps(dict(self.votes)) 
-        
-        self._notify_clients_vote_update(votes_json) 
-        return True, "Voto registrado."
-
-    def exposed_check_and_advance_page(self, username):
-        page_json = None
-        id_copy = None
-        chat_json = None
-        votes_json = None
-        advanced = False
-
-        with self.lock:
-            current_page_data = story_pages[self.current_page_id]
-            if not current_page_data['choices']:
-                return False, "Página final, sem escolhas."
-
-            # --- LÓGICA DE AVANÇO (USANDO all_player_names) ---
-            
-            # Usa o conjunto de todos os jogadores que já se conectaram
-            all_players = set(self.all_player_names)  # faz cópia defensiva
-            total_players_required = len(all_players)
-            
-            if total_players_required == 0:
-                return False, "Nenhum jogador conectado."
-            
-            # 1. Marca o jogador como "pronto"
-            self.players_ready_to_advance.add(username)
-            print(f"Jogador {username} está pronto. Prontos: {self.players_ready_to_advance}")
-
-            # 2. Verifica se todos votaram (considerando todos que já entraram)
-            voted_players = set(self.votes.keys())
-            waiting_for_vote = sorted(list(all_players - voted_players))
-            
-            if waiting_for_vote:
-                # Se ainda faltam votos, o clique em "Avançar" não conta — remove o "pronto" deste usuário
-                self.players_ready_to_advance.discard(username)
-                msg = f"Aguardando {len(waiting_for_vote)}/{total_players_required} votarem: {', '.join(waiting_for_vote)}"
-                return False, msg
-
-            # 3. Se todos votaram, verifica se todos estão prontos (clicaram "Avançar")
-            ready_players = set(self.players_ready_to_advance)
-            waiting_for_ready = sorted(list(all_players - ready_players))
-
-            if waiting_for_ready:
-                msg = f"Aguardando {len(waiting_for_ready)}/{total_players_required} clicarem 'Avançar': {', '.join(waiting_for_ready)}"
-                return False, msg
-
-            # 4. Se todos votaram E todos estão prontos, processa os votos
-            vote_counts = {}
-            for voter, choice_idx in self.votes.items():
-                vote_counts[choice_idx] = vote_counts.get(choice_idx, 0) + 1
-            
-            if not vote_counts:
-                 # Caso excepcional: limpa estado de pronto e recusa avanço
-                 self.players_ready_to_advance.clear()
-                 return False, "Sem votos válidos."
-
-            max_votes = max(vote_counts.values())
-            winners = []
-            for choice_idx, count in vote_counts.items():
-                if count == max_votes:
-                    winners.append(choice_idx)
-            
-            if len(winners) > 1:
-                # Lógica de empate: anuncia no chat, reseta votos e estado "pronto" e notifica os clientes
-                self.chat_messages.append(f"[SISTEMA] Houve um empate! Votem novamente para desempatar.")
-                chat_json_tie = json.dumps(list(self.chat_messages))
-                threading.Timer(0.1, self._notify_clients_chat_update, [chat_json_tie]).start()
-                
-                # Reseta votos e estado de pronto para a nova votação
-                self.players_ready_to_advance.clear()
-                self.votes.clear() 
-                
-                # Notifica os clientes que os votos foram zerados
-                votes_json_tie = json.dumps(self.votes)
-                threading.Timer(0.1, self._notify_clients_vote_update, [votes_json_tie]).start()
-                
-                return False, "Empate na votação. Votem novamente!"
-
-            winning_choice_index = winners[0]
-
-            if winning_choice_index != -1:
-                if 0 <= winning_choice_index < len(current_page_data['choices']):
-                    next_page_id = current_page_data['choices'][winning_choice_index]['next_page']
-                    self.current_page_id = next_page_id
-                    page_copy = story_pages[self.current_page_id] 
-                    
-                    # Limpa tudo para a nova página (votos persistentes já foram processados)
-                    self.votes.clear() 
-                    self.players_ready_to_advance.clear() 
-                    
-                    self.chat_messages.append(f"[SISTEMA] A maioria votou em: '{current_page_data['choices'][winning_choice_index]['text']}'. Avançando.")
-                    
-                    id_copy = self.current_page_id
-                    page_json = json.dumps(page_copy)
-                    chat_json = json.dumps(list(self.chat_messages))
-                    votes_json = json.dumps(dict(self.votes))
-                    advanced = True
-                else:
-                    return False, "Erro: Voto vencedor inválido."
-            else:
-                return False, "Não foi possível determinar um vencedor."
-            
-            # --- FIM DA LÓGICA DE AVANÇO ---
-
-        # Fora do lock: notifica clientes se avançou
-        if advanced:
-            self._notify_clients_page_update(id_copy, page_json)
-            self._notify_clients_chat_update(chat_json)
-            self._notify_clients_vote_update(votes_json)
-            return True, f"Avançado para a página: {id_copy}"
-            
-        return False, "Não foi possível avançar a página."
-    
-    # Funções de notificação (sem alterações)
-    def _notify_clients_page_update(self, page_id, page_json):
-        for client_conn in self.clients:
-            try:
-                if hasattr(client_conn.root, 'on_page_update'):
-                    client_conn.root.on_page_update(page_id, page_json)
-            except Exception as e:
-                print(f"Erro ao notificar cliente (página): {e}")
-
-    def _notify_clients_chat_update(self, chat_json):
-        for client_conn in self.clients:
-            try:
-                if hasattr(client_conn.root, 'on_chat_update'):
-                    client_conn.root.on_chat_update(chat_json)
-            except Exception as e:
-                print(f"Erro ao notificar cliente (chat): {e}")
-
-    def _notify_clients_vote_update(self, votes_json):
-        for client_conn in self.clients:
-            try:
-                if hasattr(client_conn.root, 'on_vote_update'):
-                    client_conn.root.on_vote_update(votes_json)
-            except Exception as e:
-                print(f"Erro ao notificar cliente (voto): {e}")
+    # --- Salas ---
 
+    def exposed_list_rooms(self):
+        """JSON com id, página atual e jogadores de cada sala."""
+        return json.dumps(self.registry.list_rooms())
 
-if __name__ == "__main__":
+    def exposed_create_room(self, room_id=None):
+        """Cria uma sala (id aleatório se não for dado) e retorna o id dela."""
+        return self.registry.create(room_id).room_id
+
+    def exposed_join_room(self, room_id, create=True):
+        """
+        Move esta conexão para outra sala: sai da atual (deixando de ser exigida
+        para avançar lá) e entra na nova. Retorna (sucesso, mensagem).
+        """
+        if room_id == self.room_id:
+            return True, f"Você já está na sala {room_id}."
+        try:
+            new_room = self.registry.create(room_id) if create else self.registry.get(room_id)
+        except RoomNotFound as e:
+            return False, str(e)
+
+        if self.username is None:
+            # O on_connect ainda está esperando o get_username: só troca a sala inicial
+            self.room_id = new_room.room_id
+            return True, f"Você entrou na sala {self.room_id}."
+
+        self._room().leave(self.conn)
+        new_room.connect(self.conn, self.username)
+        self.room_id = new_room.room_id
+        print(f"Usuário {self.username} entrou na sala {self.room_id}")
+        return True, f"Você entrou na sala {self.room_id}."
+
+    def exposed_watch_room(self, room_id):
+        """
+        Conexão de serviço passa a receber os push da sala sem ser jogadora
+        (ex.: a conexão compartilhada por todas as abas do app Streamlit). A sala
+        é criada se ainda não existir.
+        """
+        if self.username is not None:
+            return False, "Só conexões de serviço podem observar salas."
+        self.watching.add(room_id)
+        if self.conn is not None:
+            self.registry.create(room_id).watch(self.conn)
+        # Senão o on_connect ainda espera o get_username e inscreve a conexão ao terminar
+        return True, f"Observando a sala {room_id}."
+
+    # --- Leitores ---
+
+    def exposed_get_atomic_game_state(self, room_id=None):
+        """Busca página, chat, votos e contagem de jogadores de forma atômica."""
+        return self._room(room_id).get_atomic_game_state()
+
+    def exposed_get_state_since(self, versions=None, room_id=None):
+        """Sincronização incremental (ver GameRoom.get_state_since); None se a sala não existe."""
+        try:
+            room = self._room(room_id)
+        except RoomNotFound:
+            return None
+        return room.get_state_since(versions)
+
+    def exposed_get_encodings(self):
+        """Codificações do estado que este servidor entende, em ordem de preferência (ver wire.negotiate)."""
+        return ENCODINGS
+
+    def exposed_get_state_since_compact(self, versions=None, names=None, room_id=None):
+        """get_state_since na codificação compacta (bytes; ver wire.py e GameRoom.get_state_since_compact)."""
+        try:
+            room = self._room(room_id)
+        except RoomNotFound:
+            return None
+        return room.get_state_since_compact(versions, names)
+
+    def exposed_get_chat_page(self, before_seq=None, limit=CHAT_SYNC_WINDOW, room_id=None):
+        """Histórico do chat sob demanda (ver GameRoom.get_chat_page)."""
+        return self._room(room_id).get_chat_page(before_seq, limit)
+
+    def exposed_get_chat_range(self, start_seq=1, limit=CHAT_SYNC_WINDOW, room_id=None):
+        """Histórico do chat em ordem crescente a partir de start_seq, inclusive o arquivado em disco (ver GameRoom.get_chat_range)."""
+        return self._room(room_id).get_chat_range(start_seq, limit)
+
+    def exposed_get_story_analysis(self, page_id=None, room_id=None):
+        """
+        Resumo da análise do grafo da história (links, ciclos, finais) e os
+        dados pré-calculados de page_id (por padrão, a página atual da sala),
+        como JSON.
+        """
+        graph = self.registry.story_graph()
+        if page_id is None:
+            page_id = self._room(room_id).current_page_id
+        try:
+            page = graph.page_info(page_id)
+        except KeyError:
+            page = None
+        return json.dumps({"summary": graph.summary(), "page": page})
+
+    def exposed_get_page_image(self, page_id=None, room_id=None):
+        """
+        Imagem da cena de page_id (por padrão, a página atual da sala), já
+        reduzida e servida do cache local: (page_id, bytes JPEG), ou
+        (page_id, None) se o cache está desligado ou a imagem não pôde ser baixada.
+        """
+        if page_id is None:
+            page_id = self._room(room_id).current_page_id
+        story = self.registry.story
+        url = story.page(page_id).get("image_url") if page_id in story else None
+        if self.registry.images is None or not url:
+            return page_id, None
+        return page_id, self.registry.images.get(url)
+
+    def exposed_get_metrics(self, room_id=None):
+        """
+        Métricas deste servidor no formato texto do Prometheus (o mesmo do
+        --metrics-port). room_id só importa no cluster: escolhe o worker.
+        """
+        return METRICS.render()
+
+    def exposed_get_current_page(self, room_id=None):
+        return self._room(room_id).get_current_page()
+
+    def exposed_get_chat_messages(self, room_id=None):
+        return self._room(room_id).get_chat_messages()
+
+    def exposed_get_votes(self, room_id=None):
+        return self._room(room_id).get_votes()
+
+    def exposed_get_audience(self, room_id=None):
+        """JSON {"round", "tally", "viewers"} da votação da plateia (o mesmo do push on_audience_update)."""
+        return self._room(room_id).get_audience()
+
+    def exposed_get_round_deadline(self, room_id=None):
+        """JSON {"phase", "remaining"} do prazo da rodada; depois disso, as mudanças chegam pelo push on_round_update."""
+        return self._room(room_id).get_round_deadline()
+
+    # --- Ações dos jogadores ---
+
+    def exposed_send_chat_message(self, username, message, room_id=None):
+        try:
+            room = self._room(room_id)
+        except RoomNotFound as e:
+            return False, str(e)
+        # O limite do chat é do login da conexão, não do username do argumento (que o
+        # cliente pode trocar a cada mensagem); conexões de serviço repassam o username
+        return room.send_chat_message(username, message, sender=self.username)
+
+    def exposed_vote(self, username, choice_index, room_id=None):
+        try:
+            room = self._room(room_id)
+        except RoomNotFound as e:
+            return False, str(e)
+        return room.vote(username, choice_index)
+
+    def exposed_check_and_advance_page(self, username, room_id=None):
+        try:
+            room = self._room(room_id)
+        except RoomNotFound as e:
+            return False, str(e)
+        return room.check_and_advance_page(username)
+
+    def exposed_audience_vote(self, viewer, choice_index, round_id=None, room_id=None):
+        """Voto de um espectador (não precisa ser jogador da sala). Retorna (sucesso, mensagem)."""
+        try:
+            room = self._room(room_id)
+        except RoomNotFound as e:
+            return False, str(e)
+        return room.audience_vote(viewer, choice_index, round_id)
+
+    def exposed_audience_votes(self, votes, round_id=None, room_id=None):
+        """
+        Vários votos da plateia numa chamada, para quem junta os votos de muitos
+        espectadores (ex.: um site de transmissão). `votes` deve ser uma tupla de
+        tuplas (espectador, escolha): listas viriam por referência, um RPC por item.
+        Retorna quantos foram aceitos (0 se a sala não existe).
+        """
+        try:
+            room = self._room(room_id)
+        except RoomNotFound:
+            return 0
+        return room.audience_votes(votes, round_id)
+
+    def exposed_execute_batch(self, username, commands, versions=None, names=None, room_id=None):
+        """
+        Vários comandos numa ida e volta: aplica-os em ordem sob uma única
+        aquisição do lock da sala (ver GameRoom.execute_batch) e já devolve o
+        estado depois deles. `commands` é uma tupla de tuplas, ex.:
+        (("vote", 1), ("advance",)). Retorna (resultados, delta), com um
+        (sucesso, mensagem) por comando executado e o delta de get_state_since
+        desde `versions`; com `names` (ver get_state_since_compact), o delta
+        vem na codificação compacta. Se a sala não existe, nenhum comando roda:
+        volta um único (False, mensagem) e o delta None.
+        """
+        try:
+            room = self._room(room_id)
+        except RoomNotFound as e:
+            return ((False, str(e)),), None
+        results = tuple(room.execute_batch(username, commands, sender=self.username))
+        if names is not None:
+            return results, room.get_state_since_compact(versions, names)
+        return results, room.get_state_since(versions)
+
+
+# Todo RPC exposto registra latência e erros (inclusive os chamados pelo gateway)
+for _name, _method in list(vars(StoryGameService).items()):
+    if _name.startswith("exposed_"):
+        setattr(StoryGameService, _name, timed(_name[len("exposed_"):], _method, RPC_LATENCY, RPC_ERRORS))
+
+
+def register_gauges(registry, heartbeat=None):
+    """Gauges do servidor, calculados a cada coleta a partir do registro de salas."""
+    push = registry.push
+
+    def rooms():
+        return list(registry.rooms.values())
+    METRICS.gauge("story_connected_clients", "Conexões inscritas nos push (jogadores e serviços)",
+                  lambda: len(push.channels))
+    METRICS.gauge("story_players_connected", "Jogadores conectados, somando todas as salas",
+                  lambda: sum(room.snapshot.current_players for room in rooms()))
+    METRICS.gauge("story_rooms", "Salas abertas", lambda: len(registry.rooms))
+    METRICS.gauge("story_chat_messages", "Mensagens no chat ao vivo, somando todas as salas",
+                  lambda: sum(min(room.chat.last_seq, room.chat.capacity) for room in rooms()))
+    METRICS.gauge("story_votes", "Votos da rodada atual, somando todas as salas",
+                  lambda: sum(len(room.snapshot.votes) for room in rooms()))
+    METRICS.gauge("story_push_queue", "Canais esperando um worker de push", push.tasks.qsize)
+    METRICS.gauge("story_audience_viewers", "Espectadores que votaram na rodada atual, somando todas as salas",
+                  lambda: sum(room.audience.collect()[2] for room in rooms() if room.audience is not None))
+    METRICS.gauge("story_round_deadlines", "Temporizadores armados na roda (prazos de rodada, pushes de chat adiados)",
+                  lambda: registry.timers.pending if registry.timers is not None else 0)
+    METRICS.gauge("story_chat_archive_bytes", "Bytes do arquivo do chat em disco, somando as salas já abertas",
+                  lambda: registry.archive.size() if registry.archive is not None else 0)
+    METRICS.gauge("story_push_lagging_clients", "Clientes com entregas de push lentas ou com falha no momento",
+                  push.lagging_clients)
+    METRICS.gauge("story_heartbeat_connections", "Conexões vigiadas pelo heartbeat",
+                  lambda: len(heartbeat.connections) if heartbeat is not None else 0)
+
+
+def check_story(story):
+    """Analisa a história, imprime os avisos e levanta InvalidStory se houver erros."""
+    graph = StoryGraph(story)
+    for warning in graph.validate():
+        print(f"Aviso da história: {warning}")
+    return graph
+
+
+def serve(hostname="0.0.0.0", port=18861, push_workers=4, slow_policy=SLOW_POLICY_DROP, chat_capacity=CHAT_CAPACITY,
+          gateway_port=None, story_path=None, image_cache_dir=IMAGE_CACHE_DIR, image_cache_mb=200,
+          journal_dir=None, journal_fsync=FSYNC_BATCH, metrics_port=None, vote_timeout=None, ready_timeout=None,
+          audience_weight=0.0, chat_archive_dir=None, chat_segment_bytes=SEGMENT_BYTES,
+          chat_rate=CHAT_RATE, chat_burst=CHAT_BURST, room_chat_rate=ROOM_CHAT_RATE, room_chat_burst=ROOM_CHAT_BURST,
+          chat_broadcast_interval=CHAT_BROADCAST_INTERVAL, heartbeat_interval=HEARTBEAT_INTERVAL,
+          heartbeat_timeout=HEARTBEAT_TIMEOUT, heartbeat_misses=HEARTBEAT_MISSES):
+    """
+    Sobe um servidor RPyC com suas próprias salas (também usado por cada worker
+    do modo cluster). Com gateway_port, as mesmas salas também ficam acessíveis
+    pelo gateway asyncio nessa porta. story_path é um bundle compilado (ou
+    fonte JSON/YAML); sem ele vale a história de story_data. As imagens das
+    cenas ficam em image_cache_dir (None desliga o cache). Com journal_dir, o
+    estado das salas é gravado em disco e recuperado ao reiniciar. Com
+    metrics_port, as métricas ficam em http://127.0.0.1:<metrics_port>/metrics.
+    vote_timeout e ready_timeout (segundos) ligam os prazos das rodadas e
+    audience_weight > 0 liga a votação da plateia. Com chat_archive_dir, todo
+    o chat fica gravado em disco (ver chat_archive.py). chat_rate/chat_burst
+    e room_chat_rate/room_chat_burst limitam as mensagens de chat por jogador
+    e por sala (taxa 0 desliga; ver rate_limit.py), e cada sala manda no
+    máximo um push de chat a cada chat_broadcast_interval segundos (0 desliga).
+    A cada heartbeat_interval segundos (0 desliga) as conexões recebem um ping,
+    e quem não responder heartbeat_misses seguidos em heartbeat_timeout é expulso.
+    """
     from rpyc.utils.server import ThreadedServer
-    print("Iniciando servidor RPyC...")
-    t = ThreadedServer(StoryGameService(), hostname="0.0.0.0", port=18861)
-    t.start()
+
+    story = open_story(story_path or "story_data")
+    # Recusa histórias quebradas antes de aceitar jogadores (InvalidStory)
+    graph = check_story(story)
+    push = PushDispatcher(workers=push_workers, slow_policy=slow_policy)
+    images = ImageCache(image_cache_dir, max_bytes=image_cache_mb * 1024 * 1024) if image_cache_dir else None
+    journal = Journal(journal_dir, fsync=journal_fsync) if journal_dir else None
+    archive = ChatArchive(chat_archive_dir, segment_bytes=chat_segment_bytes) if chat_archive_dir else None
+    chat_limits = ChatLimits(chat_rate, chat_burst, room_chat_rate, room_chat_burst) if chat_rate or room_chat_rate else None
+    registry = RoomRegistry(push=push, chat_capacity=chat_capacity, story=story, graph=graph, images=images,
+                            journal=journal, vote_timeout=vote_timeout, ready_timeout=ready_timeout,
+                            audience_weight=audience_weight, archive=archive, chat_limits=chat_limits,
+                            chat_broadcast_interval=chat_broadcast_interval)
+    heartbeat = HeartbeatMonitor(heartbeat_interval, heartbeat_timeout, heartbeat_misses).start() if heartbeat_interval else None
+    register_gauges(registry, heartbeat)
+    if metrics_port:
+        start_metrics_server(metrics_port)
+    if gateway_port:
+        from gateway import start_gateway_thread
+        start_gateway_thread(registry, hostname, gateway_port)
+    t = ThreadedServer(classpartial(StoryGameService, registry, heartbeat), hostname=hostname, port=port)
+    try:
+        t.start()
+    finally:
+        if heartbeat is not None:
+            heartbeat.stop()
+        if journal is not None:
+            journal.close()
+        if archive is not None:
+            archive.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servidor do jogo de aventura")
+    parser.add_argument("--port", type=int, default=18861)
+    parser.add_argument("--push-workers", type=int, default=4, help="threads que entregam as notificações push")
+    parser.add_argument("--slow-policy", choices=[SLOW_POLICY_DROP, SLOW_POLICY_DISCONNECT], default=SLOW_POLICY_DROP,
+                        help="o que fazer com clientes lentos: parar de notificar ou desconectar")
+    parser.add_argument("--chat-capacity", type=int, default=CHAT_CAPACITY, help="mensagens mantidas no chat ao vivo de cada sala")
+    parser.add_argument("--gateway-port", type=int, default=None,
+                        help="também aceita jogadores pelo gateway asyncio (JSON com prefixo de tamanho) nesta porta")
+    parser.add_argument("--story", default=None,
+                        help="história a usar: bundle compilado com story_bundle.py ou fonte .json/.yaml")
+    parser.add_argument("--image-cache", default=IMAGE_CACHE_DIR,
+                        help="diretório do cache das imagens das cenas (vazio desliga o cache)")
+    parser.add_argument("--image-cache-mb", type=int, default=200, help="tamanho máximo do cache de imagens em disco")
+    parser.add_argument("--journal", default=None,
+                        help="diretório do journal: o estado das salas sobrevive a reinícios do servidor")
+    parser.add_argument("--journal-fsync", choices=FSYNC_POLICIES, default=FSYNC_BATCH,
+                        help="always: responde só depois do fsync; batch: fsync em segundo plano; never: sem fsync")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve as métricas (formato Prometheus) em 127.0.0.1 nesta porta; no cluster, uma porta por worker a partir dela")
+    parser.add_argument("--vote-timeout", type=float, default=None,
+                        help="segundos, a partir do primeiro voto, para a rodada ser decidida com os votos que houver")
+    parser.add_argument("--ready-timeout", type=float, default=None,
+                        help="segundos, depois de todos votarem, para a rodada ser decidida sem esperar o 'Avançar' de todos")
+    parser.add_argument("--audience-weight", type=float, default=0.0,
+                        help="liga a votação da plateia: quantos votos de jogador a plateia inteira vale (0 desliga)")
+    parser.add_argument("--chat-archive", default=None,
+                        help="diretório do arquivo do chat: guarda todo o histórico em disco (moderação e replay)")
+    parser.add_argument("--chat-segment-mb", type=int, default=SEGMENT_BYTES // (1024 * 1024),
+                        help="tamanho dos segmentos do arquivo do chat")
+    parser.add_argument("--chat-rate", type=float, default=CHAT_RATE,
+                        help="mensagens de chat por segundo de cada jogador (0 desliga o limite)")
+    parser.add_argument("--chat-burst", type=int, default=CHAT_BURST,
+                        help="mensagens seguidas que um jogador pode mandar antes de o limite valer")
+    parser.add_argument("--room-chat-rate", type=float, default=ROOM_CHAT_RATE,
+                        help="mensagens de chat por segundo de cada sala, somando os jogadores (0 desliga o limite)")
+    parser.add_argument("--room-chat-burst", type=int, default=ROOM_CHAT_BURST,
+                        help="mensagens seguidas que uma sala aceita antes de o limite valer")
+    parser.add_argument("--chat-broadcast-interval", type=float, default=CHAT_BROADCAST_INTERVAL,
+                        help="segundos entre pushes de chat de uma sala; as mensagens do intervalo vão juntas (0 desliga)")
+    parser.add_argument("--heartbeat-interval", type=float, default=HEARTBEAT_INTERVAL,
+                        help="segundos entre pings às conexões, para expulsar clientes travados (0 desliga)")
+    parser.add_argument("--heartbeat-timeout", type=float, default=HEARTBEAT_TIMEOUT,
+                        help="segundos esperando a resposta de cada ping")
+    parser.add_argument("--heartbeat-misses", type=int, default=HEARTBEAT_MISSES,
+                        help="pings seguidos sem resposta até a conexão ser expulsa")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="se > 0, divide as salas entre este número de processos, atrás de um roteador na --port")
+    parser.add_argument("--worker-base-port", type=int, default=18900, help="porta local do primeiro worker no modo cluster")
+    args = parser.parse_args()
+
+    try:
+        if args.workers > 0:
+            from cluster import serve_cluster
+            print(f"Iniciando roteador com {args.workers} workers...")
+            serve_cluster(args.workers, hostname="0.0.0.0", port=args.port, worker_base_port=args.worker_base_port,
+                          push_workers=args.push_workers, slow_policy=args.slow_policy, chat_capacity=args.chat_capacity,
+                          story_path=args.story, image_cache_dir=args.image_cache or None,
+                          image_cache_mb=args.image_cache_mb, journal_dir=args.journal,
+                          journal_fsync=args.journal_fsync, metrics_port=args.metrics_port,
+                          vote_timeout=args.vote_timeout, ready_timeout=args.ready_timeout,
+                          audience_weight=args.audience_weight, chat_archive_dir=args.chat_archive,
+                          chat_segment_bytes=args.chat_segment_mb * 1024 * 1024, chat_rate=args.chat_rate,
+                          chat_burst=args.chat_burst, room_chat_rate=args.room_chat_rate,
+                          room_chat_burst=args.room_chat_burst, chat_broadcast_interval=args.chat_broadcast_interval,
+                          heartbeat_interval=args.heartbeat_interval, heartbeat_timeout=args.heartbeat_timeout,
+                          heartbeat_misses=args.heartbeat_misses)
+        else:
+            print("Iniciando servidor RPyC...")
+            serve(port=args.port, push_workers=args.push_workers, slow_policy=args.slow_policy,
+                  chat_capacity=args.chat_capacity, gateway_port=args.gateway_port, story_path=args.story,
+                  image_cache_dir=args.image_cache or None, image_cache_mb=args.image_cache_mb,
+                  journal_dir=args.journal, journal_fsync=args.journal_fsync, metrics_port=args.metrics_port,
+                  vote_timeout=args.vote_timeout, ready_timeout=args.ready_timeout,
+                  audience_weight=args.audience_weight, chat_archive_dir=args.chat_archive,
+                  chat_segment_bytes=args.chat_segment_mb * 1024 * 1024, chat_rate=args.chat_rate,
+                  chat_burst=args.chat_burst, room_chat_rate=args.room_chat_rate,
+                  room_chat_burst=args.room_chat_burst, chat_broadcast_interval=args.chat_broadcast_interval,
+                  heartbeat_interval=args.heartbeat_interval, heartbeat_timeout=args.heartbeat_timeout,
+                  heartbeat_misses=args.heartbeat_misses)
+    except InvalidStory as e:
+        print(e)
+        sys.exit(1)
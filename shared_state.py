@@ -0,0 +1,299 @@
+import json
+import threading
+from collections import namedtuple
+
+import rpyc
+from rpyc.utils.helpers import classpartial
+
+from wire import negotiate, CompactDecoder, decode_json_state, decode_round_deadline, ENCODING_COMPACT
+
+# Mesmo nome reservado do servidor (server.SERVICE_USERNAME): a conexão
+# compartilhada não é um jogador, só observa as salas
+SERVICE_USERNAME = "__service__"
+
+CHAT_CACHE_SIZE = 500 # mensagens mantidas por sala no cache local
+RECONCILE_INTERVAL = 5.0 # segundos entre conferências com get_state_since (contagem de jogadores, push perdido)
+
+# Estado de uma sala como as sessões enxergam: imutável, trocado inteiro a cada mudança.
+# `revision` cresce a cada mudança visível; é o que as sessões comparam para decidir se recarregam.
+RoomView = namedtuple("RoomView", [
+    "revision",
+    "page_id",
+    "page_data",
+    "chat_first_seq",
+    "chat_messages",        # tupla
+    "votes",
+    "vote_tally",
+    "current_players",
+    "total_players_ever",
+    "round_deadline",       # (fase, instante em time.monotonic() em que vence) ou None
+])
+
+
+class RoomStateCache:
+    """
+    Cópia local do estado de uma sala, alimentada pelos push do servidor e,
+    de tempos em tempos, por get_state_since. Aplicar o mesmo dado duas vezes
+    não muda nada, e cada parte guarda a versão que já aplicou: uma resposta
+    de sincronização que chega depois de push mais novos (ou um push atrasado
+    depois de uma sincronização) não volta o estado para trás.
+    """
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.lock = threading.Condition()
+        self.versions = None # versões enviadas ao get_state_since; só andam para frente
+        self.votes_version = -1 # versão dos votos já aplicada (sincronização ou push)
+        self.page_id = None
+        self.page_data = None
+        self.chat_messages = []
+        self.chat_first_seq = None
+        self.votes = {}
+        self.vote_tally = []
+        self.current_players = 0
+        self.total_players_ever = 0
+        self.round_deadline = None
+        self.view = RoomView(0, None, None, None, (), {}, [], 0, 0, None)
+        self.decoder = CompactDecoder() # usado só se o servidor fala a codificação compacta
+
+    # --- Atualizações (chamadas pela SharedGameConnection) ---
+
+    def apply_state_delta(self, delta):
+        """Aplica a resposta de get_state_since, já decodificada (ver wire.py)."""
+        versions, page_id, page_data, chat, votes, current_players, total_players_ever = delta
+        page_v, chat_v, votes_v = versions
+        with self.lock:
+            # Partes mais velhas do que o cache já tem (vindas de push) são ignoradas.
+            # Toda troca de página zera os votos, então a versão dos votos também
+            # ordena as páginas; a contagem de jogadores não tem versão e só é
+            # aplicada quando a resposta não é mais velha que o cache.
+            chat_stale = chat_v < self._chat_last_seq()
+            votes_stale = votes_v < self.votes_version
+            page_stale = votes_stale or (self.versions is not None and page_v < self.versions[0])
+            changed = False
+            if not (chat_stale or votes_stale):
+                changed = (current_players, total_players_ever) != (self.current_players, self.total_players_ever)
+                self.current_players, self.total_players_ever = current_players, total_players_ever
+            if page_data is not None and not page_stale:
+                changed |= self._set_page(page_id, page_data)
+            if chat is not None and not chat_stale:
+                changed |= self._merge_chat(chat["first_seq"], chat["messages"], chat["reset"])
+            if votes is not None and not votes_stale:
+                changed |= self._merge_votes(votes)
+            self.votes_version = max(self.votes_version, votes_v)
+            self.versions = tuple(versions) if self.versions is None else tuple(map(max, self.versions, versions))
+            if changed:
+                self._publish_view()
+
+    def apply_page_push(self, page_id, page_json):
+        with self.lock:
+            if page_id != self.page_id and self._set_page(page_id, json.loads(page_json)):
+                self._publish_view()
+
+    def apply_chat_push(self, messages_json):
+        """Retorna False se faltam mensagens entre o cache e o push (precisa sincronizar)."""
+        chat = json.loads(messages_json)
+        with self.lock:
+            if chat["first_seq"] is not None and self.chat_first_seq is not None \
+                    and chat["first_seq"] > self.chat_first_seq + len(self.chat_messages):
+                return False
+            if self._merge_chat(chat["first_seq"], chat["messages"], reset=False):
+                self._publish_view()
+        return True
+
+    def apply_vote_push(self, votes_json):
+        votes = json.loads(votes_json)
+        with self.lock:
+            version = votes.get("version")
+            if version is not None:
+                if version < self.votes_version:
+                    return # push atrasado: a sincronização já trouxe votos mais novos
+                self.votes_version = version
+            if self._merge_votes(votes):
+                self._publish_view()
+
+    def apply_round_push(self, round_json):
+        with self.lock:
+            self.round_deadline = decode_round_deadline(round_json)
+            self._publish_view()
+
+    def _chat_last_seq(self):
+        if self.chat_first_seq is None:
+            return -1
+        return self.chat_first_seq + len(self.chat_messages) - 1
+
+    # --- Mutações (chamar com self.lock adquirido); retornam se algo mudou ---
+
+    def _set_page(self, page_id, page_data):
+        if page_id == self.page_id:
+            return False
+        self.page_id = page_id
+        self.page_data = page_data
+        return True
+
+    def _merge_chat(self, first_seq, messages, reset):
+        if first_seq is None:
+            return False
+        if reset or self.chat_first_seq is None:
+            if first_seq == self.chat_first_seq and messages == self.chat_messages:
+                return False
+            self.chat_messages = list(messages)
+            self.chat_first_seq = first_seq
+        else:
+            # Descarta o que o cache já tem (push e sincronização podem trazer as mesmas mensagens)
+            known = self.chat_first_seq + len(self.chat_messages) - first_seq
+            new = messages[max(known, 0):]
+            if not new:
+                return False
+            self.chat_messages.extend(new)
+        overflow = len(self.chat_messages) - CHAT_CACHE_SIZE
+        if overflow > 0:
+            del self.chat_messages[:overflow]
+            self.chat_first_seq += overflow
+        return True
+
+    def _merge_votes(self, delta):
+        votes = dict(delta["votes"]) if delta["reset"] else {**self.votes, **delta["votes"]}
+        if votes == self.votes and delta["tally"] == self.vote_tally:
+            return False
+        self.votes = votes
+        self.vote_tally = delta["tally"]
+        return True
+
+    def _publish_view(self):
+        self.view = RoomView(
+            revision=self.view.revision + 1,
+            page_id=self.page_id,
+            page_data=self.page_data,
+            chat_first_seq=self.chat_first_seq,
+            chat_messages=tuple(self.chat_messages),
+            votes=dict(self.votes),
+            vote_tally=list(self.vote_tally),
+            current_players=self.current_players,
+            total_players_ever=self.total_players_ever,
+            round_deadline=self.round_deadline,
+        )
+        self.lock.notify_all()
+
+
+class _SubscriberService(rpyc.Service):
+    def __init__(self, shared):
+        self.shared = shared
+
+    def exposed_get_username(self):
+        return SERVICE_USERNAME
+
+    def exposed_on_page_update(self, page_id, page_json, room_id=None):
+        cache = self.shared.rooms.get(room_id)
+        if cache is not None:
+            cache.apply_page_push(page_id, page_json)
+
+    def exposed_on_chat_update(self, messages_json, room_id=None):
+        cache = self.shared.rooms.get(room_id)
+        if cache is not None and not cache.apply_chat_push(messages_json):
+            self.shared.request_sync()
+
+    def exposed_on_vote_update(self, votes_json, room_id=None):
+        cache = self.shared.rooms.get(room_id)
+        if cache is not None:
+            cache.apply_vote_push(votes_json)
+
+    def exposed_on_round_update(self, round_json, room_id=None):
+        cache = self.shared.rooms.get(room_id)
+        if cache is not None:
+            cache.apply_round_push(round_json)
+
+
+class SharedGameConnection:
+    """
+    Uma única conexão com o servidor para todas as sessões de um processo
+    (ex.: todas as abas do app Streamlit). Observa as salas pedidas com
+    room(), mantendo um RoomStateCache de cada uma: os push chegam por aqui
+    uma vez só, em vez de cada aba fazer polling.
+    """
+    def __init__(self, host="localhost", port=18861, reconcile_interval=RECONCILE_INTERVAL):
+        self.rooms = {} # room_id -> RoomStateCache
+        self.lock = threading.Lock()
+        self.reconcile_interval = reconcile_interval
+        self.sync_requested = threading.Event()
+        self.conn = rpyc.connect(host, port, service=classpartial(_SubscriberService, self))
+        threading.Thread(target=self.conn.serve_all, name="shared-conn", daemon=True).start()
+        self.compact = negotiate(self.conn.root) == ENCODING_COMPACT
+        self.decode_lock = threading.Lock() # a tabela de nomes de cada CompactDecoder não é thread-safe
+        threading.Thread(target=self._reconcile_loop, name="shared-conn-sync", daemon=True).start()
+
+    @property
+    def closed(self):
+        return self.conn.closed
+
+    def room(self, room_id):
+        """Cache da sala, começando a observá-la na primeira vez."""
+        cache = self.rooms.get(room_id)
+        if cache is not None:
+            return cache
+        with self.lock:
+            cache = self.rooms.get(room_id)
+            if cache is None:
+                cache = RoomStateCache(room_id)
+                ok, msg = self.conn.root.watch_room(room_id)
+                if not ok:
+                    raise RuntimeError(msg)
+                # Inscreve antes de sincronizar: o que mudar no meio chega por push
+                self.rooms[room_id] = cache
+                self.sync(cache)
+                cache.apply_round_push(self.conn.root.get_round_deadline(room_id=room_id))
+        return cache
+
+    def sync(self, cache):
+        root = self.conn.root
+        if self.compact:
+            data = root.get_state_since_compact(cache.versions, cache.decoder.names_state(), room_id=cache.room_id)
+            self._apply(cache, data)
+        else:
+            self._apply(cache, root.get_state_since(cache.versions, room_id=cache.room_id))
+
+    def execute_batch(self, game_service, username, commands, room_id):
+        """
+        Executa os comandos de um jogador pela conexão dele (game_service) com
+        execute_batch e aplica o estado devolvido ao cache da sala na mesma
+        ida e volta, sem esperar o push. Retorna os (sucesso, mensagem).
+        """
+        cache = self.room(room_id)
+        names = cache.decoder.names_state() if self.compact else None
+        results, delta = game_service.execute_batch(username, commands, cache.versions, names, room_id=room_id)
+        self._apply(cache, delta)
+        return results
+
+    def _apply(self, cache, delta):
+        if delta is None:
+            return # a sala não existe no servidor (ex.: o worker dela reiniciou sem journal)
+        # Respostas que se cruzam só podem trazer nomes que a tabela já tem ou
+        # os seguintes, então basta decodificar uma por vez
+        with self.decode_lock:
+            if self.compact:
+                cache.apply_state_delta(cache.decoder.decode(delta))
+            else:
+                cache.apply_state_delta(decode_json_state(delta))
+
+    def page_image(self, page_id):
+        """Bytes JPEG da imagem da página, do cache de imagens do servidor (None se indisponível)."""
+        _page_id, data = self.conn.root.get_page_image(page_id)
+        return data
+
+    def request_sync(self):
+        """Pede uma sincronização já (chamado da thread dos push, que não pode fazer RPC)."""
+        self.sync_requested.set()
+
+    def close(self):
+        self.conn.close()
+
+    def _reconcile_loop(self):
+        while not self.conn.closed:
+            self.sync_requested.wait(self.reconcile_interval)
+            self.sync_requested.clear()
+            try:
+                for cache in list(self.rooms.values()):
+                    self.sync(cache)
+            except EOFError:
+                return
+            except Exception as e:
+                print(f"Erro ao sincronizar o cache compartilhado: {e}")
@@ -0,0 +1,279 @@
+"""
+Histórias compiladas: em vez de carregar o dicionário inteiro (story_data)
+na memória, a história vira um arquivo binário lido por mmap, em que cada
+página já está codificada em JSON e é achada por um índice ordenado.
+
+Formato (little-endian):
+
+    cabeçalho   BUNDLE_HEADER (magic, versão, nº de páginas, página inicial, offsets)
+    payloads    JSON de cada página, em UTF-8, um atrás do outro
+    ids         ids das páginas em UTF-8, um atrás do outro
+    arestas     para cada página, o índice da página de destino de cada escolha
+                (u32; MISSING_PAGE se o next_page não existe)
+    índice      um INDEX_RECORD por página, ordenado pelos bytes do id
+
+Uso:
+    python story_bundle.py compilar historia.json historia.bundle
+    python story_bundle.py compilar historia.yaml historia.bundle
+    python story_bundle.py compilar story_data historia.bundle   (a história embutida)
+"""
+import json
+import mmap
+import struct
+import sys
+from array import array
+from functools import lru_cache
+from itertools import accumulate
+
+BUNDLE_MAGIC = b"STORYBND"
+BUNDLE_VERSION = 1
+# magic, versão, nº de páginas, índice da página inicial, offsets de ids, arestas e índice
+BUNDLE_HEADER = struct.Struct("<8sIII4xQQQ")
+# offset e tamanho do id, offset e tamanho do payload, offset das arestas, nº de escolhas
+INDEX_RECORD = struct.Struct("<QIQIQI")
+EDGE = struct.Struct("<I")
+MISSING_PAGE = 0xFFFFFFFF
+
+PAGE_CACHE_SIZE = 4096 # páginas decodificadas mantidas em memória
+
+
+class InMemoryStory:
+    """
+    História num dicionário (o formato de story_data). O JSON de cada página
+    é calculado uma vez e compartilhado por todas as salas.
+    """
+    def __init__(self, pages, start_page_id):
+        if start_page_id not in pages:
+            raise ValueError(f"Página inicial '{start_page_id}' não existe.")
+        self.pages = pages
+        self.start_page_id = start_page_id
+        self.page_json_cache = {page_id: json.dumps(page) for page_id, page in pages.items()}
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __contains__(self, page_id):
+        return page_id in self.pages
+
+    def page_ids(self):
+        return iter(self.pages)
+
+    def page(self, page_id):
+        return self.pages[page_id]
+
+    def page_json(self, page_id):
+        return self.page_json_cache[page_id]
+
+    def num_choices(self, page_id):
+        return len(self.pages[page_id]["choices"])
+
+    def next_page_ids(self, page_id):
+        return [choice["next_page"] for choice in self.pages[page_id]["choices"]]
+
+    def adjacency(self):
+        """
+        Grafo das páginas em forma compacta: (ids, offsets, targets). As escolhas
+        da página i levam a targets[offsets[i]:offsets[i + 1]] (índices em ids,
+        MISSING_PAGE se o next_page não existe).
+        """
+        ids = _IndexedIds(self.pages)
+        position = ids.position
+        targets = array("I", (position.get(next_page_id, MISSING_PAGE)
+                              for page_id in ids for next_page_id in self.next_page_ids(page_id)))
+        offsets = array("q", accumulate((len(self.pages[page_id]["choices"]) for page_id in ids), initial=0))
+        return ids, offsets, targets
+
+
+class StoryBundle:
+    """
+    História compilada, aberta com mmap: só o cabeçalho é lido na abertura;
+    páginas são achadas por busca binária no índice e decodificadas sob
+    demanda (as mais usadas ficam num cache LRU). Tem a mesma interface
+    de InMemoryStory.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.data)
+        magic, version, self.count, start_index, self.ids_offset, self.edges_offset, self.index_offset = \
+            BUNDLE_HEADER.unpack_from(self.data, 0)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"{path} não é um bundle de história.")
+        if version != BUNDLE_VERSION:
+            raise ValueError(f"Versão de bundle não suportada: {version}")
+        self.start_page_id = self._id_at(start_index)
+        self.page = lru_cache(maxsize=PAGE_CACHE_SIZE)(self._load_page)
+        self.page_json = lru_cache(maxsize=PAGE_CACHE_SIZE)(self._load_page_json)
+
+    def close(self):
+        self.view.release()
+        self.data.close()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, page_id):
+        return self._find(page_id) is not None
+
+    def page_ids(self):
+        return (self._id_at(i) for i in range(self.count))
+
+    def num_choices(self, page_id):
+        return self._record(self._index_of(page_id))[5]
+
+    def next_page_ids(self, page_id):
+        return [choice["next_page"] for choice in self.page(page_id)["choices"]]
+
+    def adjacency(self):
+        """Mesmo formato de InMemoryStory.adjacency, lido direto das tabelas do bundle (sem decodificar páginas)."""
+        index = self.view[self.index_offset:self.index_offset + self.count * INDEX_RECORD.size]
+        records = INDEX_RECORD.iter_unpack(index)
+        offsets = array("q", accumulate((record[5] for record in records), initial=0))
+        targets = array("I")
+        targets.frombytes(self.view[self.edges_offset:self.index_offset])
+        if sys.byteorder != "little":
+            targets.byteswap()
+        return _BundleIds(self), offsets, targets
+
+    def edges(self, index):
+        """Índices das páginas de destino de cada escolha da página `index` (MISSING_PAGE se não existe)."""
+        _id_off, _id_len, _off, _size, edges_offset, choices = self._record(index)
+        return [EDGE.unpack_from(self.data, edges_offset + i * EDGE.size)[0] for i in range(choices)]
+
+    # --- Índice ---
+
+    def _load_page(self, page_id):
+        return json.loads(self.page_json(page_id))
+
+    def _load_page_json(self, page_id):
+        # Decodifica direto da memoryview do mmap, sem copiar os bytes antes
+        _id_off, _id_len, offset, size, _edges, _choices = self._record(self._index_of(page_id))
+        return str(self.view[offset:offset + size], "utf-8")
+
+    def _record(self, index):
+        return INDEX_RECORD.unpack_from(self.data, self.index_offset + index * INDEX_RECORD.size)
+
+    def _id_bytes_at(self, index):
+        id_offset, id_len = self._record(index)[:2]
+        return self.data[id_offset:id_offset + id_len]
+
+    def _id_at(self, index):
+        return self._id_bytes_at(index).decode("utf-8")
+
+    def _find(self, page_id):
+        key = page_id.encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self._id_bytes_at(mid)
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def _index_of(self, page_id):
+        index = self._find(page_id)
+        if index is None:
+            raise KeyError(page_id)
+        return index
+
+
+class _IndexedIds(list):
+    """Lista de ids com index() em tempo constante."""
+    def __init__(self, page_ids):
+        super().__init__(page_ids)
+        self.position = {page_id: i for i, page_id in enumerate(self)}
+
+    def index(self, page_id):
+        return self.position[page_id]
+
+
+class _BundleIds:
+    """Sequência dos ids de um bundle, decodificados só quando acessados."""
+    def __init__(self, bundle):
+        self.bundle = bundle
+
+    def __len__(self):
+        return self.bundle.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.bundle.count:
+            raise IndexError(index)
+        return self.bundle._id_at(index)
+
+    def index(self, page_id):
+        return self.bundle._index_of(page_id)
+
+
+def compile_bundle(pages, start_page_id, path):
+    """Escreve o bundle da história `pages` (dicionário no formato de story_data) em `path`."""
+    if start_page_id not in pages:
+        raise ValueError(f"Página inicial '{start_page_id}' não existe.")
+    ids = sorted(pages, key=lambda page_id: page_id.encode("utf-8"))
+    position = {page_id: i for i, page_id in enumerate(ids)}
+
+    payloads = [json.dumps(pages[page_id]).encode("utf-8") for page_id in ids]
+    encoded_ids = [page_id.encode("utf-8") for page_id in ids]
+    edges = [[position.get(choice["next_page"], MISSING_PAGE) for choice in pages[page_id]["choices"]]
+             for page_id in ids]
+
+    payloads_offset = BUNDLE_HEADER.size
+    ids_offset = payloads_offset + sum(map(len, payloads))
+    edges_offset = ids_offset + sum(map(len, encoded_ids))
+    index_offset = edges_offset + EDGE.size * sum(map(len, edges))
+
+    with open(path, "wb") as f:
+        f.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(ids), position[start_page_id],
+                                   ids_offset, edges_offset, index_offset))
+        f.writelines(payloads)
+        f.writelines(encoded_ids)
+        for targets in edges:
+            f.write(struct.pack(f"<{len(targets)}I", *targets))
+
+        payload_at, id_at, edges_at = payloads_offset, ids_offset, edges_offset
+        for payload, encoded_id, targets in zip(payloads, encoded_ids, edges):
+            f.write(INDEX_RECORD.pack(id_at, len(encoded_id), payload_at, len(payload), edges_at, len(targets)))
+            payload_at += len(payload)
+            id_at += len(encoded_id)
+            edges_at += EDGE.size * len(targets)
+    return len(ids)
+
+
+def load_story_source(source):
+    """
+    Lê uma história em JSON ou YAML: {"start": id, "pages": {...}} ou só o
+    dicionário de páginas (começando em "start"). "story_data" é a história embutida.
+    Retorna (páginas, id da página inicial).
+    """
+    if source == "story_data":
+        from story_data import story_pages, current_page_id
+        return story_pages, current_page_id
+    with open(source, encoding="utf-8") as f:
+        if source.endswith((".yaml", ".yml")):
+            import yaml # opcional: só necessário para histórias em YAML
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    if "pages" in data:
+        return data["pages"], data.get("start", "start")
+    return data, "start"
+
+
+def open_story(path):
+    """Abre um bundle compilado, ou compila na memória uma fonte JSON/YAML."""
+    if path.endswith((".json", ".yaml", ".yml")) or path == "story_data":
+        return InMemoryStory(*load_story_source(path))
+    return StoryBundle(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "compilar":
+        print("Uso: python story_bundle.py compilar <historia.json|.yaml|story_data> <saida.bundle>")
+        sys.exit(1)
+    pages, start_page_id = load_story_source(sys.argv[2])
+    count = compile_bundle(pages, start_page_id, sys.argv[3])
+    print(f"{count} páginas compiladas em {sys.argv[3]}")
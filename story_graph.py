@@ -0,0 +1,308 @@
+"""
+Análise do grafo da história, feita uma vez na inicialização do servidor a
+partir do índice de adjacência (story.adjacency()), em tempo linear no
+número de páginas e escolhas:
+
+    - links quebrados (next_page que não existe) e página inicial sem saída;
+    - páginas inalcançáveis a partir da página inicial;
+    - ciclos (componentes fortemente conexos, ex.: caverna -> start);
+    - para cada página, a menor distância até um final e os finais alcançáveis.
+
+Uso: python story_graph.py [historia.bundle|.json|.yaml|story_data]
+"""
+import sys
+from array import array
+from bisect import bisect_right
+from collections import deque
+from functools import lru_cache
+
+from story_bundle import MISSING_PAGE
+
+EXAMPLES_LIMIT = 10 # exemplos guardados de cada problema encontrado
+ENDINGS_LIMIT = 20 # finais listados por página em page_info (a contagem é sempre completa)
+# Acima deste total de bits (finais x componentes) os finais alcançáveis
+# deixam de ser pré-calculados e passam a ser buscados sob demanda
+ENDING_SETS_MAX_BITS = 1 << 27
+ENDINGS_CACHE_SIZE = 1024
+
+NO_DISTANCE = -1 # página que não chega a final nenhum
+
+
+class InvalidStory(ValueError):
+    """A história tem erros que quebrariam o jogo (links quebrados, sem final alcançável)."""
+
+
+class StoryGraph:
+    """
+    Índice do grafo da história. Páginas são tratadas pela posição em
+    `ids`; as escolhas da página i levam a targets[offsets[i]:offsets[i + 1]].
+    """
+    def __init__(self, story):
+        self.story = story
+        self.ids, self.offsets, self.targets = story.adjacency()
+        self.count = len(self.ids)
+        self.start = self.ids.index(story.start_page_id)
+        self.endings = [i for i in range(self.count) if self.offsets[i] == self.offsets[i + 1]]
+
+        self.dangling = self._find_dangling()
+        self.reachable = self._reachable_from(self.start)
+        self.unreachable_count = self.count - sum(self.reachable)
+        self.distance, self.nearest_ending = self._distances_to_endings()
+        self.component, self.cyclic, self.cycle_count, self.cycle_examples, self.ending_sets = self._components()
+        self.reachable_endings = lru_cache(maxsize=ENDINGS_CACHE_SIZE)(self._reachable_endings)
+        self._summary = self._build_summary() # o grafo não muda: calculado uma vez
+
+    # --- Consultas ---
+
+    def page_info(self, page_id):
+        """Dados pré-calculados de uma página (KeyError se não existe)."""
+        index = self.ids.index(page_id)
+        endings = self.reachable_endings(index)
+        nearest = self.nearest_ending[index]
+        return {
+            "page_id": page_id,
+            "is_ending": self.offsets[index] == self.offsets[index + 1],
+            "reachable_from_start": bool(self.reachable[index]),
+            "in_cycle": bool(self.cyclic[index]),
+            "distance_to_ending": self.distance[index],
+            "nearest_ending": self.ids[nearest] if nearest != NO_DISTANCE else None,
+            "reachable_endings_count": len(endings),
+            "reachable_endings": [self.ids[i] for i in endings[:ENDINGS_LIMIT]],
+        }
+
+    def summary(self):
+        """Números e exemplos da análise (o mesmo dict a cada chamada: não alterar)."""
+        return self._summary
+
+    def _build_summary(self):
+        start_distance = self.distance[self.start]
+        return {
+            "pages": self.count,
+            "choices": len(self.targets),
+            "start_page_id": self.ids[self.start],
+            "endings": len(self.endings),
+            "dangling_links": len(self.dangling),
+            "dangling_examples": self.dangling[:EXAMPLES_LIMIT],
+            "unreachable_pages": self.unreachable_count,
+            "unreachable_examples": [self.ids[i] for i in self._examples(lambda i: not self.reachable[i])],
+            "cycles": self.cycle_count,
+            "cycle_examples": self.cycle_examples,
+            "dead_end_pages": self.distance.count(NO_DISTANCE),
+            "dead_end_examples": [self.ids[i] for i in self._examples(lambda i: self.distance[i] == NO_DISTANCE)],
+            "start_distance_to_ending": start_distance,
+        }
+
+    def errors(self):
+        """Problemas que impedem o jogo de rodar com esta história."""
+        errors = [f"Link quebrado: página '{page_id}', escolha {choice}, aponta para '{next_page}' (não existe)."
+                  for page_id, choice, next_page in self.dangling[:EXAMPLES_LIMIT]]
+        if len(self.dangling) > EXAMPLES_LIMIT:
+            errors.append(f"... e mais {len(self.dangling) - EXAMPLES_LIMIT} links quebrados.")
+        if self.distance[self.start] == NO_DISTANCE:
+            errors.append(f"Nenhum final é alcançável a partir da página inicial '{self.ids[self.start]}'.")
+        return errors
+
+    def warnings(self):
+        """Problemas que não quebram o jogo (ciclos são permitidos, ex.: voltar ao início)."""
+        summary = self.summary()
+        warnings = []
+        if summary["unreachable_pages"]:
+            warnings.append(f"{summary['unreachable_pages']} páginas inalcançáveis a partir do início, "
+                            f"ex.: {', '.join(summary['unreachable_examples'])}.")
+        if summary["cycles"]:
+            cycles = "; ".join(" -> ".join(cycle) for cycle in summary["cycle_examples"])
+            warnings.append(f"{summary['cycles']} ciclos, ex.: {cycles}.")
+        if summary["dead_end_pages"]:
+            warnings.append(f"{summary['dead_end_pages']} páginas sem caminho até um final, "
+                            f"ex.: {', '.join(summary['dead_end_examples'])}.")
+        return warnings
+
+    def validate(self):
+        """Levanta InvalidStory se houver erros; retorna a lista de avisos."""
+        errors = self.errors()
+        if errors:
+            raise InvalidStory("História inválida:\n  " + "\n  ".join(errors))
+        return self.warnings()
+
+    # --- Construção ---
+
+    def _reachable_endings(self, index):
+        """Índices dos finais alcançáveis a partir da página `index` (ela mesma, se for final)."""
+        if self.ending_sets is not None:
+            mask = self.ending_sets[self.component[index]]
+            return [ending for bit, ending in enumerate(self.endings) if mask >> bit & 1]
+        seen = self._reachable_from(index)
+        return [ending for ending in self.endings if seen[ending]]
+
+    def _successors(self, index):
+        return self.targets[self.offsets[index]:self.offsets[index + 1]]
+
+    def _examples(self, predicate):
+        examples = []
+        for i in range(self.count):
+            if predicate(i):
+                examples.append(i)
+                if len(examples) == EXAMPLES_LIMIT:
+                    break
+        return examples
+
+    def _find_dangling(self):
+        """(página, nº da escolha, next_page) de cada escolha que leva a uma página inexistente."""
+        dangling = []
+        for position, target in enumerate(self.targets):
+            if target == MISSING_PAGE:
+                index = bisect_right(self.offsets, position) - 1
+                page_id = self.ids[index]
+                choice = position - self.offsets[index]
+                dangling.append((page_id, choice, self.story.next_page_ids(page_id)[choice]))
+        return dangling
+
+    def _reachable_from(self, source):
+        seen = bytearray(self.count)
+        seen[source] = 1
+        queue = deque([source])
+        while queue:
+            for target in self._successors(queue.popleft()):
+                if target != MISSING_PAGE and not seen[target]:
+                    seen[target] = 1
+                    queue.append(target)
+        return seen
+
+    def _reverse(self):
+        """Grafo invertido no mesmo formato (offsets, targets), ignorando links quebrados."""
+        counts = array("q", [0]) * (self.count + 1)
+        for target in self.targets:
+            if target != MISSING_PAGE:
+                counts[target + 1] += 1
+        for i in range(self.count):
+            counts[i + 1] += counts[i]
+        fill = array("q", counts)
+        sources = array("I", [0]) * counts[self.count]
+        for source in range(self.count):
+            for target in self._successors(source):
+                if target != MISSING_PAGE:
+                    sources[fill[target]] = source
+                    fill[target] += 1
+        return counts, sources
+
+    def _distances_to_endings(self):
+        """BFS a partir de todos os finais ao mesmo tempo, no grafo invertido."""
+        rev_offsets, rev_sources = self._reverse()
+        distance = array("l", [NO_DISTANCE]) * self.count
+        nearest = array("l", [NO_DISTANCE]) * self.count
+        for ending in self.endings:
+            distance[ending] = 0
+            nearest[ending] = ending
+        queue = deque(self.endings)
+        while queue:
+            page = queue.popleft()
+            for source in rev_sources[rev_offsets[page]:rev_offsets[page + 1]]:
+                if distance[source] == NO_DISTANCE:
+                    distance[source] = distance[page] + 1
+                    nearest[source] = nearest[page]
+                    queue.append(source)
+        return distance, nearest
+
+    def _components(self):
+        """
+        Tarjan iterativo. Os componentes saem em ordem topológica reversa
+        (sucessores antes), então os finais alcançáveis de cada componente
+        são a união dos seus próprios finais com os dos componentes seguintes.
+        Retorna (componente de cada página, páginas em ciclos, nº de ciclos,
+        exemplos de ciclos, finais alcançáveis por componente como bitset de
+        self.endings, ou None se passar de ENDING_SETS_MAX_BITS).
+        """
+        order = array("l", [-1]) * self.count     # ordem de descoberta
+        low = array("l", [0]) * self.count
+        component = array("l", [-1]) * self.count
+        on_stack = bytearray(self.count)
+        stack = []
+        ending_bit = {ending: 1 << bit for bit, ending in enumerate(self.endings)}
+        ending_sets = []
+        total_bits = 0
+        cycle_count = 0
+        cycle_examples = []
+        counter = 0
+        component_count = 0
+        cyclic = bytearray(self.count) # 1 se a página está em algum ciclo
+
+        for root in range(self.count):
+            if order[root] != -1:
+                continue
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            work = [(root, self.offsets[root])]
+            while work:
+                page, edge = work[-1]
+                if edge < self.offsets[page + 1]:
+                    work[-1] = (page, edge + 1)
+                    target = self.targets[edge]
+                    if target == MISSING_PAGE:
+                        continue
+                    if order[target] == -1:
+                        order[target] = low[target] = counter
+                        counter += 1
+                        stack.append(target)
+                        on_stack[target] = 1
+                        work.append((target, self.offsets[target]))
+                    elif on_stack[target] and order[target] < low[page]:
+                        low[page] = order[target]
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if low[page] < low[parent]:
+                        low[parent] = low[page]
+                if low[page] != order[page]:
+                    continue
+
+                # `page` é a raiz de um componente: desempilha os membros
+                members = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = 0
+                    members.append(member)
+                    if member == page:
+                        break
+                for member in members:
+                    component[member] = component_count
+                if len(members) > 1 or page in self._successors(page):
+                    cycle_count += 1
+                    for member in members:
+                        cyclic[member] = 1
+                    if len(cycle_examples) < EXAMPLES_LIMIT:
+                        cycle_examples.append([self.ids[m] for m in reversed(members[-EXAMPLES_LIMIT:])])
+                if ending_sets is not None:
+                    # Final é página sem escolhas, logo sempre um componente de uma página só
+                    successors = {component[target] for member in members for target in self._successors(member)
+                                  if target != MISSING_PAGE and component[target] != component_count}
+                    if len(successors) == 1:
+                        # Mesmo conjunto do único componente seguinte: compartilha o objeto
+                        mask = ending_sets[successors.pop()]
+                    else:
+                        mask = ending_bit.get(page, 0)
+                        for successor in successors:
+                            mask |= ending_sets[successor]
+                        total_bits += mask.bit_count()
+                    ending_sets.append(mask)
+                    if total_bits > ENDING_SETS_MAX_BITS:
+                        ending_sets = None
+                component_count += 1
+        return component, cyclic, cycle_count, cycle_examples, ending_sets
+
+
+if __name__ == "__main__":
+    from story_bundle import open_story
+
+    graph = StoryGraph(open_story(sys.argv[1] if len(sys.argv) > 1 else "story_data"))
+    for key, value in graph.summary().items():
+        print(f"{key}: {value}")
+    for warning in graph.warnings():
+        print(f"Aviso: {warning}")
+    errors = graph.errors()
+    for error in errors:
+        print(f"Erro: {error}")
+    sys.exit(1 if errors else 0)
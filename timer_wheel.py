@@ -0,0 +1,103 @@
+"""
+Roda de temporizadores (hashed timing wheel): uma única thread atende todos
+os prazos do servidor (ex.: os das rodadas de cada sala), em vez de uma
+threading.Timer (uma thread) por prazo.
+
+O tempo é dividido em ticks de `tick` segundos e cada temporizador fica no
+compartimento do tick em que vence (tick % slots); a cada tick a thread só
+olha um compartimento. Agendar e cancelar são O(1); a precisão é de um tick.
+Sem temporizadores pendentes, a thread dorme até o próximo agendamento.
+"""
+import math
+import threading
+import time
+
+TIMER_TICK = 0.1 # segundos por tick (a precisão dos prazos)
+
+
+class Timer:
+    __slots__ = ("due", "fn", "args", "cancelled")
+
+    def __init__(self, due, fn, args):
+        self.due = due # tick em que vence
+        self.fn = fn
+        self.args = args
+        self.cancelled = False
+
+
+class TimerWheel:
+    def __init__(self, tick=TIMER_TICK, slots=512):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.current = 0 # último tick processado
+        self.started = time.monotonic()
+        self.pending = 0 # temporizadores agendados e ainda não vencidos nem cancelados
+        self.cond = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="timer-wheel", daemon=True)
+        self.thread.start()
+
+    def schedule(self, delay, fn, *args):
+        """Chama fn(*args) na thread da roda daqui a `delay` segundos (arredondado para cima em ticks)."""
+        with self.cond:
+            now_tick = self._now_tick()
+            if not self.pending:
+                self.current = max(self.current, now_tick) # a roda estava parada: pula os ticks vazios
+            timer = Timer(max(now_tick, self.current) + max(math.ceil(delay / self.tick), 1), fn, args)
+            self.slots[timer.due % len(self.slots)].append(timer)
+            self.pending += 1
+            self.cond.notify()
+        return timer
+
+    def cancel(self, timer):
+        """Desarma o temporizador (sem efeito se ele já venceu). O compartimento é limpo quando a roda passa por ele."""
+        with self.cond:
+            if not timer.cancelled and timer.due > self.current:
+                timer.cancelled = True
+                self.pending -= 1
+
+    def remaining(self, timer):
+        """Segundos até o temporizador vencer (0 se já venceu)."""
+        return max(timer.due * self.tick - (time.monotonic() - self.started), 0.0)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    def _now_tick(self):
+        return int((time.monotonic() - self.started) / self.tick)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                target = self._now_tick()
+                if target <= self.current:
+                    self.cond.wait(((self.current + 1) * self.tick) - (time.monotonic() - self.started))
+                    continue
+                due = []
+                while self.current < target:
+                    self.current += 1
+                    slot = self.slots[self.current % len(self.slots)]
+                    if not slot:
+                        continue
+                    keep = []
+                    for timer in slot:
+                        if timer.cancelled:
+                            continue
+                        if timer.due <= self.current:
+                            due.append(timer)
+                        else:
+                            keep.append(timer) # vence numa das próximas voltas da roda
+                    slot[:] = keep
+                self.pending -= len(due)
+
+            for timer in due:
+                try:
+                    timer.fn(*timer.args)
+                except Exception as e:
+                    print(f"Erro num temporizador: {e}")
@@ -0,0 +1,444 @@
+"""
+Cliente de terminal em tela cheia (curses), guiado pelos push do servidor.
+
+O client.py só redesenha depois de um Enter, limpando a tela e imprimindo a
+página e o chat inteiros. Aqui a tela é dividida em regiões (cabeçalho,
+texto da página, opções com os votos, chat, status e a linha de digitação)
+e cada push só marca a sua região para redesenhar; o curses manda ao
+terminal apenas as células que mudaram. O painel do chat desenha só as
+mensagens que cabem nele, então o custo não cresce com o histórico.
+
+O loop de eventos espera (selectors) ao mesmo tempo pelo teclado e por um
+pipe que os callbacks de push acordam; os callbacks rodam na thread do
+RPyC e só avisam, quem fala com o servidor e com o curses é o loop.
+
+Teclas: Enter envia a linha, PgUp/PgDn rolam o chat (buscando mensagens
+mais antigas no servidor quando preciso), End volta para as mais novas.
+
+Uso: python tui.py <seu_nome_de_usuario> [sala]
+"""
+import json
+import os
+import selectors
+import sys
+import textwrap
+import time
+
+try:
+    import curses
+except ImportError: # Windows sem o pacote windows-curses
+    curses = None
+
+from client import StoryGameClient, ROUND_PHASES
+from wire import decode_round_deadline
+
+IDLE_TIMEOUT = 0.5 # segundos; o loop acorda assim mesmo para expirar o status e notar redimensionamentos
+KEY_TIMEOUT_MS = 100 # sem selectors (Windows), quanto cada leitura do teclado espera
+STATUS_SECONDS = 5
+MIN_CHAT_ROWS = 4
+REGIONS = ("header", "page", "choices", "chat_title", "chat", "status", "input")
+
+
+class CursesGameClient(StoryGameClient):
+    def __init__(self, username, room_id=None):
+        super().__init__(username, room_id)
+        self.screen = None
+        self.windows = {}
+        self.dirty = set(REGIONS) # regiões a redesenhar no próximo quadro
+        self.chat_scroll = 0 # mensagens escondidas abaixo do painel (0 = acompanhando as novas)
+        self.has_older_chat = True
+        self.players = (0, 0) # jogadores conectados, total que já entrou
+        self.input_buffer = ""
+        self.status = ""
+        self.status_until = 0.0
+        self.running = True
+        self.disconnected = False
+        self.push_pending = True # começa sincronizando
+        self.selector = None
+        self.wakeup_r = self.wakeup_w = None
+        self.shown_seconds = None # segundos do prazo da rodada mostrados no cabeçalho
+        self.audience_pushed = False # chegou contagem nova da plateia (redesenha as opções)
+
+    # --- Push (thread do RPyC): só acordam o loop ---
+
+    def exposed_on_page_update(self, page_id, page_json, room_id=None):
+        self._wake()
+
+    def exposed_on_chat_update(self, messages_json, room_id=None):
+        self._wake()
+
+    def exposed_on_vote_update(self, votes_json, room_id=None):
+        self._wake()
+
+    def exposed_on_round_update(self, round_json, room_id=None):
+        # O prazo vem inteiro no push: só precisa redesenhar, sem sincronizar
+        self.round_deadline = decode_round_deadline(round_json)
+        self._wake(sync=False)
+
+    def exposed_on_audience_update(self, audience_json, room_id=None):
+        self.audience = json.loads(audience_json)
+        self.audience_pushed = True
+        self._wake(sync=False)
+
+    def on_disconnect(self, conn):
+        self.disconnected = True
+        self._wake()
+
+    def _wake(self, sync=True):
+        if sync:
+            self.push_pending = True
+        if self.wakeup_w is not None:
+            try:
+                os.write(self.wakeup_w, b"!")
+            except BlockingIOError:
+                pass # o pipe cheio já garante que o loop vai acordar
+
+    # --- Estado ---
+
+    def _apply_state_delta(self, delta):
+        _versions, _page_id, page_data, chat_delta, votes_delta, current_players, total_players = delta
+        super()._apply_state_delta(delta)
+        if page_data is not None:
+            self.dirty.update(("header", "layout"))
+        if chat_delta is not None:
+            if chat_delta["reset"]:
+                self.chat_scroll = 0
+                self.has_older_chat = True
+            elif self.chat_scroll:
+                # Quem está lendo mensagens antigas continua vendo as mesmas
+                self.chat_scroll += len(chat_delta["messages"])
+            self.dirty.update(("chat", "chat_title"))
+        if votes_delta is not None:
+            self.dirty.add("choices")
+        if (current_players, total_players) != self.players:
+            self.players = (current_players, total_players)
+            self.dirty.add("header")
+
+    def _print_full_game_state(self):
+        pass # a tela é desenhada pelas regiões
+
+    def set_status(self, message):
+        self.status = message
+        self.status_until = time.monotonic() + STATUS_SECONDS
+        self.dirty.add("status")
+
+    # --- Loop de eventos ---
+
+    def run(self, screen):
+        self.screen = screen
+        curses.curs_set(1)
+        screen.keypad(True)
+        self._open_wakeup()
+        self._layout()
+        try:
+            while self.running and not self.disconnected:
+                self._wait()
+                self._read_keys()
+                if self.push_pending:
+                    self.push_pending = False
+                    self.fetch_state()
+                if self.status and time.monotonic() > self.status_until:
+                    self.status = ""
+                    self.dirty.add("status")
+                self._tick_countdown()
+                if self.audience_pushed:
+                    self.audience_pushed = False
+                    self.dirty.add("choices")
+                self._render()
+        except EOFError:
+            self.disconnected = True
+        finally:
+            self._close_wakeup()
+
+    def _tick_countdown(self):
+        """Redesenha o cabeçalho quando o segundo mostrado no prazo da rodada muda."""
+        remaining = self.round_remaining()
+        seconds = None if remaining is None else (remaining[0], int(remaining[1] + 0.999))
+        if seconds != self.shown_seconds:
+            self.shown_seconds = seconds
+            self.dirty.add("header")
+
+    def _open_wakeup(self):
+        try:
+            selector = selectors.DefaultSelector()
+            selector.register(sys.stdin, selectors.EVENT_READ)
+            self.wakeup_r, self.wakeup_w = os.pipe()
+        except (OSError, ValueError):
+            return # sem select no console (Windows): o teclado é lido com timeout
+        os.set_blocking(self.wakeup_r, False)
+        os.set_blocking(self.wakeup_w, False)
+        selector.register(self.wakeup_r, selectors.EVENT_READ)
+        self.selector = selector
+        self.screen.nodelay(True)
+
+    def _close_wakeup(self):
+        if self.selector is not None:
+            self.selector.close()
+            os.close(self.wakeup_r)
+            os.close(self.wakeup_w)
+            self.wakeup_r = self.wakeup_w = None
+
+    def _wait(self):
+        """Bloqueia até chegar uma tecla ou um push (ou IDLE_TIMEOUT)."""
+        if self.selector is None:
+            self.screen.timeout(KEY_TIMEOUT_MS)
+            return
+        self.selector.select(IDLE_TIMEOUT)
+        try:
+            while os.read(self.wakeup_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _read_keys(self):
+        while self.running:
+            try:
+                key = self.screen.get_wch()
+            except curses.error:
+                return # nada mais para ler agora
+            if self.selector is None:
+                self.screen.timeout(0)
+            self._handle_key(key)
+
+    def _handle_key(self, key):
+        if key in ("\n", "\r", curses.KEY_ENTER):
+            line, self.input_buffer = self.input_buffer.strip(), ""
+            self.dirty.add("input")
+            if line:
+                try:
+                    self.execute(line)
+                except EOFError:
+                    raise
+                except Exception as e:
+                    self.set_status(f"Erro: {e}")
+        elif key in ("\b", "\x7f", curses.KEY_BACKSPACE):
+            self.input_buffer = self.input_buffer[:-1]
+            self.dirty.add("input")
+        elif key == curses.KEY_PPAGE:
+            self.scroll_chat(self._chat_rows() // 2)
+        elif key == curses.KEY_NPAGE:
+            self.scroll_chat(-(self._chat_rows() // 2))
+        elif key == curses.KEY_END:
+            self.scroll_chat(-self.chat_scroll)
+        elif key == curses.KEY_RESIZE:
+            self.dirty.add("layout")
+        elif isinstance(key, str) and key.isprintable():
+            self.input_buffer += key
+            self.dirty.add("input")
+
+    # --- Comandos ---
+
+    def execute(self, line):
+        """Mesmos comandos do client.py; o resultado vai para a linha de status."""
+        command = line.lower()
+        if command == "sair":
+            self.running = False
+        elif command.startswith("chat "):
+            message = line[5:].strip()
+            if message:
+                self._report(self.run_commands(("chat", message)))
+        elif command == "avancar":
+            self._report(self.run_commands(("advance",)))
+        elif command == "salas":
+            rooms = json.loads(self.game_service.exposed_list_rooms())
+            self.set_status("Salas: " + ", ".join(
+                f"{room['room_id']} ({room['page_id']}, {room['current_players']})" for room in rooms))
+        elif command.startswith("sala "):
+            self.join_room(line[5:].strip())
+        else:
+            # "2!" vota na opção 2 e já tenta avançar, na mesma ida e volta
+            try:
+                choice_index = int(line.rstrip("!")) - 1
+            except ValueError:
+                self.set_status("Comando inválido. Digite um número (com ! para já avançar), "
+                                "'chat <mensagem>', 'salas', 'sala <id>', 'avancar' ou 'sair'.")
+                return
+            if not self.current_page_data or not 0 <= choice_index < len(self.current_page_data["choices"]):
+                self.set_status("Escolha inválida. Digite o número da opção.")
+                return
+            commands = [("vote", choice_index)]
+            if line.endswith("!"):
+                commands.append(("advance",))
+            self._report(self.run_commands(*commands))
+
+    def _report(self, result):
+        success, msg = result
+        if not success:
+            self.set_status(msg)
+
+    def join_room(self, room_id):
+        if not room_id:
+            return
+        success, msg = self.game_service.exposed_join_room(room_id)
+        if success:
+            self._reset_room_state(room_id)
+            self.fetch_round_deadline()
+            self.chat_scroll = 0
+            self.has_older_chat = True
+            self.push_pending = True
+            self.dirty.update(REGIONS)
+        self.set_status(msg)
+
+    def scroll_chat(self, messages):
+        """Rola o chat; passando da mensagem mais antiga, busca a página anterior no servidor."""
+        scroll = max(self.chat_scroll + messages, 0)
+        if scroll >= len(self.chat_messages) and self.has_older_chat and self.chat_first_seq is not None:
+            self.has_older_chat = self.load_older_chat()
+        self.chat_scroll = min(scroll, max(len(self.chat_messages) - 1, 0))
+        self.dirty.update(("chat", "chat_title"))
+
+    # --- Desenho ---
+
+    def _layout(self):
+        """Divide a tela entre as regiões; refeito ao redimensionar e quando a página muda."""
+        self.screen.erase()
+        self.screen.noutrefresh()
+        height, width = self.screen.getmaxyx()
+        page_lines = self._page_lines(width)
+        choices = len(self.current_page_data["choices"]) if self.current_page_data else 0
+        choice_rows = max(choices, 1)
+        fixed = 1 + choice_rows + 1 + 2 # cabeçalho, opções, título do chat, status e digitação
+        page_rows = max(min(len(page_lines), height - fixed - MIN_CHAT_ROWS), 1)
+        chat_rows = max(height - fixed - page_rows, 1)
+
+        top = 0
+        for name, rows in (("header", 1), ("page", page_rows), ("choices", choice_rows),
+                           ("chat_title", 1), ("chat", chat_rows), ("status", 1), ("input", 1)):
+            rows = max(min(rows, height - top), 1)
+            self.windows[name] = curses.newwin(rows, width, min(top, height - 1), 0)
+            top += rows
+        self.windows["chat"].idlok(True) # deixa o terminal rolar as linhas do chat em vez de reescrevê-las
+        self.dirty.update(REGIONS)
+        self.dirty.discard("layout")
+
+    def _render(self):
+        if "layout" in self.dirty:
+            self._layout()
+        for name in REGIONS:
+            if name in self.dirty and name != "input":
+                win = self.windows[name]
+                win.erase()
+                try:
+                    getattr(self, f"_draw_{name}")(win)
+                except curses.error:
+                    pass # a região ficou pequena demais para o texto (terminal minúsculo)
+                win.noutrefresh()
+        # A digitação vai por último para o cursor do terminal ficar nela
+        win = self.windows["input"]
+        if "input" in self.dirty:
+            win.erase()
+            self._draw_input(win)
+        win.noutrefresh()
+        self.dirty.clear()
+        curses.doupdate()
+
+    def _draw_header(self, win):
+        current, total = self.players
+        text = f" Sala: {self.room_id or 'principal'} | Página: {self.current_page_id or '...'} | " \
+               f"{current} jogador(es) conectado(s), {total} no total"
+        if self.shown_seconds is not None:
+            phase, seconds = self.shown_seconds
+            text += f" | {seconds}s para {ROUND_PHASES.get(phase, phase)}"
+        win.bkgd(" ", curses.A_REVERSE)
+        win.addnstr(0, 0, text, win.getmaxyx()[1] - 1)
+
+    def _draw_page(self, win):
+        rows, width = win.getmaxyx()
+        lines = self._page_lines(width)
+        if len(lines) > rows:
+            lines = lines[:rows - 1] + ["(...)"]
+        for row, line in enumerate(lines):
+            win.addnstr(row, 0, line, width - 1)
+
+    def _page_lines(self, width):
+        if not self.current_page_data:
+            return ["Conectando..."]
+        lines = []
+        for paragraph in self.current_page_data["text"].splitlines():
+            lines.extend(textwrap.wrap(paragraph, max(width - 1, 10)) or [""])
+        return lines
+
+    def _draw_choices(self, win):
+        rows, width = win.getmaxyx()
+        if not self.current_page_data:
+            return
+        choices = self.current_page_data["choices"]
+        if not choices:
+            win.addnstr(0, 0, "  Fim da história. Digite 'sala <id>' para jogar outra.", width - 1)
+            return
+        my_vote = self.votes.get(self.username)
+        audience = self.audience if self.audience and self.audience["viewers"] else None
+        for i, choice in enumerate(choices[:rows]):
+            count = self.vote_tally[i] if i < len(self.vote_tally) else 0
+            votes = f" [{count} voto{'s' if count != 1 else ''}"
+            if audience is not None and i < len(audience["tally"]):
+                votes += f" | plateia {100 * audience['tally'][i] // audience['viewers']}%"
+            votes += "]"
+            marker = ">" if my_vote == i else " "
+            text = f"{marker} {i + 1}. {choice['text']}"
+            win.addnstr(i, 0, text, max(width - 1 - len(votes), 0), curses.A_BOLD if my_vote == i else 0)
+            win.addnstr(i, max(width - 1 - len(votes), 0), votes, width - 1)
+
+    def _draw_chat_title(self, win):
+        title = "Chat"
+        if self.chat_scroll:
+            title += f" (+{self.chat_scroll} mais novas, End volta)"
+        else:
+            title += " (PgUp para ver as anteriores)"
+        win.addnstr(0, 0, f"-- {title} " + "-" * win.getmaxyx()[1], win.getmaxyx()[1] - 1)
+
+    def _draw_chat(self, win):
+        """Só as mensagens que cabem no painel, de baixo para cima: não depende do tamanho do histórico."""
+        rows, width = win.getmaxyx()
+        lines = []
+        i = len(self.chat_messages) - 1 - self.chat_scroll
+        while i >= 0 and len(lines) < rows:
+            wrapped = textwrap.wrap(self.chat_messages[i], max(width - 1, 10), subsequent_indent="  ") or [""]
+            lines.extend(reversed(wrapped))
+            i -= 1
+        lines = lines[:rows]
+        for row, line in enumerate(reversed(lines)):
+            attr = curses.A_BOLD if line.startswith("[SISTEMA]") else 0
+            win.addnstr(row, 0, line, width - 1, attr)
+
+    def _draw_status(self, win):
+        if self.status:
+            win.addnstr(0, 0, f"[SISTEMA] {self.status}", win.getmaxyx()[1] - 1, curses.A_BOLD)
+
+    def _draw_input(self, win):
+        width = win.getmaxyx()[1]
+        prompt = f"{self.username}> "
+        visible = self.input_buffer[-max(width - len(prompt) - 1, 1):]
+        try:
+            win.addnstr(0, 0, prompt + visible, width - 1)
+        except curses.error:
+            pass
+
+    def _chat_rows(self):
+        return self.windows["chat"].getmaxyx()[0] if "chat" in self.windows else MIN_CHAT_ROWS
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Uso: python3 tui.py <seu_nome_de_usuario> [sala]")
+        sys.exit(1)
+    if curses is None:
+        print("O curses não está disponível (no Windows, instale o pacote windows-curses) - use o client.py.")
+        sys.exit(1)
+
+    client = CursesGameClient(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    if not client.connect_to_server():
+        sys.exit(1)
+    try:
+        curses.wrapper(client.run)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if client.conn and not client.conn.closed:
+            client.conn.close()
+    if client.disconnected and client.running:
+        print("Desconectado do servidor.")
+
+
+if __name__ == "__main__":
+    main()
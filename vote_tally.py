@@ -0,0 +1,254 @@
+import heapq
+import json
+from collections.abc import Mapping
+from itertools import compress
+
+MAX_CHOICES = 255  # o vetor de votos guarda escolha + 1 num byte (0 = não votou)
+SPARSE_NAMES = 64  # até quantos bits names() percorre um a um em vez de varrer o bitset inteiro
+MINUS_ONE = bytes([0, *range(255)]) # tabela de bytes.translate: escolha + 1 -> escolha
+BIT_BYTES = bytes.maketrans(b"01", b"\x00\x01")
+
+
+class PlayerIds:
+    """
+    Ids inteiros densos dos jogadores (0, 1, 2, ... na ordem em que aparecem
+    na sala). A tabela só cresce, então um id nunca muda de dono: é o índice
+    nos bitsets e no vetor de votos de VoteTally e o id da codificação
+    compacta (wire.py). Leitores sem lock (ver SnapshotVotes) podem consultar
+    a tabela enquanto ela cresce.
+    """
+    def __init__(self):
+        self.ids = {}   # username -> id
+        self.names = [] # id -> username
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self, username):
+        return self.ids.get(username)
+
+    def add(self, username):
+        """Id do jogador, criando um novo se ele ainda não tem."""
+        player_id = self.ids.get(username)
+        if player_id is None:
+            player_id = self.ids[username] = len(self.names)
+            self.names.append(username)
+        return player_id
+
+
+class VoteTally:
+    """
+    Votos, estado "pronto" e contagens do round atual. Cada jogador tem um id
+    denso (PlayerIds); os votos ficam num vetor de bytes indexado pelo id
+    (escolha + 1, 0 = não votou) e cada conjunto (jogadores, ativos, exigidos, votaram, prontos) é um
+    bitset guardado num int. Verificar o quórum e montar a lista de quem
+    falta são operações sobre os bitsets inteiros (&, ~, bit_count), feitas
+    em C, sem percorrer jogador por jogador nem copiar sets.
+
+    Só os jogadores ativos (com alguma conexão na sala) são exigidos para
+    avançar: quem caiu não trava a rodada, e volta a ser exigido ao reconectar.
+
+    Não é thread-safe: usar sempre com o lock do jogo adquirido.
+    """
+    def __init__(self, ids=None, votes=None):
+        self.ids = ids if ids is not None else PlayerIds()
+        self.choices = bytearray(len(self.ids)) # id -> índice da escolha + 1 (0 = não votou)
+        self.counts = {}   # índice da escolha -> número de votos
+        self.num_votes = 0
+        # Bitsets (bit i = jogador de id i)
+        self.players = 0   # todos os jogadores que já entraram
+        self.active = 0    # jogadores com conexão na sala (não vai para o journal)
+        self.required = 0  # players & active: os exigidos para avançar
+        self.voted = 0     # quem votou neste round
+        self.ready = 0     # quem clicou "Avançar" neste round
+        for username, choice_index in (votes or {}).items():
+            self.vote(username, choice_index)
+
+    def _id(self, username):
+        player_id = self.ids.add(username)
+        if player_id >= len(self.choices):
+            self.choices.extend(bytes(player_id + 1 - len(self.choices)))
+        return player_id
+
+    def add_player(self, username):
+        """Registra um jogador (idempotente). Retorna True se ele é novo."""
+        bit = 1 << self._id(username)
+        if self.players & bit:
+            return False
+        self.players |= bit
+        self.required = self.players & self.active
+        return True
+
+    def remove_player(self, username):
+        """O jogador saiu de vez: deixa de ser exigido para avançar (o voto já dado continua valendo)."""
+        bit = 1 << self._id(username)
+        self.players &= ~bit
+        self.required &= ~bit
+
+    def set_active(self, username, active):
+        """O jogador conectou (ou perdeu a última conexão com) a sala."""
+        bit = 1 << self._id(username)
+        if active:
+            self.active |= bit
+        else:
+            self.active &= ~bit
+        self.required = self.players & self.active
+
+    def vote(self, username, choice_index):
+        """Registra (ou troca) o voto de um jogador. Retorna o voto anterior ou None."""
+        if type(choice_index) is not int or not 0 <= choice_index < MAX_CHOICES:
+            raise ValueError(f"Escolha fora do intervalo suportado: {choice_index!r}")
+        player_id = self._id(username)
+        previous = self.choices[player_id] - 1
+        if previous < 0:
+            previous = None
+            self.voted |= 1 << player_id
+            self.num_votes += 1
+        else:
+            self.counts[previous] -= 1
+        self.choices[player_id] = choice_index + 1
+        self.counts[choice_index] = self.counts.get(choice_index, 0) + 1
+        return previous
+
+    def vote_of(self, username):
+        """Escolha em que o jogador votou neste round, ou None."""
+        player_id = self.ids.get(username)
+        if player_id is None or player_id >= len(self.choices) or not self.choices[player_id]:
+            return None
+        return self.choices[player_id] - 1
+
+    def has_voted(self, username):
+        return self.vote_of(username) is not None
+
+    def is_ready(self, username):
+        player_id = self.ids.get(username)
+        return player_id is not None and bool(self.ready >> player_id & 1)
+
+    def set_ready(self, username):
+        self.ready |= 1 << self._id(username)
+
+    def unset_ready(self, username):
+        self.ready &= ~(1 << self._id(username))
+
+    def clear_ready(self):
+        self.ready = 0
+
+    def reset(self):
+        """Zera votos e estado "pronto" para um novo round (empate ou nova página)."""
+        self.choices = bytearray(len(self.choices))
+        self.counts.clear()
+        self.num_votes = 0
+        self.voted = 0
+        self.clear_ready()
+
+    # --- Quórum ---
+
+    @property
+    def waiting_vote(self):
+        """Bitset dos jogadores exigidos que ainda não votaram."""
+        return self.required & ~self.voted
+
+    @property
+    def waiting_ready(self):
+        """Bitset dos jogadores exigidos que ainda não estão prontos."""
+        return self.required & ~self.ready
+
+    def all_voted(self):
+        return not self.waiting_vote
+
+    def all_ready(self):
+        return not self.waiting_ready
+
+    def names(self, bitset):
+        """Usernames dos jogadores de um bitset."""
+        names = self.ids.names
+        if bitset.bit_count() <= SPARSE_NAMES:
+            found = []
+            while bitset:
+                low = bitset & -bitset
+                found.append(names[low.bit_length() - 1])
+                bitset ^= low
+            return found
+        # bin() dá os bits do mais alto para o mais baixo; invertido, o caractere i é o bit do id i
+        return list(compress(names, bin(bitset)[:1:-1].encode("ascii").translate(BIT_BYTES)))
+
+    def num_players(self):
+        return self.players.bit_count()
+
+    def num_required(self):
+        return self.required.bit_count()
+
+    def num_ready(self):
+        return self.ready.bit_count()
+
+    def votes_dict(self):
+        """{username: índice da escolha} de quem votou neste round."""
+        return dict(self.snapshot_votes().items())
+
+    def snapshot_votes(self):
+        """Votos atuais congelados para o GameSnapshot (uma cópia do vetor de bytes)."""
+        return SnapshotVotes(self.ids, bytes(self.choices), self.num_votes)
+
+    def winners(self, extra=None):
+        """
+        Escolhas com mais votos (mais de uma em caso de empate). `extra` soma
+        pontos por escolha aos votos dos jogadores (ex.: a plateia, ver audience.py).
+        """
+        counts = {choice: count for choice, count in self.counts.items() if count > 0}
+        for choice, score in (extra or {}).items():
+            counts[choice] = counts.get(choice, 0) + score
+        if not counts:
+            return []
+        max_votes = max(counts.values())
+        return [choice for choice, count in counts.items() if count == max_votes]
+
+    def tally(self, num_choices):
+        """Lista com o número de votos de cada escolha da página atual."""
+        return [self.counts.get(i, 0) for i in range(num_choices)]
+
+
+class SnapshotVotes(Mapping):
+    """
+    Mapeamento username -> escolha somente leitura, sobre uma cópia do vetor
+    de votos: publicar o snapshot copia só os bytes, em vez de montar um dict
+    com todos os votos a cada voto. O JSON completo é montado na primeira
+    leitura (json()) e guardado.
+    """
+    __slots__ = ("ids", "choices", "size", "_json")
+
+    def __init__(self, ids, choices, size):
+        self.ids = ids         # PlayerIds da sala (só cresce; ids além de len(choices) não votaram)
+        self.choices = choices # bytes: escolha + 1 por id
+        self.size = size
+        self._json = None
+
+    def __getitem__(self, username):
+        player_id = self.ids.get(username)
+        if player_id is None or player_id >= len(self.choices) or not self.choices[player_id]:
+            raise KeyError(username)
+        return self.choices[player_id] - 1
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return compress(self.ids.names, self.choices)
+
+    def items(self):
+        return zip(compress(self.ids.names, self.choices), compress(self.choices.translate(MINUS_ONE), self.choices))
+
+    def values(self):
+        return compress(self.choices.translate(MINUS_ONE), self.choices)
+
+    def json(self):
+        if self._json is None:
+            self._json = json.dumps(dict(self.items()))
+        return self._json
+
+
+def describe_waiting(names, limit=10):
+    """Lista (ordenada) dos nomes de quem está faltando, encurtada quando é muito longa."""
+    text = ", ".join(heapq.nsmallest(limit, names))
+    if len(names) > limit:
+        text += f" e mais {len(names) - limit}"
+    return text
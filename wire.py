@@ -0,0 +1,270 @@
+"""
+Codificação compacta do estado das salas, negociada com o cliente: a mesma
+resposta de get_state_since, mas empacotada com struct em vez de strings
+JSON. Jogadores viram ids inteiros pequenos (a tabela de nomes de cada sala
+é enviada uma vez e depois só cresce) e votos e contagens vão como inteiros;
+o chat, se passa de ZLIB_MIN bytes, vai comprimido com zlib.
+
+Formato (little-endian; "n" é um inteiro sem sinal de tamanho variável, LEB128):
+    cabeçalho   B versão, B flags, n versão da página, do chat e dos votos, n jogadores atuais, n total
+    nomes       I época, n primeiro id, textos                          (flag NAMES)
+    página      texto page_id, texto page_json                          (flag PAGE)
+    chat        n tamanho, corpo (zlib se CHAT_ZLIB):                    (flag CHAT)
+                n first_seq + 1 (0 = nenhum), textos
+    votos       inteiros (contagem por escolha), inteiros (ids), inteiros (escolhas)  (flag VOTES)
+Um texto é n bytes + UTF-8. Listas vão em blocos para decodificar com uma
+chamada a struct: "inteiros" é n quantidade, B largura (código do struct)
+e os valores; "textos" é inteiros (tamanhos em caracteres) + um texto com
+todos concatenados. A época muda a cada GameRoom criada: quando ela não bate
+com a do cliente, a tabela de nomes é reenviada inteira.
+
+Clientes antigos (ou servidores antigos) continuam no JSON: negotiate()
+escolhe a codificação, e decode_json_state() deixa a resposta JSON no mesmo
+formato decodificado de CompactDecoder.decode().
+"""
+import itertools
+import json
+import struct
+import time
+import zlib
+
+ENCODING_JSON = "json"
+ENCODING_COMPACT = "compact1"
+ENCODINGS = (ENCODING_COMPACT, ENCODING_JSON) # em ordem de preferência
+
+VERSION = 1
+ZLIB_MIN = 512 # bytes de chat a partir dos quais vale comprimir
+
+HEADER = struct.Struct("<BB")
+EPOCH = struct.Struct("<I")
+UINT_CODES = ((0xFF, "B"), (0xFFFF, "H"), (0xFFFFFFFF, "I"))
+
+FLAG_NAMES = 1
+FLAG_PAGE = 2
+FLAG_CHAT = 4
+FLAG_CHAT_RESET = 8
+FLAG_CHAT_ZLIB = 16
+FLAG_VOTES = 32
+FLAG_VOTES_RESET = 64
+
+
+def negotiate(root):
+    """Melhor codificação que o servidor (conn.root) e este cliente entendem."""
+    try:
+        offered = tuple(root.get_encodings())
+    except AttributeError:
+        return ENCODING_JSON # servidor sem negociação: só JSON
+    for encoding in ENCODINGS:
+        if encoding in offered:
+            return encoding
+    return ENCODING_JSON
+
+
+# --- Servidor ---
+
+def encode_state(snap, page, chat_entries, chat_reset, votes, votes_reset, epoch, names, names_from, ids):
+    """
+    Resposta compacta de get_state_since a partir das partes que mudaram
+    (ver GameRoom.state_delta). `names` é a tabela de nomes da sala (só
+    cresce), `names_from` quantos nomes o cliente já tem e `ids` o mapa
+    username -> id.
+    """
+    flags = 0
+    out = bytearray(HEADER.size)
+    for value in snap.versions:
+        _pack_uint(out, value)
+    _pack_uint(out, snap.current_players)
+    _pack_uint(out, snap.total_players_ever)
+
+    if names_from < len(names):
+        flags |= FLAG_NAMES
+        out += EPOCH.pack(epoch)
+        _pack_uint(out, names_from)
+        _pack_texts(out, names[names_from:])
+
+    if page:
+        flags |= FLAG_PAGE
+        _pack_text(out, snap.page_id)
+        _pack_text(out, snap.page_json)
+
+    if chat_entries is not None:
+        flags |= FLAG_CHAT
+        if chat_reset:
+            flags |= FLAG_CHAT_RESET
+        body = bytearray()
+        _pack_uint(body, chat_entries[0][0] + 1 if chat_entries else 0)
+        _pack_texts(body, [message for _seq, message, _encoded in chat_entries])
+        if len(body) >= ZLIB_MIN:
+            flags |= FLAG_CHAT_ZLIB
+            body = zlib.compress(body, 6)
+        _pack_uint(out, len(body))
+        out += body
+
+    if votes is not None:
+        flags |= FLAG_VOTES
+        if votes_reset:
+            flags |= FLAG_VOTES_RESET
+        _pack_uints(out, snap.tally)
+        _pack_uints(out, [ids[username] for username in votes])
+        _pack_uints(out, list(votes.values()))
+
+    HEADER.pack_into(out, 0, VERSION, flags)
+    return bytes(out)
+
+
+# --- Cliente ---
+
+class CompactDecoder:
+    """
+    Lado do cliente: guarda a tabela de nomes da sala e decodifica as
+    respostas compactas. Uma instância por sala observada.
+    """
+    def __init__(self):
+        self.epoch = None
+        self.names = []
+
+    def names_state(self):
+        """O que o cliente já sabe da tabela de nomes, para mandar no RPC: (época, quantidade)."""
+        return self.epoch, len(self.names)
+
+    def decode(self, data):
+        """
+        Mesmo retorno de decode_json_state: (versões, page_id, página (dict),
+        chat {"first_seq", "messages", "reset"}, votos {"reset", "votes", "tally"},
+        jogadores atuais, total); o que não mudou vem como None.
+        """
+        version, flags = HEADER.unpack_from(data, 0)
+        if version != VERSION:
+            raise ValueError(f"Versão desconhecida da codificação compacta: {version}")
+        pos = HEADER.size
+        numbers = []
+        for _ in range(5):
+            value, pos = _unpack_uint(data, pos)
+            numbers.append(value)
+        page_v, chat_v, votes_v, current_players, total_players_ever = numbers
+        page_id = page = chat = votes = None
+
+        if flags & FLAG_NAMES:
+            (epoch,) = EPOCH.unpack_from(data, pos)
+            pos += EPOCH.size
+            start, pos = _unpack_uint(data, pos)
+            new_names, pos = _unpack_texts(data, pos)
+            if epoch != self.epoch:
+                self.epoch, self.names = epoch, []
+            self.names[start:] = new_names
+
+        if flags & FLAG_PAGE:
+            page_id, pos = _unpack_text(data, pos)
+            page_json, pos = _unpack_text(data, pos)
+            page = json.loads(page_json)
+
+        if flags & FLAG_CHAT:
+            size, pos = _unpack_uint(data, pos)
+            body = data[pos:pos + size]
+            pos += size
+            if flags & FLAG_CHAT_ZLIB:
+                body = zlib.decompress(body)
+            first_seq, body_pos = _unpack_uint(body, 0)
+            messages, body_pos = _unpack_texts(body, body_pos)
+            chat = {"first_seq": first_seq - 1 if first_seq else None, "messages": messages,
+                    "reset": bool(flags & FLAG_CHAT_RESET)}
+
+        if flags & FLAG_VOTES:
+            tally, pos = _unpack_uints(data, pos)
+            player_ids, pos = _unpack_uints(data, pos)
+            choices, pos = _unpack_uints(data, pos)
+            changed = dict(zip(map(self.names.__getitem__, player_ids), choices))
+            votes = {"reset": bool(flags & FLAG_VOTES_RESET), "votes": changed, "tally": list(tally)}
+
+        return (page_v, chat_v, votes_v), page_id, page, chat, votes, current_players, total_players_ever
+
+
+def decode_json_state(delta):
+    """Resposta JSON de get_state_since no mesmo formato de CompactDecoder.decode."""
+    versions, page_id, page_json, chat_json, votes_json, current_players, total_players_ever = delta
+    return (tuple(versions), page_id,
+            json.loads(page_json) if page_json is not None else None,
+            json.loads(chat_json) if chat_json is not None else None,
+            json.loads(votes_json) if votes_json is not None else None,
+            current_players, total_players_ever)
+
+
+def decode_round_deadline(round_json):
+    """
+    Push on_round_update (ou get_round_deadline) -> (fase, instante em
+    time.monotonic() em que o prazo vence), ou None sem prazo armado.
+    """
+    round_info = json.loads(round_json)
+    if round_info["phase"] is None:
+        return None
+    return round_info["phase"], time.monotonic() + round_info["remaining"]
+
+
+# --- Primitivas ---
+
+def _pack_uint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _unpack_uint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+# surrogatepass: o JSON do gateway aceita surrogates soltos ("\ud800") e eles
+# podem chegar ao chat; sem isso, uma mensagem assim quebraria a codificação
+# do estado para todos os clientes compactos da sala
+def _pack_text(out, text):
+    encoded = text.encode("utf-8", "surrogatepass")
+    _pack_uint(out, len(encoded))
+    out += encoded
+
+
+def _unpack_text(data, pos):
+    size, pos = _unpack_uint(data, pos)
+    return str(data[pos:pos + size], "utf-8", "surrogatepass"), pos + size
+
+
+def _pack_uints(out, values):
+    _pack_uint(out, len(values))
+    if not values:
+        return
+    top = max(values)
+    code = next((code for limit, code in UINT_CODES if top <= limit), "Q")
+    out += code.encode("ascii")
+    out += struct.pack(f"<{len(values)}{code}", *values)
+
+
+def _unpack_uints(data, pos):
+    count, pos = _unpack_uint(data, pos)
+    if not count:
+        return (), pos
+    code = chr(data[pos])
+    values = struct.unpack_from(f"<{count}{code}", data, pos + 1)
+    return values, pos + 1 + struct.calcsize(f"<{count}{code}")
+
+
+def _pack_texts(out, texts):
+    """Tamanhos (em caracteres) num bloco e os textos concatenados num só texto UTF-8."""
+    _pack_uints(out, [len(text) for text in texts])
+    _pack_text(out, "".join(texts))
+
+
+def _unpack_texts(data, pos):
+    sizes, pos = _unpack_uints(data, pos)
+    joined, pos = _unpack_text(data, pos)
+    texts = []
+    start = 0
+    for end in itertools.accumulate(sizes):
+        texts.append(joined[start:end])
+        start = end
+    return texts, pos